@@ -0,0 +1,94 @@
+"""Moves received items and past events into the archived_* tables.
+
+Received items go with their bookings and event memberships; events whose
+date is more than ARCHIVE_EVENTS_AFTER_DAYS in the past go with their
+event_items and collaborators. Both leave the friends feed. Work happens in
+batches of ARCHIVE_BATCH_SIZE rows, each its own write transaction through
+database.run_write, so the writer is never held for long. main.py runs this
+every ARCHIVE_INTERVAL_SECONDS; run it once with `python archive.py`.
+"""
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, select
+
+import crud, models, stats
+from database import run_write
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_EVENTS_AFTER_DAYS = int(os.getenv("ARCHIVE_EVENTS_AFTER_DAYS", "7"))
+ARCHIVE_INTERVAL_SECONDS = int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600")) # 0 disables the background job
+
+
+def _move(db, source, target, where):
+    """INSERT ... SELECT the matching rows into the archive table, then delete them."""
+    source, target = source.__table__, target.__table__
+    columns = [column.name for column in target.columns if column.name in source.columns]
+    db.execute(insert(target).from_select(columns, select(*(source.c[name] for name in columns)).where(where)))
+    db.execute(delete(source).where(where))
+
+
+def archive_items_batch(db, limit):
+    item_ids = db.scalars(
+        select(models.Item.id).where(models.Item.status == models.StatusEnum.received).limit(limit)
+    ).all()
+    if not item_ids:
+        return 0
+    user_ids = db.scalars(select(models.Item.user_id).where(models.Item.id.in_(item_ids)).distinct()).all()
+    event_ids = db.scalars(
+        select(models.EventItem.event_id).where(models.EventItem.item_id.in_(item_ids)).distinct()
+    ).all()
+
+    crud.touch_users(db, user_ids)
+    crud.touch_events(db, event_ids)
+    crud.drop_activities(db, models.Activity.item_id.in_(item_ids))
+    _move(db, models.Booking, models.ArchivedBooking, models.Booking.item_id.in_(item_ids))
+    _move(db, models.EventItem, models.ArchivedEventItem, models.EventItem.item_id.in_(item_ids))
+    _move(db, models.Item, models.ArchivedItem, models.Item.id.in_(item_ids))
+    # The aggregates only describe hot rows
+    stats.recount_item_stats(db.connection(), user_ids)
+    stats.recount_event_stats(db.connection(), event_ids)
+    return len(item_ids)
+
+
+def archive_events_batch(db, before, limit):
+    event_ids = db.scalars(
+        select(models.Event.id).where(models.Event.date < before).order_by(models.Event.date).limit(limit)
+    ).all()
+    if not event_ids:
+        return 0
+
+    crud.touch_events(db, event_ids)
+    crud.drop_activities(db, models.Activity.event_id.in_(event_ids))
+    _move(db, models.EventItem, models.ArchivedEventItem, models.EventItem.event_id.in_(event_ids))
+    _move(db, models.EventCollaborator, models.ArchivedEventCollaborator,
+          models.EventCollaborator.event_id.in_(event_ids))
+    _move(db, models.Event, models.ArchivedEvent, models.Event.id.in_(event_ids))
+    db.execute(delete(models.EventStats.__table__).where(models.EventStats.event_id.in_(event_ids)))
+    return len(event_ids)
+
+
+def run_once(batch_size=ARCHIVE_BATCH_SIZE, write=run_write):
+    """Archive everything that is due, one batch per transaction. Returns the counts moved."""
+    before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=ARCHIVE_EVENTS_AFTER_DAYS)
+    moved = {"items": 0, "events": 0}
+    for kind, batch in (
+        ("items", lambda db: archive_items_batch(db, batch_size)),
+        ("events", lambda db: archive_events_batch(db, before, batch_size)),
+    ):
+        while True:
+            count = write(batch)
+            moved[kind] += count
+            if count < batch_size:
+                break
+    if moved["items"] or moved["events"]:
+        logger.info(f"Archived {moved['items']} items and {moved['events']} events")
+    return moved
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_once()
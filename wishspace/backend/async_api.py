@@ -0,0 +1,165 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models, schemas, crud, async_crud, event_views
+from auth import oauth2_scheme, credentials_exception, decode_user_id, get_current_user_id
+from database import AsyncReadSessionLocal, run_write_async
+from services.etags import not_modified, request_variant
+from services.fields import projection, sparse_fields
+from services.serialize import dumps, json_response
+
+# Async versions of the hot routes in main.py, used when DB_ASYNC=true.
+# main.py includes this router ahead of its own, so these handlers take
+# precedence for the same paths; everything else stays on the sync path.
+router = APIRouter()
+
+async def get_async_db():
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+async def get_current_user(db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme)):
+    user = await async_crud.get_principal(db, decode_user_id(token))
+    if user is None:
+        raise credentials_exception()
+    return user
+
+# ?fields= / ?view= projections of the list endpoints (see crud.event_view_queries)
+item_fields = sparse_fields(crud.ITEM_FIELDS)
+event_fields = projection(crud.EVENT_FIELDS, {"full": crud.EVENT_VIEW_FIELDS, "summary": crud.EVENT_SUMMARY_FIELDS})
+
+async def conditional_get(request: Request, response: Response, db: AsyncSession, viewer_id: int, *keys):
+    etag = await async_crud.get_etag(db, list(keys), request_variant(request, viewer_id))
+    return not_modified(request, response, etag)
+
+# --- Users ---
+@router.get("/api/users/me")
+async def read_users_me(current_user: models.User = Depends(get_current_user)):
+    return current_user
+
+# --- Items ---
+@router.post("/api/items/manual", response_model=schemas.Item)
+async def create_item_manual(item: schemas.ItemCreate, current_user_id: int = Depends(get_current_user_id)):
+    return await run_write_async(crud.create_item, item=item, user_id=current_user_id)
+
+@router.get("/api/items", response_model=List[schemas.Item])
+async def read_items(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), skip: int = 0, limit: int = 100, fields=Depends(item_fields), db: AsyncSession = Depends(get_async_db)):
+    cached = await conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    return json_response(dumps(await async_crud.rows(db, crud.item_rows_query(current_user_id, skip, limit, fields or crud.ITEM_FIELDS))), response)
+
+def _owned_item(db, item_id, user_id):
+    db_item = crud.get_item(db, item_id)
+    if not db_item or db_item.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Item not found or not owned by user")
+    return db_item
+
+@router.put("/api/items/{item_id}", response_model=schemas.Item)
+async def update_item(item_id: int, item: schemas.ItemUpdate, current_user_id: int = Depends(get_current_user_id)):
+    def _update(db):
+        _owned_item(db, item_id, current_user_id)
+        return crud.update_item(db, item_id, item)
+    return await run_write_async(_update)
+
+@router.delete("/api/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_item(item_id: int, current_user_id: int = Depends(get_current_user_id)):
+    def _delete(db):
+        _owned_item(db, item_id, current_user_id)
+        crud.delete_item(db, item_id)
+    await run_write_async(_delete)
+
+# --- Events ---
+def _owned_event(db, event_id, user_id):
+    db_event = crud.get_event(db, event_id)
+    if not db_event or db_event.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Event not found or not owned by user")
+    return db_event
+
+@router.post("/api/events", response_model=schemas.Event)
+async def create_event_for_user(event: schemas.EventCreate, current_user_id: int = Depends(get_current_user_id)):
+    return await run_write_async(crud.create_event, event=event, user_id=current_user_id)
+
+@router.get("/api/events/{event_id}", response_model=schemas.EventView)
+async def read_event(event_id: int, request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), fields=Depends(event_fields), db: AsyncSession = Depends(get_async_db)):
+    generation = crud.event_view_generation()
+    cached = await conditional_get(request, response, db, current_user_id, ("event", event_id), ("user", current_user_id))
+    if cached:
+        return cached
+    body = await event_views.render_event_async(db, event_id, current_user_id, generation, fields)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return json_response(body, response)
+
+@router.get("/api/users/{user_id}/events", response_model=List[schemas.EventView])
+async def read_user_events(user_id: int, request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), fields=Depends(event_fields), db: AsyncSession = Depends(get_async_db)):
+    generation = crud.event_view_generation()
+    cached = await conditional_get(request, response, db, current_user_id, ("user", user_id))
+    if cached:
+        return cached
+    body = await event_views.render_user_events_async(db, user_id, current_user_id, generation, fields)
+    if body is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return json_response(body, response)
+
+@router.put("/api/events/{event_id}", response_model=schemas.Event)
+async def update_event(event_id: int, event: schemas.EventCreate, current_user_id: int = Depends(get_current_user_id)):
+    def _update(db):
+        _owned_event(db, event_id, current_user_id)
+        return crud.update_event(db, event_id, event)
+    return await run_write_async(_update)
+
+@router.delete("/api/events/{event_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_event(event_id: int, current_user_id: int = Depends(get_current_user_id)):
+    def _delete(db):
+        _owned_event(db, event_id, current_user_id)
+        crud.delete_event(db, event_id)
+    await run_write_async(_delete)
+
+@router.post("/api/events/{event_id}/items")
+async def add_item_to_event_route(event_id: int, request: schemas.EventItemRequest, current_user_id: int = Depends(get_current_user_id)):
+    result = await run_write_async(crud.add_own_item_to_event, current_user_id, event_id, request.item_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Event or Item not found or not owned by user")
+    return {"message": "Item added to event successfully"}
+
+@router.get("/api/shared-events", response_model=List[schemas.EventView])
+async def get_shared_events(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), fields=Depends(event_fields), db: AsyncSession = Depends(get_async_db)):
+    cached = await conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    views = await async_crud.get_event_views(db, crud.shared_event_ids(current_user_id), current_user_id, fields or crud.EVENT_VIEW_FIELDS)
+    return json_response(dumps(views), response)
+
+# --- Bookings ---
+@router.post("/api/items/{item_id}/book", response_model=schemas.Booking)
+async def book_item(item_id: int, current_user_id: int = Depends(get_current_user_id)):
+    booking = await run_write_async(crud.create_booking, item_id=item_id, user_id=current_user_id)
+    if booking is None:
+        raise HTTPException(status_code=400, detail="Item is already booked or does not exist.")
+    return booking
+
+# --- Friends ---
+@router.post("/api/friends", response_model=schemas.Friend)
+async def add_friend(request: schemas.FriendAdd, current_user_id: int = Depends(get_current_user_id)):
+    friend = await run_write_async(crud.add_friend, user_id=current_user_id, friend_phone=request.phone)
+    if friend is None:
+        raise HTTPException(status_code=404, detail="User with this phone number not found, or you tried to add yourself.")
+    return friend
+
+@router.get("/api/friends", response_model=List[schemas.Friend])
+async def get_friends(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_async_db)):
+    cached = await conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    return json_response(dumps(await async_crud.rows(db, crud.friend_rows_query(current_user_id))), response)
+
+@router.get("/api/feed", response_model=schemas.Feed)
+async def read_feed(response: Response, before: Optional[int] = None, limit: int = Query(crud.FEED_PAGE_SIZE, ge=1, le=100), current_user_id: int = Depends(get_current_user_id), db: AsyncSession = Depends(get_async_db)):
+    entries = await async_crud.rows(db, crud.feed_rows_query(current_user_id, before, limit))
+    return json_response(dumps(crud.feed_page(entries, limit)), response)
+
+@router.delete("/api/friends/{friend_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_friend(friend_id: int, current_user_id: int = Depends(get_current_user_id)):
+    await run_write_async(crud.delete_friend, user_id=current_user_id, friend_id=friend_id)
@@ -0,0 +1,35 @@
+from sqlalchemy import select, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud, models
+from services.etags import make_etag, versions_query
+
+# Async counterparts of the read functions in crud.py. Lazy loading is not
+# available on an AsyncSession, so responses are built from the row queries
+# crud shares (see crud.item_rows_query). Writes reuse the sync crud
+# functions through database.run_write_async.
+
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
+
+async def get_etag(db: AsyncSession, keys, variant: str) -> str:
+    return make_etag((await db.execute(versions_query(keys))).all(), keys, variant)
+
+async def get_principal(db: AsyncSession, user_id: int):
+    user = crud.principal_cache.get(user_id)
+    if user is None:
+        user = await get_user(db, user_id)
+        if user is not None:
+            db.expunge(user)
+            crud.principal_cache.set(user_id, user)
+    return user
+
+async def rows(db: AsyncSession, query):
+    return [dict(row) for row in (await db.execute(query)).mappings()]
+
+async def get_event_views(db: AsyncSession, event_ids, viewer_id: int, fields=crud.EVENT_VIEW_FIELDS):
+    results = {name: await rows(db, query) for name, query in crud.event_view_queries(event_ids, fields).items()}
+    return crud.assemble_event_views(results, viewer_id, fields)
+
+async def user_exists(db: AsyncSession, user_id: int) -> bool:
+    return (await db.execute(select(exists().where(models.User.id == user_id)))).scalar()
@@ -0,0 +1,86 @@
+import hashlib
+import hmac
+import os
+import secrets
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt
+
+# --- JWT Configuration ---
+SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-jwt-key") # TODO: Use a strong, random key in production
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+# Telegram initData older than this is rejected (its auth_date, in seconds)
+INIT_DATA_MAX_AGE_SECONDS = int(os.getenv("INIT_DATA_MAX_AGE_SECONDS", "86400"))
+
+# Shared secret for the /api/admin endpoints; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/telegram")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/telegram", auto_error=False)
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=15)
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+def new_refresh_token() -> str:
+    return secrets.token_urlsafe(32)
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+@lru_cache(maxsize=4)
+def telegram_secret_key(bot_token: str) -> bytes:
+    """HMAC key for initData hashes, derived from the bot token once."""
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+def credentials_exception():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def decode_user_id(token: str) -> int:
+    """Return the user id from an access token, or raise 401."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user_id = payload.get("sub")
+        if user_id is None:
+            raise credentials_exception()
+        return int(user_id)
+    except (JWTError, ValueError):
+        raise credentials_exception()
+
+def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    """Claims-only principal: the user id from a valid token, without a database read.
+
+    For endpoints that only scope their queries by the caller's id; a token
+    stays valid for its lifetime even if the user row is gone.
+    """
+    return decode_user_id(token)
+
+def get_stream_user_id(token: Optional[str] = Depends(optional_oauth2_scheme), access_token: Optional[str] = None) -> int:
+    """get_current_user_id that also takes ?access_token=, for EventSource
+    clients, which cannot set headers."""
+    if not (token or access_token):
+        raise credentials_exception()
+    return decode_user_id(token or access_token)
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependency for admin endpoints: the X-Admin-Token header must match ADMIN_TOKEN."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
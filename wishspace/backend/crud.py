@@ -1,7 +1,34 @@
-from sqlalchemy.orm import Session, aliased
-from sqlalchemy import exists, or_
+import logging
+import os
+import re
+import secrets
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from sqlalchemy.orm import Session, aliased, selectinload
+from sqlalchemy import bindparam, delete, exists, insert, null, or_, and_, select, update, union, literal, literal_column, func, Integer
+from sqlalchemy.dialects import postgresql, sqlite
 
 import models, schemas
+from auth import REFRESH_TOKEN_EXPIRE_DAYS, hash_refresh_token, new_refresh_token
+from database import after_commit
+from services.cache import LRUCache
+from services.etags import make_etag, versions_query
+from services.pubsub import make_broker
+
+logger = logging.getLogger(__name__)
+
+# CRUD functions only flush: the transaction belongs to the caller (see
+# database.run_write), which commits once per request. Primary keys and
+# server defaults come back from the flush, so nothing is refreshed.
+# Returned objects are used after the session closes, so anything the
+# response needs is loaded here.
+
+def _insert(db: Session, model):
+    """INSERT statement of the session's dialect, for ON CONFLICT upserts."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
 
 # User CRUD
 def get_user_by_telegram_id(db: Session, telegram_id: int):
@@ -19,6 +46,48 @@ def normalize_phone(phone: str) -> str:
         normalized = '+' + normalized
     return normalized
 
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = {"fbclid", "gclid", "yclid", "ysclid", "_openstat", "mc_cid", "mc_eid"}
+
+def canonicalize_link(link: str) -> str:
+    """Canonical form of a product link, so the same product shared twice compares equal"""
+    if not link:
+        return link
+    parts = urlsplit(link.strip())
+    if not parts.netloc:
+        return link.strip()
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_")
+    )
+    # http/https, "www.", the fragment and a trailing slash do not change the product
+    return urlunsplit(("https", host, parts.path.rstrip("/"), urlencode(query), ""))
+
+# user_id -> detached User for authenticated requests; dropped after any
+# committed change to the user, the TTL bounds what a racing reload can keep
+principal_cache = LRUCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60")),
+)
+
+def get_principal(db: Session, user_id: int):
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = db.get(models.User, user_id)
+        if user is not None:
+            # Shared between requests, so it must not belong to this session
+            db.expunge(user)
+            principal_cache.set(user_id, user)
+    return user
+
+def invalidate_principal(db: Session, user_id: int):
+    after_commit(db, lambda: principal_cache.pop(user_id))
+
 def get_user_by_phone(db: Session, phone: str):
     print(f"DEBUG: get_user_by_phone called for phone: {phone}")
     normalized_phone = normalize_phone(phone)
@@ -51,8 +120,7 @@ def create_user(db: Session, user: schemas.UserCreate):
         avatar_url=user.avatar_url
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    db.flush()
     print(f"DEBUG: User created: {db_user.id}, phone: {db_user.phone}")
     return db_user
 
@@ -66,8 +134,9 @@ def get_or_create_user(db: Session, user: schemas.UserCreate):
             normalized_phone = normalize_phone(user.phone)
             print(f"DEBUG: Updating phone for user {db_user.id} to {normalized_phone}")
             db_user.phone = normalized_phone
-            db.commit()
-            db.refresh(db_user)
+            db.flush()
+            invalidate_principal(db, db_user.id)
+            touch_profile(db, db_user.id)
         return db_user
     print(f"DEBUG: User {user.telegram_id} not found, creating new.")
     return create_user(db, user)
@@ -79,125 +148,867 @@ def update_user_phone(db: Session, user_id: int, phone: str):
     normalized_phone = normalize_phone(phone)
     print(f"DEBUG: Updating user {user_id} phone to normalized: {normalized_phone}")
     db_user.phone = normalized_phone
-    db.commit()
-    db.refresh(db_user)
+    db.flush()
+    invalidate_principal(db, user_id)
+    touch_profile(db, user_id)
     return db_user
 
+# Refresh tokens
+def issue_refresh_token(db: Session, user_id: int, family_id: str = None) -> str:
+    """Store a new refresh token for the user and return it; a new family unless given."""
+    token = new_refresh_token()
+    db.add(models.RefreshToken(
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or secrets.token_hex(16),
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    db.flush()
+    return token
+
+def revoke_refresh_family(db: Session, family_id: str):
+    db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.family_id == family_id, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+
+def rotate_refresh_token(db: Session, token: str):
+    """Exchange a refresh token for (user_id, next token), or None if it is not valid.
+
+    A token presented a second time was leaked or replayed, so its whole
+    family is revoked and the holder has to authenticate with Telegram again.
+    """
+    now = datetime.utcnow()
+    db_token = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == hash_refresh_token(token)
+    ).first()
+    if not db_token or db_token.revoked_at is not None or db_token.expires_at <= now:
+        return None
+    # Conditional update, so of two concurrent exchanges only one wins
+    claimed = db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.id == db_token.id, models.RefreshToken.used_at.is_(None))
+        .values(used_at=now)
+    ).rowcount
+    if not claimed:
+        logger.warning("Refresh token reused for user %s, revoking family %s", db_token.user_id, db_token.family_id)
+        revoke_refresh_family(db, db_token.family_id)
+        return None
+    return db_token.user_id, issue_refresh_token(db, db_token.user_id, db_token.family_id)
+
+def revoke_refresh_token(db: Session, token: str) -> bool:
+    """Log out: revoke the family of the given refresh token."""
+    db_token = db.query(models.RefreshToken).filter(
+        models.RefreshToken.token_hash == hash_refresh_token(token)
+    ).first()
+    if not db_token:
+        return False
+    revoke_refresh_family(db, db_token.family_id)
+    return True
+
 # Category CRUD
+
+# user_id -> {category name: category id}. Entries are only added once the
+# transaction that resolved them has committed; the maps are replaced, never
+# mutated, so readers can use them without the cache lock.
+category_cache = LRUCache(maxsize=int(os.getenv("CATEGORY_CACHE_USERS", "10000")))
+
+def _remember_category(user_id: int, name: str, category_id: int):
+    categories = category_cache.get(user_id) or {}
+    category_cache.set(user_id, {**categories, name: category_id})
+
 def get_or_create_category(db: Session, category_name: str, user_id: int):
-    db_category = db.query(models.Category).filter(models.Category.name == category_name, models.Category.user_id == user_id).first()
-    if db_category:
-        return db_category
-    db_category = models.Category(name=category_name, user_id=user_id)
-    db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    # Single-statement upsert on (user_id, name); the no-op update makes
+    # RETURNING yield the existing row on conflict as well.
+    stmt = _insert(db, models.Category).values(name=category_name, user_id=user_id)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "name"], set_={"name": stmt.excluded.name}
+    ).returning(models.Category)
+    db_category = db.scalars(stmt).one()
+    after_commit(db, lambda: _remember_category(user_id, category_name, db_category.id))
     return db_category
 
+def get_category_id(db: Session, category_name: str, user_id: int) -> int:
+    # Common case: answered from the cache without touching the database
+    category_id = (category_cache.get(user_id) or {}).get(category_name)
+    if category_id is None:
+        category_id = get_or_create_category(db, category_name, user_id).id
+    return category_id
+
+# Aggregates
+# item_stats and event_stats are adjusted by deltas in the same transaction
+# as the change they describe; stats.py can check and rebuild them.
+
+def _stats_key(db_item):
+    return (
+        db_item.user_id,
+        db_item.category_id or models.NO_CATEGORY,
+        db_item.status or models.StatusEnum.favorite,
+        db_item.price or 0,
+    )
+
+def _add_item_stats(db: Session, user_id: int, category_id: int, status, item_count: int, price_total: float):
+    stmt = _insert(db, models.ItemStats).values(
+        user_id=user_id, category_id=category_id, status=status,
+        item_count=item_count, price_total=price_total,
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "category_id", "status"],
+        set_={
+            "item_count": models.ItemStats.item_count + stmt.excluded.item_count,
+            "price_total": models.ItemStats.price_total + stmt.excluded.price_total,
+        },
+    ))
+
+def _count_item(db: Session, key, sign: int):
+    """Add (sign=1) or remove (sign=-1) one item from its user/category/status counters"""
+    user_id, category_id, status, price = key
+    _add_item_stats(db, user_id, category_id, status, sign, sign * price)
+
+def _recount_item(db: Session, db_item, before):
+    after = _stats_key(db_item)
+    if after != before:
+        _count_item(db, before, -1)
+        _count_item(db, after, 1)
+
+def _bump_event_stats(db: Session, item_id: int, **deltas):
+    """Apply counter deltas to the stats of every event the item is on"""
+    events = select(models.EventItem.event_id).where(models.EventItem.item_id == item_id)
+    db.execute(
+        update(models.EventStats).where(models.EventStats.event_id.in_(events)).values({
+            getattr(models.EventStats, name): getattr(models.EventStats, name) + delta
+            for name, delta in deltas.items()
+        }),
+        execution_options={"synchronize_session": False},
+    )
+
+def get_user_summary(db: Session, user_id: int):
+    """Wishlist totals from the aggregate tables, without reading items"""
+    category_rows = db.query(models.ItemStats, models.Category.name).outerjoin(
+        models.Category, models.Category.id == models.ItemStats.category_id
+    ).filter(models.ItemStats.user_id == user_id, models.ItemStats.item_count != 0).all()
+    event_rows = db.query(models.Event, models.EventStats).outerjoin(
+        models.EventStats, models.EventStats.event_id == models.Event.id
+    ).filter(models.Event.user_id == user_id).all()
+
+    categories = {}
+    status_counts = {status.value: 0 for status in models.StatusEnum}
+    for stats, name in category_rows:
+        category_id = None if stats.category_id == models.NO_CATEGORY else stats.category_id
+        category = categories.setdefault(category_id, {
+            "category_id": category_id, "name": name, "item_count": 0, "price_total": 0.0,
+        })
+        category["item_count"] += stats.item_count
+        category["price_total"] += stats.price_total
+        status_counts[stats.status.value] += stats.item_count
+    return {
+        "item_count": sum(c["item_count"] for c in categories.values()),
+        "price_total": sum(c["price_total"] for c in categories.values()),
+        "status_counts": status_counts,
+        "categories": list(categories.values()),
+        "events": [
+            {
+                "event_id": event.id,
+                "title": event.title,
+                "item_count": stats.item_count if stats else 0,
+                "price_total": stats.price_total if stats else 0.0,
+                "booked_count": stats.booked_count if stats else 0,
+            }
+            for event, stats in event_rows
+        ],
+    }
+
+# Versions
+# ETag counters (models.Version), bumped alongside every change a GET
+# response can show. An event change reaches its owner and collaborators,
+# whose event lists include it; a profile change reaches everyone whose
+# friends or events show the user.
+
+def _bump_versions(db: Session, scope: str, ids):
+    ids = sorted({id for id in ids if id is not None})
+    if not ids:
+        return
+    stmt = _insert(db, models.Version).values([{"scope": scope, "id": id, "version": 1} for id in ids])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["scope", "id"], set_={"version": models.Version.version + 1}
+    ))
+
+def touch_users(db: Session, user_ids):
+    _bump_versions(db, "user", user_ids)
+
+def touch_events(db: Session, event_ids):
+    event_ids = list(event_ids)
+    if not event_ids:
+        return
+    _bump_versions(db, "event", event_ids)
+    owner_ids = db.scalars(select(models.Event.user_id).where(models.Event.id.in_(event_ids))).all()
+    touch_users(db, [*owner_ids, *db.scalars(
+        select(models.EventCollaborator.user_id).where(models.EventCollaborator.event_id.in_(event_ids))
+    ).all()])
+    invalidate_event_views(db, event_ids, owner_ids)
+
+def touch_profile(db: Session, user_id: int):
+    """The user's own fields: also their friends' lists and the events they collaborate on"""
+    touch_users(db, [user_id, *db.scalars(select(models.Friend.user_id).where(models.Friend.friend_id == user_id)).all()])
+    touch_events(db, db.scalars(
+        select(models.EventCollaborator.event_id).where(models.EventCollaborator.user_id == user_id)
+    ).all())
+
+def touch_item(db: Session, item_id: int, user_id: int):
+    """The item's owner and every event the item is on; returns the event ids"""
+    touch_users(db, [user_id])
+    event_ids = db.scalars(select(models.EventItem.event_id).where(models.EventItem.item_id == item_id)).all()
+    touch_events(db, event_ids)
+    return event_ids
+
+def get_etag(db: Session, keys, variant: str) -> str:
+    return make_etag(db.execute(versions_query(keys)).all(), keys, variant)
+
+# Rendered event views (see event_views.py), shared by all viewers of a
+# class: ("event", event id, viewer class, view) and ("user_events", owner
+# id, viewer class, view) -> JSON bytes, ("event_owner", event id) -> owner id. Dropped once
+# a touch_events or create_event transaction commits. A render only fills
+# the cache if no invalidation ran since it started reading, so a snapshot
+# older than the last commit is never stored.
+event_view_cache = LRUCache(
+    maxsize=int(os.getenv("EVENT_VIEW_CACHE_SIZE", "5000")),
+    ttl=float(os.getenv("EVENT_VIEW_CACHE_TTL_SECONDS", "300")),
+)
+VIEWER_CLASSES = ("owner", "guest") # bookings are hidden from the owner
+CACHED_VIEWS = ("full", "summary")
+_event_view_generation = [0]
+
+def viewer_class(owner_id: int, viewer_id: int) -> str:
+    return "owner" if owner_id == viewer_id else "guest"
+
+def event_view_generation() -> int:
+    """Take before the read session's first query, pass to remember_event_view."""
+    return _event_view_generation[0]
+
+def remember_event_view(key, value, generation: int):
+    if generation == _event_view_generation[0]:
+        event_view_cache.set(key, value)
+
+def invalidate_event_views(db: Session, event_ids, owner_ids):
+    def _drop():
+        _event_view_generation[0] += 1
+        for event_id in event_ids:
+            event_view_cache.pop(("event_owner", event_id))
+            for cls in VIEWER_CLASSES:
+                for view in CACHED_VIEWS:
+                    event_view_cache.pop(("event", event_id, cls, view))
+        for owner_id in owner_ids:
+            for cls in VIEWER_CLASSES:
+                for view in CACHED_VIEWS:
+                    event_view_cache.pop(("user_events", owner_id, cls, view))
+    after_commit(db, _drop)
+
+# Server push (see push.py): small deltas about an event, published once the
+# change commits. Every viewer of an event subscribes to "event:<id>",
+# guests also to "event:<id>:guest", which carries bookings the owner must
+# not see. "user:<id>" tells a user about events they were added to or
+# removed from. PUBSUB_URL (redis://...) shares messages across workers.
+event_broker = make_broker(os.getenv("PUBSUB_URL"))
+
+def event_channel(event_id: int, viewer_class: str = None) -> str:
+    return f"event:{event_id}:guest" if viewer_class == "guest" else f"event:{event_id}"
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+def publish(db: Session, channel: str, message: dict):
+    after_commit(db, lambda: event_broker.publish(channel, message))
+
+def publish_events(db: Session, event_ids, type: str, viewer_class: str = None, **fields):
+    for event_id in event_ids:
+        publish(db, event_channel(event_id, viewer_class), {"type": type, "event_id": event_id, **fields})
+
+def _item_delta(db_item) -> dict:
+    return schemas.Item.model_validate(db_item).model_dump(mode="json")
+
+def visible_event_owners(db: Session, event_ids, user_id: int) -> dict:
+    """{event id: owner id} for the events in `event_ids` the user can see (see can_view_event)"""
+    return dict(db.execute(select(models.Event.id, models.Event.user_id).where(
+        models.Event.id.in_(list(event_ids)),
+        or_(
+            models.Event.user_id == user_id,
+            exists().where(models.EventCollaborator.event_id == models.Event.id, models.EventCollaborator.user_id == user_id),
+            exists().where(models.Friend.user_id == models.Event.user_id, models.Friend.friend_id == user_id),
+        ),
+    )).all())
+
 # Item CRUD
 def create_item(db: Session, item: schemas.ItemCreate, user_id: int):
-    category = get_or_create_category(db, item.category_name, user_id)
     db_item = models.Item(
         **item.dict(exclude={"category_name"}), 
         user_id=user_id, 
-        category_id=category.id
+        category_id=get_category_id(db, item.category_name, user_id),
+        canonical_link=canonicalize_link(item.link),
     )
     db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+    db.flush()
+    _count_item(db, _stats_key(db_item), 1)
+    touch_users(db, [user_id])
     return db_item
 
+def import_items(db: Session, items, user_id: int):
+    """Bulk create for imports: one flush for the whole chunk and one stats
+    upsert per category/status. Links the user already has are skipped.
+    Returns (created, skipped)."""
+    canonical_links = [canonicalize_link(item.link) for item in items]
+    wanted = {link for link in canonical_links if link}
+    seen = set(db.scalars(select(models.Item.canonical_link).where(
+        models.Item.user_id == user_id, models.Item.canonical_link.in_(wanted)
+    ))) if wanted else set()
+
+    category_ids, db_items = {}, []
+    for item, canonical_link in zip(items, canonical_links):
+        if canonical_link:
+            if canonical_link in seen:
+                continue
+            seen.add(canonical_link)
+        if item.category_name not in category_ids:
+            category_ids[item.category_name] = get_category_id(db, item.category_name, user_id)
+        db_items.append(models.Item(
+            **item.dict(exclude={"category_name"}),
+            user_id=user_id,
+            category_id=category_ids[item.category_name],
+            canonical_link=canonical_link,
+        ))
+    db.add_all(db_items)
+    db.flush()
+
+    totals = {}
+    for db_item in db_items:
+        _, category_id, status, price = _stats_key(db_item)
+        count, price_total = totals.get((category_id, status), (0, 0))
+        totals[(category_id, status)] = (count + 1, price_total + price)
+    for (category_id, status), (count, price_total) in totals.items():
+        _add_item_stats(db, user_id, category_id, status, count, price_total)
+    if db_items:
+        touch_users(db, [user_id])
+    return len(db_items), len(items) - len(db_items)
+
 def get_items_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100):
     return db.query(models.Item).filter(models.Item.user_id == user_id).offset(skip).limit(limit).all()
 
+# Fast read path for list responses: only the columns the response schema
+# shows, as plain dicts that services.serialize writes out directly, with no
+# ORM objects and no second validation through the response model. The
+# *_query builders are shared with async_crud.
+def schema_columns(model, schema, exclude=()):
+    return [getattr(model, name) for name in schema.model_fields if name not in exclude]
+
+def rows(db: Session, query):
+    return [dict(row) for row in db.execute(query).mappings()]
+
+ITEM_FIELDS = tuple(schemas.Item.model_fields)
+ITEM_COLUMNS = schema_columns(models.Item, schemas.Item)
+
+def item_rows_query(user_id: int, skip: int = 0, limit: int = 100, fields=ITEM_FIELDS):
+    columns = [getattr(models.Item, name) for name in ITEM_FIELDS if name == "id" or name in fields]
+    return select(*columns).where(models.Item.user_id == user_id).offset(skip).limit(limit)
+
+# Columns of an exported item, in file order (see transfer.py)
+EXPORT_COLUMNS = (
+    models.Item.id, models.Item.title, models.Item.description, models.Item.image_url,
+    models.Item.link, models.Item.price, models.Item.note, models.Item.status,
+    models.Category.name.label("category"), models.Item.created_at,
+)
+
+def export_items_query(user_id: int):
+    # Ordered along ix_items_user_id_created_at, so rows stream without a sort
+    return select(*EXPORT_COLUMNS).outerjoin(
+        models.Category, models.Category.id == models.Item.category_id
+    ).where(models.Item.user_id == user_id).order_by(models.Item.created_at, models.Item.id)
+
+def export_event_items_query(event_id: int):
+    return select(*EXPORT_COLUMNS).join(
+        models.EventItem, models.EventItem.item_id == models.Item.id
+    ).outerjoin(
+        models.Category, models.Category.id == models.Item.category_id
+    ).where(models.EventItem.event_id == event_id).order_by(models.EventItem.item_id)
+
 def get_item(db: Session, item_id: int):
-    return db.query(models.Item).filter(models.Item.id == item_id).first()
+    return db.get(models.Item, item_id)
+
+def get_item_by_link(db: Session, user_id: int, link: str):
+    """The user's item for this link, ignoring tracking parameters and other noise"""
+    if not link:
+        return None
+    return db.query(models.Item).filter(
+        models.Item.user_id == user_id,
+        models.Item.canonical_link == canonicalize_link(link),
+    ).first()
+
+def create_item_unless_linked(db: Session, item: schemas.ItemCreate, user_id: int):
+    """Create the item, or return the user's existing item for the same link"""
+    return get_item_by_link(db, user_id, item.link) or create_item(db, item, user_id)
 
 def update_item(db: Session, item_id: int, item: schemas.ItemUpdate):
-    db_item = db.query(models.Item).filter(models.Item.id == item_id).first()
+    db_item = db.get(models.Item, item_id)
     if not db_item:
         return None
-    for key, value in item.dict(exclude_unset=True).items():
+    before = _stats_key(db_item)
+    updates = item.dict(exclude_unset=True)
+    for key, value in updates.items():
         setattr(db_item, key, value)
-    db.commit()
-    db.refresh(db_item)
+    if "link" in updates:
+        db_item.canonical_link = canonicalize_link(item.link)
+    db.flush()
+    _recount_item(db, db_item, before)
+    if "title" in updates or "price" in updates:
+        _update_activities(db, models.Activity.item_id == item_id, title=db_item.title, price=db_item.price)
+    price_delta = (db_item.price or 0) - before[3]
+    if price_delta:
+        _bump_event_stats(db, item_id, price_total=price_delta)
+    publish_events(db, touch_item(db, item_id, db_item.user_id), "item_updated", item=_item_delta(db_item))
+    return db_item
+
+def set_item_category(db: Session, item_id: int, category_name: str):
+    db_item = db.get(models.Item, item_id)
+    if not db_item:
+        return None
+    before = _stats_key(db_item)
+    db_item.category_id = get_category_id(db, category_name, db_item.user_id)
+    db.flush()
+    _recount_item(db, db_item, before)
+    publish_events(db, touch_item(db, item_id, db_item.user_id), "item_updated", item=_item_delta(db_item))
     return db_item
 
 def delete_item(db: Session, item_id: int):
-    db_item = db.query(models.Item).filter(models.Item.id == item_id).first()
+    db_item = db.get(models.Item, item_id)
     if not db_item:
         return None
+    key = _stats_key(db_item)
+    _count_item(db, key, -1)
+    _bump_event_stats(
+        db, item_id, item_count=-1, price_total=-key[3],
+        booked_count=-int(key[2] == models.StatusEnum.booked),
+    )
+    publish_events(db, touch_item(db, item_id, db_item.user_id), "item_removed", item_id=item_id)
+    drop_activities(db, models.Activity.item_id == item_id)
+    # The item leaves every event it was on, and its booking goes too (SQLite
+    # may give the id to the next item, which must not start out booked)
+    db.query(models.EventItem).filter(models.EventItem.item_id == item_id).delete(synchronize_session=False)
+    db.query(models.Booking).filter(models.Booking.item_id == item_id).delete(synchronize_session=False)
     db.delete(db_item)
-    db.commit()
+    db.flush()
     return db_item
 
+# Bulk item mutations
+# One ownership query for all ids, then set-based statements in the
+# caller's transaction. Counters move by the summed deltas, so a bulk call
+# leaves item_stats and event_stats as the same changes made one by one.
+# Each returns [(id, "ok" | "unchanged" | "not_found")] in request order.
+
+def _owned_items(db: Session, user_id: int, ids):
+    """{id: row(id, category_id, status, price)} of the user's items among `ids`"""
+    return {row.id: row for row in db.execute(
+        select(models.Item.id, models.Item.category_id, models.Item.status, models.Item.price)
+        .where(models.Item.id.in_(set(ids)), models.Item.user_id == user_id)
+    )}
+
+def _results(ids, outcomes: dict):
+    return [(id, outcomes.get(id, "not_found")) for id in dict.fromkeys(ids)]
+
+def _event_links(db: Session, item_ids):
+    """(event_id, item_id) pairs of the events the items are on"""
+    return db.execute(
+        select(models.EventItem.event_id, models.EventItem.item_id).where(models.EventItem.item_id.in_(list(item_ids)))
+    ).all()
+
+def _stats_key_of(row, **changes):
+    key = {
+        "category_id": row.category_id or models.NO_CATEGORY,
+        "status": row.status or models.StatusEnum.favorite,
+        "price": row.price or 0,
+    }
+    key.update(changes)
+    return key
+
+def _count_items(db: Session, user_id: int, counted):
+    """Apply (key from _stats_key_of, +1 or -1) pairs to item_stats, summed per counter row"""
+    totals = {}
+    for key, sign in counted:
+        count, price_total = totals.get((key["category_id"], key["status"]), (0, 0))
+        totals[(key["category_id"], key["status"])] = (count + sign, price_total + sign * key["price"])
+    for (category_id, status), (count, price_total) in totals.items():
+        if count or price_total:
+            _add_item_stats(db, user_id, category_id, status, count, price_total)
+
+def _bump_events_stats(db: Session, deltas):
+    """{event_id: (item_count, price_total, booked_count)} deltas, in one executemany"""
+    params = [
+        {"key": event_id, "d_items": items, "d_price": price, "d_booked": booked}
+        for event_id, (items, price, booked) in deltas.items() if items or price or booked
+    ]
+    if not params:
+        return
+    stats = models.EventStats.__table__
+    db.execute(update(stats).where(stats.c.event_id == bindparam("key")).values(
+        item_count=stats.c.item_count + bindparam("d_items"),
+        price_total=stats.c.price_total + bindparam("d_price"),
+        booked_count=stats.c.booked_count + bindparam("d_booked"),
+    ), params)
+
+def _apply_bulk_change(db: Session, user_id: int, ids, values: dict, after_key):
+    """UPDATE the user's items among `ids` to `values`; after_key(row) is each item's new stats key"""
+    owned = _owned_items(db, user_id, ids)
+    if not owned:
+        return _results(ids, {})
+    db.execute(
+        update(models.Item).where(models.Item.id.in_(list(owned))).values(values),
+        execution_options={"synchronize_session": False},
+    )
+    moves = {id: (_stats_key_of(row), after_key(row)) for id, row in owned.items()}
+    _count_items(db, user_id, [pair for before, after in moves.values() if before != after for pair in ((before, -1), (after, 1))])
+    links = _event_links(db, owned)
+    deltas = {}
+    for event_id, item_id in links:
+        before, after = moves[item_id]
+        booked = int(after["status"] == models.StatusEnum.booked) - int(before["status"] == models.StatusEnum.booked)
+        items, price, booked_total = deltas.get(event_id, (0, 0, 0))
+        deltas[event_id] = (items, price + after["price"] - before["price"], booked_total + booked)
+    _bump_events_stats(db, deltas)
+
+    touch_users(db, [user_id])
+    touch_events(db, {event_id for event_id, _ in links})
+    item_rows = {row["id"]: row for row in rows(db, select(*ITEM_COLUMNS).where(models.Item.id.in_([item_id for _, item_id in links])))} if links else {}
+    for event_id, item_id in links:
+        publish_events(db, [event_id], "item_updated", item=item_rows[item_id])
+    return _results(ids, dict.fromkeys(owned, "ok"))
+
+def bulk_update_items(db: Session, user_id: int, ids, changes: schemas.ItemChanges):
+    values = changes.dict(exclude_unset=True)
+    if values.get("title", "") is None:
+        del values["title"] # titles are required
+    if not values:
+        return _results(ids, dict.fromkeys(_owned_items(db, user_id, ids), "unchanged"))
+    if "link" in values:
+        values["canonical_link"] = canonicalize_link(values["link"])
+    key_changes = {"price": values["price"] or 0} if "price" in values else {}
+    results = _apply_bulk_change(db, user_id, ids, values, lambda row: _stats_key_of(row, **key_changes))
+    shown = {name: values[name] for name in ("title", "price") if name in values}
+    if shown:
+        _update_activities(db, models.Activity.item_id.in_([id for id, result in results if result == "ok"]), **shown)
+    return results
+
+def bulk_move_category(db: Session, user_id: int, ids, category_name: str):
+    category_id = get_category_id(db, category_name, user_id)
+    return _apply_bulk_change(db, user_id, ids, {"category_id": category_id}, lambda row: _stats_key_of(row, category_id=category_id))
+
+def bulk_set_status(db: Session, user_id: int, ids, status: str):
+    status = models.StatusEnum(status)
+    return _apply_bulk_change(db, user_id, ids, {"status": status}, lambda row: _stats_key_of(row, status=status))
+
+def bulk_delete_items(db: Session, user_id: int, ids):
+    owned = _owned_items(db, user_id, ids)
+    if not owned:
+        return _results(ids, {})
+    keys = {id: _stats_key_of(row) for id, row in owned.items()}
+    _count_items(db, user_id, [(key, -1) for key in keys.values()])
+    links = _event_links(db, owned)
+    deltas = {}
+    for event_id, item_id in links:
+        items, price, booked = deltas.get(event_id, (0, 0, 0))
+        key = keys[item_id]
+        deltas[event_id] = (items - 1, price - key["price"], booked - int(key["status"] == models.StatusEnum.booked))
+    _bump_events_stats(db, deltas)
+
+    touch_users(db, [user_id])
+    touch_events(db, {event_id for event_id, _ in links}) # while the items are still on them
+    for event_id, item_id in links:
+        publish_events(db, [event_id], "item_removed", item_id=item_id)
+    item_ids = list(owned)
+    drop_activities(db, models.Activity.item_id.in_(item_ids))
+    # As in delete_item: event links and bookings go with the items
+    for model, column in ((models.EventItem, models.EventItem.item_id), (models.Booking, models.Booking.item_id), (models.Item, models.Item.id)):
+        db.execute(delete(model).where(column.in_(item_ids)), execution_options={"synchronize_session": False})
+    return _results(ids, dict.fromkeys(owned, "ok"))
+
+def bulk_add_items_to_event(db: Session, user_id: int, event_id: int, ids):
+    """None if the event is not the user's"""
+    if db.scalar(select(models.Event.user_id).where(models.Event.id == event_id)) != user_id:
+        return None
+    owned = _owned_items(db, user_id, ids)
+    if not owned:
+        return _results(ids, {})
+    added = set(db.scalars(
+        _insert(db, models.EventItem).values([{"event_id": event_id, "item_id": id} for id in owned])
+        .on_conflict_do_nothing().returning(models.EventItem.item_id)
+    ))
+    if added:
+        keys = [_stats_key_of(owned[id]) for id in added]
+        stmt = _insert(db, models.EventStats).values(
+            event_id=event_id, item_count=len(keys), price_total=sum(key["price"] for key in keys),
+            booked_count=sum(key["status"] == models.StatusEnum.booked for key in keys),
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["event_id"],
+            set_={
+                name: getattr(models.EventStats, name) + getattr(stmt.excluded, name)
+                for name in ("item_count", "price_total", "booked_count")
+            },
+        ))
+        touch_events(db, [event_id])
+        _record_items(db, event_id, user_id, added)
+        for row in rows(db, select(*ITEM_COLUMNS).where(models.Item.id.in_(added))):
+            publish_events(db, [event_id], "item_added", item=row)
+    return _results(ids, {id: "ok" if id in added else "unchanged" for id in owned})
+
+# Item search
+def _search_terms(query: str):
+    # Words only, so user input is never parsed as FTS5 query syntax; "ё" is
+    # folded to "е" as in the index (see migration 0003)
+    return re.findall(r"\w+", query.replace("ё", "е").replace("Ё", "Е"))
+
+def _friends_event_item_ids(user_id: int):
+    """Items on events owned by the user's friends or shared with the user."""
+    from_friends = select(models.EventItem.item_id).join(
+        models.Event, models.Event.id == models.EventItem.event_id
+    ).join(
+        models.Friend, models.Friend.friend_id == models.Event.user_id
+    ).where(models.Friend.user_id == user_id)
+    from_collaborations = select(models.EventItem.item_id).join(
+        models.EventCollaborator, models.EventCollaborator.event_id == models.EventItem.event_id
+    ).where(models.EventCollaborator.user_id == user_id)
+    return union(from_friends, from_collaborations)
+
+def search_items(db: Session, user_id: int, query: str, scope: str = "own", limit: int = 20):
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    stmt = select(models.Item)
+    if scope == "own":
+        owner_ids = [user_id]
+    else:
+        visible = _friends_event_item_ids(user_id)
+        stmt = stmt.where(models.Item.id.in_(visible))
+        owner_ids = db.scalars(select(models.Item.user_id).where(models.Item.id.in_(visible)).distinct()).all()
+        if not owner_ids:
+            return []
+
+    if db.get_bind().dialect.name == "sqlite":
+        # Every word is a prefix term on the text columns (not `owner`, or "u"
+        # would match every item), restricted to the owners' tokens so only
+        # their postings are read; ORDER BY rank is bm25 with the column
+        # weights set by the migration
+        owners = " OR ".join(f'"u{owner_id}"' for owner_id in owner_ids)
+        words = " ".join(f'"{term}"*' for term in terms)
+        stmt = stmt.join(models.items_fts, models.items_fts.c.rowid == models.Item.id).where(
+            literal_column("items_fts").op("MATCH")(f"owner:({owners}) AND {{title description note category_name}}:({words})")
+        ).order_by(literal_column("rank"))
+    else:
+        # No FTS5 here: every term must appear in one of the text columns
+        stmt = stmt.outerjoin(models.Category, models.Category.id == models.Item.category_id)
+        for term in terms:
+            pattern = f"%{term}%"
+            stmt = stmt.where(or_(
+                models.Item.title.ilike(pattern), models.Item.description.ilike(pattern),
+                models.Item.note.ilike(pattern), models.Category.name.ilike(pattern),
+            ))
+        stmt = stmt.where(models.Item.user_id.in_(owner_ids)).order_by(models.Item.created_at.desc())
+    return db.scalars(stmt.limit(limit)).all()
+
 # Event CRUD
 def create_event(db: Session, event: schemas.EventCreate, user_id: int):
-    db_event = models.Event(**event.dict(), user_id=user_id)
+    # Empty collections are set up front so serializing the new event does not lazy-load them
+    db_event = models.Event(**event.dict(), user_id=user_id, items=[], collaborators=[])
     db.add(db_event)
-    db.commit()
-    db.refresh(db_event)
+    db.flush()
+    touch_users(db, [user_id])
+    invalidate_event_views(db, [], [user_id])
+    _record_event(db, db_event.id, user_id)
     return db_event
 
+# Everything schemas.Event serializes, loaded in one query per relationship
+EVENT_LOADERS = (selectinload(models.Event.items), selectinload(models.Event.collaborators))
+
 def get_events_by_user(db: Session, user_id: int):
-    return db.query(models.Event).filter(models.Event.user_id == user_id).all()
+    return db.query(models.Event).options(*EVENT_LOADERS).filter(models.Event.user_id == user_id).all()
 
 def get_event(db: Session, event_id: int):
-    return db.query(models.Event).filter(models.Event.id == event_id).first()
+    return db.get(models.Event, event_id)
 
 def update_event(db: Session, event_id: int, event: schemas.EventCreate):
-    db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    db_event = db.query(models.Event).options(
+        selectinload(models.Event.items), selectinload(models.Event.collaborators)
+    ).filter(models.Event.id == event_id).first()
     if not db_event:
         return None
-    for key, value in event.dict(exclude_unset=True).items():
+    updates = event.dict(exclude_unset=True)
+    for key, value in updates.items():
         setattr(db_event, key, value)
-    db.commit()
-    db.refresh(db_event)
+    db.flush()
+    touch_events(db, [event_id])
+    if "title" in updates:
+        _update_activities(db, and_(models.Activity.event_id == event_id, models.Activity.kind == "event"), title=db_event.title)
+    if "date" in updates:
+        _update_activities(db, models.Activity.event_id == event_id, date=db_event.date)
+    publish_events(db, [event_id], "event_updated", event=schemas.EventBase.model_validate(db_event, from_attributes=True).model_dump(mode="json"))
     return db_event
 
 def delete_event(db: Session, event_id: int):
-    db_event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    db_event = db.get(models.Event, event_id)
     if not db_event:
         return None
+    db.query(models.EventStats).filter(models.EventStats.event_id == event_id).delete(synchronize_session=False)
+    drop_activities(db, models.Activity.event_id == event_id)
+    touch_events(db, [event_id])
+    publish_events(db, [event_id], "event_deleted")
     db.delete(db_event)
-    db.commit()
+    db.flush()
     return db_event
 
+def can_view_event(db: Session, event, user_id: int) -> bool:
+    """Owners, collaborators and the owner's friends can see an event"""
+    if event.user_id == user_id:
+        return True
+    return db.query(or_(
+        exists().where(models.EventCollaborator.event_id == event.id, models.EventCollaborator.user_id == user_id),
+        exists().where(models.Friend.user_id == event.user_id, models.Friend.friend_id == user_id),
+    )).scalar()
+
+def _flag_bookings(db: Session, events, viewer_id: int):
+    """Set item.is_booked for a viewer; owners never see their bookings."""
+    guest_items = [item for event in events if event.user_id != viewer_id for item in event.items]
+    booked_ids = set(db.scalars(
+        select(models.Booking.item_id).where(models.Booking.item_id.in_([item.id for item in guest_items]))
+    )) if guest_items else set()
+    for event in events:
+        for item in event.items:
+            item.is_booked = item.id in booked_ids
+    return events
+
 def get_event_with_booking_status(db: Session, event_id: int, current_user_id: int):
-    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    event = db.get(models.Event, event_id, options=EVENT_LOADERS)
     if not event:
         return None
+    return _flag_bookings(db, [event], current_user_id)[0]
 
-    if event.user_id == current_user_id:
-        for item in event.items:
-            item.is_booked = False
-    else:
-        for item in event.items:
-            item.is_booked = db.query(exists().where(models.Booking.item_id == item.id)).scalar()
-            
-    return event
+# schemas.EventView as rows (see item_rows_query), for the events whose ids
+# `event_ids` (a list or a select) gives. `fields` is a projection of
+# EVENT_FIELDS: nested items and collaborators cost one query each and are
+# only loaded when asked for, the summary counts come from event_stats.
+EVENT_VIEW_FIELDS = tuple(schemas.EventView.model_fields)
+EVENT_SUMMARY_FIELDS = tuple(schemas.EventSummaryView.model_fields)
+EVENT_FIELDS = EVENT_VIEW_FIELDS + tuple(f for f in EVENT_SUMMARY_FIELDS if f not in EVENT_VIEW_FIELDS)
+
+def _event_column(name: str):
+    if name == "collaborator_count":
+        return select(func.count()).where(
+            models.EventCollaborator.event_id == models.Event.id
+        ).scalar_subquery().label(name)
+    if name in ("item_count", "price_total", "booked_count"):
+        return func.coalesce(getattr(models.EventStats, name), 0).label(name)
+    return getattr(models.Event, name)
+
+def event_view_queries(event_ids, fields=EVENT_VIEW_FIELDS):
+    # id and user_id are always read: rows are keyed by id, and user_id decides what the viewer sees
+    names = [name for name in EVENT_FIELDS if name in {"id", "user_id", *fields} and name not in ("items", "collaborators")]
+    events = select(*(_event_column(name) for name in names)).where(models.Event.id.in_(event_ids)).order_by(models.Event.id)
+    if {"item_count", "price_total", "booked_count"} & set(fields):
+        events = events.outerjoin(models.EventStats, models.EventStats.event_id == models.Event.id)
+    queries = {"events": events}
+    if "items" in fields:
+        queries["items"] = (
+            select(models.EventItem.event_id, *ITEM_COLUMNS, models.Booking.id.is_not(None).label("is_booked"))
+            .join(models.Item, models.Item.id == models.EventItem.item_id)
+            .outerjoin(models.Booking, models.Booking.item_id == models.Item.id)
+            .where(models.EventItem.event_id.in_(event_ids))
+        )
+    if "collaborators" in fields:
+        queries["collaborators"] = (
+            select(*schema_columns(models.EventCollaborator, schemas.EventCollaborator))
+            .where(models.EventCollaborator.event_id.in_(event_ids))
+        )
+    return queries
+
+def assemble_event_views(results: dict, viewer_id: int, fields=EVENT_VIEW_FIELDS):
+    """Nest the rows of event_view_queries; owners never see their bookings."""
+    nested = [name for name in ("items", "collaborators") if name in results]
+    events = {row["id"]: {**row, **{name: [] for name in nested}} for row in results["events"]}
+    for row in results.get("items", ()):
+        event = events[row.pop("event_id")]
+        row["is_booked"] = bool(row["is_booked"]) and event["user_id"] != viewer_id
+        event["items"].append(row)
+    for row in results.get("collaborators", ()):
+        events[row["event_id"]]["collaborators"].append(row)
+    for event in events.values():
+        if "booked_count" in event and event["user_id"] == viewer_id:
+            event["booked_count"] = 0
+        if "user_id" not in fields:
+            del event["user_id"]
+    return list(events.values())
+
+def get_event_views(db: Session, event_ids, viewer_id: int, fields=EVENT_VIEW_FIELDS):
+    results = {name: rows(db, query) for name, query in event_view_queries(event_ids, fields).items()}
+    return assemble_event_views(results, viewer_id, fields)
+
+def user_event_ids(user_id: int):
+    return select(models.Event.id).where(models.Event.user_id == user_id)
 
 def add_item_to_event(db: Session, event_id: int, item_id: int):
-    item = db.query(models.Item).filter(models.Item.id == item_id).first()
-    event = db.query(models.Event).filter(models.Event.id == event_id).first()
+    item = db.get(models.Item, item_id)
+    event = db.get(models.Event, event_id)
     if not item or not event:
         return None
 
     db_event_item = models.EventItem(event_id=event_id, item_id=item_id)
     db.add(db_event_item)
-    db.commit()
+    db.flush()
+    _, _, status, price = _stats_key(item)
+    stmt = _insert(db, models.EventStats).values(
+        event_id=event_id, item_count=1, price_total=price,
+        booked_count=int(status == models.StatusEnum.booked),
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["event_id"],
+        set_={
+            name: getattr(models.EventStats, name) + getattr(stmt.excluded, name)
+            for name in ("item_count", "price_total", "booked_count")
+        },
+    ))
+    touch_events(db, [event_id])
+    _record_items(db, event_id, event.user_id, [item_id])
+    publish_events(db, [event_id], "item_added", item=_item_delta(item))
     return db_event_item
 
+def add_own_item_to_event(db: Session, user_id: int, event_id: int, item_id: int):
+    """add_item_to_event, or None unless both the event and the item are the user's"""
+    owners = (
+        db.scalar(select(models.Event.user_id).where(models.Event.id == event_id)),
+        db.scalar(select(models.Item.user_id).where(models.Item.id == item_id)),
+    )
+    if owners != (user_id, user_id):
+        return None
+    return add_item_to_event(db, event_id, item_id)
+
 # Booking CRUD
 def create_booking(db: Session, item_id: int, user_id: int):
-    is_booked = db.query(exists().where(models.Booking.item_id == item_id)).scalar()
-    if is_booked:
+    # One conditional insert: selecting from items skips missing items, and
+    # the unique index on bookings.item_id makes every concurrent booker but
+    # the first hit the conflict. Losers get None without any extra read.
+    stmt = _insert(db, models.Booking).from_select(
+        ["item_id", "booked_by_user_id"],
+        select(models.Item.id, literal(user_id, Integer)).where(models.Item.id == item_id),
+    )
+    stmt = stmt.on_conflict_do_nothing(index_elements=["item_id"]).returning(models.Booking)
+    db_booking = db.scalars(stmt).one_or_none()
+    if db_booking is None:
         return None
-
-    db_booking = models.Booking(item_id=item_id, booked_by_user_id=user_id)
-    db.add(db_booking)
-    db.commit()
-    db.refresh(db_booking)
+    # Same transaction as the insert; only the winner reads the item, to
+    # move it between the status counters
+    db_item = db.get(models.Item, item_id)
+    before = _stats_key(db_item)
+    db_item.status = models.StatusEnum.booked
+    db.flush()
+    _recount_item(db, db_item, before)
+    if before[2] != models.StatusEnum.booked:
+        _bump_event_stats(db, item_id, booked_count=1)
+    publish_events(db, touch_item(db, item_id, db_item.user_id), "item_booked", viewer_class="guest", item_id=item_id)
     return db_booking
 
 # Friend CRUD
@@ -206,6 +1017,11 @@ def get_friends(db: Session, user_id: int):
     friend_ids = [f_id for f_id, in friend_ids]
     return db.query(models.User).filter(models.User.id.in_(friend_ids)).all()
 
+def friend_rows_query(user_id: int):
+    return select(*schema_columns(models.User, schemas.Friend)).where(
+        models.User.id.in_(select(models.Friend.friend_id).where(models.Friend.user_id == user_id))
+    )
+
 def add_friend(db: Session, user_id: int, friend_phone: str):
     print(f"DEBUG: add_friend called by user {user_id} for phone: {friend_phone}")
     friend_user = db.query(models.User).filter(models.User.phone == friend_phone).first()
@@ -213,41 +1029,103 @@ def add_friend(db: Session, user_id: int, friend_phone: str):
         print(f"DEBUG: Friend user not found or is self. friend_user: {friend_user}")
         return None
 
-    # Check if already friends
-    existing_friendship = db.query(models.Friend).filter(
-        models.Friend.user_id == user_id, 
-        models.Friend.friend_id == friend_user.id
-    ).first()
-    if existing_friendship:
-        print(f"DEBUG: Friendship already exists between {user_id} and {friend_user.id}")
-        return friend_user
-
-    # Add friendship in both directions
-    db.add(models.Friend(user_id=user_id, friend_id=friend_user.id))
-    db.add(models.Friend(user_id=friend_user.id, friend_id=user_id))
-    db.commit()
-    print(f"DEBUG: Friendship created between {user_id} and {friend_user.id}")
+    # Add friendship in both directions; rows that already exist are skipped
+    db.execute(_insert(db, models.Friend).values([
+        {"user_id": user_id, "friend_id": friend_user.id},
+        {"user_id": friend_user.id, "friend_id": user_id},
+    ]).on_conflict_do_nothing())
+    _backfill_feed(db, user_id, friend_user.id)
+    _backfill_feed(db, friend_user.id, user_id)
+    touch_users(db, [user_id, friend_user.id])
+    print(f"DEBUG: Friendship ensured between {user_id} and {friend_user.id}")
 
     return friend_user
 
 def delete_friend(db: Session, user_id: int, friend_id: int):
-    # Delete friendship in both directions
-    friendship1 = db.query(models.Friend).filter(
-        models.Friend.user_id == user_id, 
-        models.Friend.friend_id == friend_id
-    ).first()
-    friendship2 = db.query(models.Friend).filter(
-        models.Friend.user_id == friend_id, 
-        models.Friend.friend_id == user_id
-    ).first()
-
-    if friendship1:
-        db.delete(friendship1)
-    if friendship2:
-        db.delete(friendship2)
-    db.commit()
+    # Delete friendship in both directions with a single statement
+    db.query(models.Friend).filter(or_(
+        and_(models.Friend.user_id == user_id, models.Friend.friend_id == friend_id),
+        and_(models.Friend.user_id == friend_id, models.Friend.friend_id == user_id),
+    )).delete(synchronize_session=False)
+    _clear_feed(db, user_id, friend_id)
+    _clear_feed(db, friend_id, user_id)
+    touch_users(db, [user_id, friend_id])
     return True
 
+# Friends feed (see models.Activity)
+# Activities are recorded with INSERT ... SELECT from the rows they describe
+# and copied to the friends' feeds in the same transaction. A new friendship
+# copies the latest FEED_BACKFILL activities each way, an ended one removes
+# them. Pages are keyset-paginated on the activity id.
+FEED_PAGE_SIZE = 50
+FEED_BACKFILL = int(os.getenv("FEED_BACKFILL", "50"))
+ACTIVITY_COLUMNS = ("user_id", "kind", "event_id", "item_id", "title", "price", "date")
+FEED_COLUMNS = schema_columns(models.Activity, schemas.FeedEntry)
+
+def _record_activities(db: Session, user_id: int, source):
+    """Insert the activities of `user_id` that `source` selects (ACTIVITY_COLUMNS) and add them to every friend's feed"""
+    activity_ids = db.scalars(
+        insert(models.Activity).from_select(ACTIVITY_COLUMNS, source).returning(models.Activity.id)
+    ).all()
+    if activity_ids:
+        db.execute(insert(models.FeedEntry).from_select(
+            ["user_id", "activity_id"],
+            select(models.Friend.friend_id, models.Activity.id)
+            .join(models.Activity, models.Activity.user_id == models.Friend.user_id)
+            .where(models.Friend.user_id == user_id, models.Activity.id.in_(activity_ids)),
+        ))
+
+def _record_event(db: Session, event_id: int, user_id: int):
+    _record_activities(db, user_id, select(
+        models.Event.user_id, literal("event"), models.Event.id, null(), models.Event.title, null(), models.Event.date,
+    ).where(models.Event.id == event_id))
+
+def _record_items(db: Session, event_id: int, user_id: int, item_ids):
+    """Items put on an event"""
+    _record_activities(db, user_id, select(
+        models.Event.user_id, literal("item"), models.Event.id, models.Item.id, models.Item.title, models.Item.price, models.Event.date,
+    ).select_from(models.Event).join(models.Item, models.Item.id.in_(list(item_ids))).where(models.Event.id == event_id))
+
+def _update_activities(db: Session, condition, **values):
+    db.execute(update(models.Activity).where(condition).values(values), execution_options={"synchronize_session": False})
+
+def drop_activities(db: Session, condition):
+    """Delete the activities matching `condition` (on models.Activity), and their feed entries"""
+    db.execute(
+        delete(models.FeedEntry).where(models.FeedEntry.activity_id.in_(select(models.Activity.id).where(condition))),
+        execution_options={"synchronize_session": False},
+    )
+    db.execute(delete(models.Activity).where(condition), execution_options={"synchronize_session": False})
+
+def _backfill_feed(db: Session, user_id: int, friend_id: int):
+    latest = select(literal(user_id), models.Activity.id).where(
+        models.Activity.user_id == friend_id
+    ).order_by(models.Activity.id.desc()).limit(FEED_BACKFILL)
+    db.execute(_insert(db, models.FeedEntry).from_select(["user_id", "activity_id"], latest).on_conflict_do_nothing())
+
+def _clear_feed(db: Session, user_id: int, friend_id: int):
+    db.execute(delete(models.FeedEntry).where(
+        models.FeedEntry.user_id == user_id,
+        models.FeedEntry.activity_id.in_(select(models.Activity.id).where(models.Activity.user_id == friend_id)),
+    ), execution_options={"synchronize_session": False})
+
+def feed_rows_query(user_id: int, before: int = None, limit: int = FEED_PAGE_SIZE):
+    """A page of the user's feed, newest first: items put on events, and events that are not over"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    query = select(*FEED_COLUMNS).select_from(models.FeedEntry).join(
+        models.Activity, models.Activity.id == models.FeedEntry.activity_id
+    ).where(
+        models.FeedEntry.user_id == user_id,
+        or_(models.Activity.kind == "item", models.Activity.date.is_(None), models.Activity.date >= today),
+    ).order_by(models.FeedEntry.activity_id.desc()).limit(limit)
+    if before is not None:
+        query = query.where(models.FeedEntry.activity_id < before)
+    return query
+
+def feed_page(entries, limit: int):
+    """schemas.Feed of a feed_rows_query result"""
+    return {"entries": entries, "next_before": entries[-1]["id"] if len(entries) == limit else None}
+
 # Shared Event CRUD
 def add_collaborator_to_event(db: Session, event_id: int, owner_id: int, collaborator_id: int):
     event = db.query(models.Event).filter(models.Event.id == event_id, models.Event.user_id == owner_id).first()
@@ -271,8 +1149,10 @@ def add_collaborator_to_event(db: Session, event_id: int, owner_id: int, collabo
 
     db_collaborator = models.EventCollaborator(event_id=event_id, user_id=collaborator_id)
     db.add(db_collaborator)
-    db.commit()
-    db.refresh(db_collaborator)
+    db.flush()
+    touch_events(db, [event_id])
+    publish_events(db, [event_id], "collaborator_added", user_id=collaborator_id)
+    publish(db, user_channel(collaborator_id), {"type": "collaborator_added", "event_id": event_id, "user_id": collaborator_id})
     return db_collaborator
 
 def remove_collaborator_from_event(db: Session, event_id: int, owner_id: int, collaborator_id: int):
@@ -284,22 +1164,134 @@ def remove_collaborator_from_event(db: Session, event_id: int, owner_id: int, co
     if not db_collaborator:
         return None
     
+    touch_events(db, [event_id]) # while the collaborator is still on it
+    publish_events(db, [event_id], "collaborator_removed", user_id=collaborator_id)
+    publish(db, user_channel(collaborator_id), {"type": "collaborator_removed", "event_id": event_id, "user_id": collaborator_id})
     db.delete(db_collaborator)
-    db.commit()
+    db.flush()
     return True
 
+def shared_event_ids(user_id: int):
+    # Events the user owns and shares, plus events they collaborate on
+    return union(
+        select(models.Event.id).where(models.Event.user_id == user_id, models.Event.is_shared == True),
+        select(models.EventCollaborator.event_id).where(models.EventCollaborator.user_id == user_id),
+    )
+
 def get_shared_events_for_user(db: Session, user_id: int):
-    # Events where the user is the owner AND it's shared
-    owned_shared_events = db.query(models.Event).filter(
-        models.Event.user_id == user_id,
-        models.Event.is_shared == True
-    ).all()
+    return db.query(models.Event).options(*EVENT_LOADERS).filter(models.Event.id.in_(shared_event_ids(user_id))).all()
+
+# Bootstrap
+def get_bootstrap(db: Session, user_id: int, item_limit: int = 100):
+    """Everything the Mini App loads on launch, in a fixed number of queries.
+
+    Events come with their items and collaborators through selectin loads,
+    so the query count does not grow with the number of events.
+    """
+    user = get_principal(db, user_id)
+    if user is None:
+        return None
+    return {
+        "user": user,
+        "items": get_items_by_user(db, user_id, limit=item_limit),
+        "events": get_events_by_user(db, user_id),
+        "friends": get_friends(db, user_id),
+        "shared_events": get_shared_events_for_user(db, user_id),
+    }
+
+# History (archived rows, see archive.py)
+def get_archived_items(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+    return db.query(models.ArchivedItem).filter(
+        models.ArchivedItem.user_id == user_id
+    ).order_by(models.ArchivedItem.archived_at.desc()).offset(skip).limit(limit).all()
 
-    # Events where the user is a collaborator
-    collaborated_events = db.query(models.Event).join(models.EventCollaborator).filter(
-        models.EventCollaborator.user_id == user_id
+def get_archived_events(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+    events = db.query(models.ArchivedEvent).filter(
+        models.ArchivedEvent.user_id == user_id
+    ).order_by(models.ArchivedEvent.archived_at.desc()).offset(skip).limit(limit).all()
+    memberships = db.query(models.ArchivedEventItem).filter(
+        models.ArchivedEventItem.event_id.in_([event.id for event in events])
     ).all()
+    # Items of a past event may still be hot or may have been archived too
+    item_ids = {membership.item_id for membership in memberships}
+    items = {item.id: item for item in db.query(models.ArchivedItem).filter(
+        models.ArchivedItem.id.in_(item_ids)
+    ).order_by(models.ArchivedItem.archive_id)}
+    items.update({item.id: item for item in db.query(models.Item).filter(models.Item.id.in_(item_ids))})
+
+    items_by_event = {}
+    for membership in memberships:
+        if membership.item_id in items:
+            items_by_event.setdefault(membership.event_id, []).append(items[membership.item_id])
+    for event in events:
+        event.items = items_by_event.get(event.id, [])
+    return events
+
+# Background job checkpoints
+def get_checkpoint(db: Session, name: str):
+    return db.scalar(select(models.JobCheckpoint.position).where(models.JobCheckpoint.name == name))
+
+def set_checkpoint(db: Session, name: str, position: str):
+    stmt = _insert(db, models.JobCheckpoint).values(name=name, position=position)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["name"], set_={"position": stmt.excluded.position, "updated_at": func.now()},
+    ))
+
+# Telegram outbox (see outbox.py)
+# Writer jobs only: claiming leases due messages, the sending happens
+# outside the write transaction, settling records how it went.
+def enqueue_telegram_messages(db: Session, kind: str, texts: dict):
+    """Queue {chat_id: text}. A message of the same kind still waiting for a chat gets the text as new lines."""
+    if not texts:
+        return
+    outbox = models.OutboxMessage.__table__
+    stmt = _insert(db, outbox)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["chat_id", "kind"],
+        set_={"text": outbox.c.text + "\n" + stmt.excluded.text, "version": outbox.c.version + 1},
+    ), [
+        {"chat_id": chat_id, "kind": kind, "text": text, "version": 1, "attempts": 0, "next_attempt_at": datetime.utcnow()}
+        for chat_id, text in texts.items()
+    ])
+
+def _outbox_keys(messages, **values):
+    """executemany parameters addressing claimed messages by primary key"""
+    return [{"key_chat_id": m["chat_id"], "key_kind": m["kind"], **{name: value(m) for name, value in values.items()}} for m in messages]
+
+def _outbox_where():
+    outbox = models.OutboxMessage.__table__
+    return outbox.c.chat_id == bindparam("key_chat_id"), outbox.c.kind == bindparam("key_kind")
+
+def claim_telegram_messages(db: Session, limit: int, lease_seconds: float):
+    """Up to `limit` due messages, leased for `lease_seconds` so no other worker sends them meanwhile"""
+    now = datetime.utcnow()
+    outbox = models.OutboxMessage.__table__
+    claimed = rows(db, select(outbox.c.chat_id, outbox.c.kind, outbox.c.text, outbox.c.version, outbox.c.attempts).where(
+        outbox.c.next_attempt_at <= now
+    ).order_by(outbox.c.next_attempt_at).limit(limit))
+    if claimed:
+        db.execute(
+            update(outbox).where(*_outbox_where()).values(next_attempt_at=now + timedelta(seconds=lease_seconds)),
+            _outbox_keys(claimed),
+        )
+    return claimed
 
-    # Combine and remove duplicates
-    all_shared_events = {event.id: event for event in owned_shared_events + collaborated_events}.values()
-    return list(all_shared_events)
\ No newline at end of file
+def settle_telegram_messages(db: Session, sent=(), dropped=(), retry=()):
+    """Record how sending claimed messages went: `sent` went out, `dropped`
+    are given up on, `retry` is [(message, when, failed)]: send again at
+    `when`, counting an attempt if `failed`."""
+    outbox = models.OutboxMessage.__table__
+    if sent:
+        # Lines appended while a message was out stay queued on their own
+        same_version = outbox.c.version == bindparam("sent_version")
+        params = _outbox_keys(sent, sent_version=lambda m: m["version"], rest_from=lambda m: len(m["text"]) + 2)
+        db.execute(delete(outbox).where(*_outbox_where(), same_version), params)
+        db.execute(update(outbox).where(*_outbox_where(), ~same_version).values(
+            text=func.substr(outbox.c.text, bindparam("rest_from")), attempts=0, next_attempt_at=datetime.utcnow(),
+        ), params)
+    if dropped:
+        db.execute(delete(outbox).where(*_outbox_where()), _outbox_keys(dropped))
+    if retry:
+        db.execute(update(outbox).where(*_outbox_where()).values(
+            next_attempt_at=bindparam("when"), attempts=outbox.c.attempts + bindparam("failed"),
+        ), [{**_outbox_keys([m])[0], "when": when, "failed": int(failed)} for m, when, failed in retry])
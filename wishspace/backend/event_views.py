@@ -0,0 +1,86 @@
+"""Rendered event views, shared by every viewer of the same class.
+
+When a wishlist is shared, many friends open the same event pages. The JSON
+of /api/events/{id} and /api/users/{id}/events is kept in
+crud.event_view_cache per event (or owner), viewer class (the owner, who
+never sees bookings, or a guest, who does) and view: the full one or
+?view=summary. Other ?fields= projections are rendered every time. crud drops the entries when a
+change to the event commits (touch_events, create_event); the hit ratio is
+served by /api/admin/metrics.
+"""
+from sqlalchemy import select
+
+import async_crud, crud, models
+from services.serialize import dumps
+
+
+def _owner_query(event_id: int):
+    return select(models.Event.user_id).where(models.Event.id == event_id)
+
+
+def cached_view(fields):
+    """Name of the cached view for a projection (see crud.CACHED_VIEWS), None if not cached."""
+    return {None: "full", crud.EVENT_VIEW_FIELDS: "full", crud.EVENT_SUMMARY_FIELDS: "summary"}.get(fields)
+
+
+def _remember(key, body, generation: int):
+    if key[-1] is not None:
+        crud.remember_event_view(key, body, generation)
+
+
+def render_event(db, event_id: int, viewer_id: int, generation: int, fields=None):
+    owner_id = crud.event_view_cache.get(("event_owner", event_id))
+    if owner_id is None:
+        owner_id = db.scalar(_owner_query(event_id))
+        if owner_id is None:
+            return None
+        crud.remember_event_view(("event_owner", event_id), owner_id, generation)
+    key = ("event", event_id, crud.viewer_class(owner_id, viewer_id), cached_view(fields))
+    body = crud.event_view_cache.get(key)
+    if body is None:
+        views = crud.get_event_views(db, [event_id], viewer_id, fields or crud.EVENT_VIEW_FIELDS)
+        if not views:
+            return None
+        body = dumps(views[0])
+        _remember(key, body, generation)
+    return body
+
+
+def render_user_events(db, user_id: int, viewer_id: int, generation: int, fields=None):
+    key = ("user_events", user_id, crud.viewer_class(user_id, viewer_id), cached_view(fields))
+    body = crud.event_view_cache.get(key)
+    if body is None:
+        if db.get(models.User, user_id) is None:
+            return None
+        body = dumps(crud.get_event_views(db, crud.user_event_ids(user_id), viewer_id, fields or crud.EVENT_VIEW_FIELDS))
+        _remember(key, body, generation)
+    return body
+
+
+async def render_event_async(db, event_id: int, viewer_id: int, generation: int, fields=None):
+    owner_id = crud.event_view_cache.get(("event_owner", event_id))
+    if owner_id is None:
+        owner_id = await db.scalar(_owner_query(event_id))
+        if owner_id is None:
+            return None
+        crud.remember_event_view(("event_owner", event_id), owner_id, generation)
+    key = ("event", event_id, crud.viewer_class(owner_id, viewer_id), cached_view(fields))
+    body = crud.event_view_cache.get(key)
+    if body is None:
+        views = await async_crud.get_event_views(db, [event_id], viewer_id, fields or crud.EVENT_VIEW_FIELDS)
+        if not views:
+            return None
+        body = dumps(views[0])
+        _remember(key, body, generation)
+    return body
+
+
+async def render_user_events_async(db, user_id: int, viewer_id: int, generation: int, fields=None):
+    key = ("user_events", user_id, crud.viewer_class(user_id, viewer_id), cached_view(fields))
+    body = crud.event_view_cache.get(key)
+    if body is None:
+        if not await async_crud.user_exists(db, user_id):
+            return None
+        body = dumps(await async_crud.get_event_views(db, crud.user_event_ids(user_id), viewer_id, fields or crud.EVENT_VIEW_FIELDS))
+        _remember(key, body, generation)
+    return body
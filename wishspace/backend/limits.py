@@ -0,0 +1,136 @@
+"""Request rate limits, so one user cannot take the capacity everyone shares.
+
+Every route group has a token bucket per caller, set by RATE_LIMIT_<GROUP>
+as "count/period" (e.g. 30/minute: bursts of up to 30, refilled at 30 a
+minute; empty or 0 turns the group off):
+
+- auth: login and token refresh, per client address; behind nginx that
+  is the X-Forwarded-For address the proxies in TRUSTED_PROXIES pass on
+- scrape: POST /api/items/scrape per user, and links sent to the bot per
+  Telegram user, since each one is an outbound scrape
+- mutations / reads: every other authenticated request by method, per user;
+  a route limited by a group of its own is not counted here as well
+
+A request over its limit gets 429 with Retry-After. Buckets are kept in
+each worker process, or shared by all of them in Redis when RATE_LIMIT_URL
+is set.
+"""
+import ipaddress
+import math
+import os
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+
+from auth import decode_user_id, optional_oauth2_scheme
+from services.rate_limit import make_backend, parse_limit
+
+RATE_LIMITS = {
+    group: parse_limit(os.getenv(f"RATE_LIMIT_{group.upper()}", default))
+    for group, default in {
+        "auth": "20/minute",
+        "scrape": "10/minute",
+        "mutations": "120/minute",
+        "reads": "600/minute",
+    }.items()
+}
+
+backend = make_backend(os.getenv("RATE_LIMIT_URL"))
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# nginx reaches the container through the Docker gateway (172.16.0.0/12)
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(network.strip())
+    for network in os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1,172.16.0.0/12").split(",") if network.strip()
+]
+
+
+def retry_after(group: str, key: str) -> int:
+    """Take a request from `key`'s bucket in `group`: 0 if allowed, else whole seconds to wait."""
+    limit = RATE_LIMITS[group]
+    if limit is None:
+        return 0
+    return math.ceil(backend.take(f"{group}:{key}", limit))
+
+
+async def retry_after_async(group: str, key: str) -> int:
+    """retry_after for async handlers: a shared backend is asked from a thread."""
+    if RATE_LIMITS[group] is None:
+        return 0
+    if backend.blocking:
+        return await run_in_threadpool(retry_after, group, key)
+    return retry_after(group, key)
+
+
+async def _check(group: str, key: str):
+    wait = await retry_after_async(group, key)
+    if wait:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(wait)},
+        )
+
+
+def _user_key(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    try:
+        return f"user:{decode_user_id(token)}"
+    except HTTPException: # the route itself answers 401
+        return None
+
+
+def _trusted(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in TRUSTED_PROXIES)
+
+
+def client_address(request: Request) -> str:
+    """The caller's address. From a trusted proxy, the last X-Forwarded-For hop
+    not added by one, since earlier hops are whatever the client sent."""
+    host = request.client.host if request.client else "unknown"
+    if _trusted(host):
+        for hop in reversed(request.headers.get("x-forwarded-for", "").split(",")):
+            hop = hop.strip()
+            if hop and not _trusted(hop):
+                return hop
+    return host
+
+
+def _client_key(request: Request) -> str:
+    return f"client:{client_address(request)}"
+
+
+def rate_limit(group: str):
+    """Dependency limiting a route to RATE_LIMIT_<GROUP>, per user, or per client without a token."""
+    async def dependency(request: Request, token: Optional[str] = Depends(optional_oauth2_scheme)):
+        await _check(group, _user_key(token) or _client_key(request))
+    dependency.rate_limit_group = group
+    return dependency
+
+
+def _has_own_group(request: Request) -> bool:
+    route = request.scope.get("route")
+    return any(hasattr(depends.dependency, "rate_limit_group") for depends in getattr(route, "dependencies", ()))
+
+
+async def limit_by_method(request: Request, token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """App-wide dependency: reads or mutations, per user. Requests without a
+    valid bearer token (logins, the bot webhook, admin) are left to their
+    routes, and so are routes with a rate_limit group of their own."""
+    key = _user_key(token)
+    if key is not None and not _has_own_group(request):
+        await _check("reads" if request.method in READ_METHODS else "mutations", key)
+
+
+def stats() -> dict:
+    return {
+        "limits": {group: limit and f"{limit.burst} per {limit.burst / limit.rate:g}s" for group, limit in RATE_LIMITS.items()},
+        **backend.stats(),
+    }
@@ -1,8 +1,9 @@
 import logging
-from fastapi import FastAPI, Depends, HTTPException, APIRouter, status, Request
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import FastAPI, Body, Depends, HTTPException, APIRouter, Query, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Literal, Optional
 import os
 import hmac
 import hashlib
@@ -10,66 +11,52 @@ import urllib.parse
 import time
 from datetime import datetime, timedelta
 import json
-import requests # Added for Telegram Bot API interaction
 import re # Added for URL pattern matching
 from pydantic import BaseModel, ValidationError # Added to resolve NameError
 
-from jose import JWTError, jwt
-
-import models, schemas, crud
-from database import SessionLocal, engine
+import models, schemas, crud, migrations, archive, event_views, limits, maintenance, push, reminders, transfer
+from auth import ACCESS_TOKEN_EXPIRE_MINUTES, INIT_DATA_MAX_AGE_SECONDS, oauth2_scheme, telegram_secret_key, create_access_token, credentials_exception, decode_user_id, get_current_user_id, get_stream_user_id, require_admin
+from database import ASYNC_DB, ReadSessionLocal, engine, run_write
 from services.product_parser import scrape_url
+from services.background import PeriodicTask
+from services.etags import not_modified, request_variant
+from services.fields import projection, sparse_fields
+from services.serialize import dumps, json_response
+from services.telegram import send_telegram_message
 
 # Configure logging (at the top of main.py, after imports)
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-models.Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
 
 app = FastAPI()
 
-# --- JWT Configuration ---
-SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-jwt-key") # TODO: Use a strong, random key in production
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/telegram")
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
 def get_db():
-    db = SessionLocal()
+    # Read-only session from the read pool. Writes go through run_write, which
+    # runs them as one transaction on the single database writer.
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
         db.close()
 
 def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    # Endpoints that only need the caller's id depend on get_current_user_id
+    user = crud.get_principal(db, decode_user_id(token))
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
 
+# ?fields= / ?view= projections of the list endpoints (see crud.event_view_queries)
+item_fields = sparse_fields(crud.ITEM_FIELDS)
+event_fields = projection(crud.EVENT_FIELDS, {"full": crud.EVENT_VIEW_FIELDS, "summary": crud.EVENT_SUMMARY_FIELDS})
+
+def conditional_get(request: Request, response: Response, db: Session, viewer_id: int, *keys):
+    """304 response if the client's ETag still matches the versions of `keys`, else None."""
+    etag = crud.get_etag(db, list(keys), request_variant(request, viewer_id))
+    return not_modified(request, response, etag)
+
 # --- Telegram InitData Validation ---
 def validate_telegram_init_data(init_data: str, bot_token: str) -> Optional[dict]:
     # Data is a query string, parse it
@@ -88,30 +75,61 @@ def validate_telegram_init_data(init_data: str, bot_token: str) -> Optional[dict
         data_check_string.append(f"{key}={value}")
     data_check_string = '\n'.join(data_check_string)
 
-    # Calculate secret_key
-    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
-
     # Calculate hash of data_check_string
-    calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    calculated_hash = hmac.new(telegram_secret_key(bot_token), data_check_string.encode(), hashlib.sha256).hexdigest()
 
     # Compare hashes
-    if calculated_hash == hash_from_data:
-        # Extract user data
-        user_data_str = parsed_data.get('user', [None])[0]
-        if user_data_str:
-            user_data = json.loads(user_data_str)
-            return user_data
+    if not hmac.compare_digest(calculated_hash, hash_from_data):
+        return None
+    # A signed initData stays valid forever, so stale ones are refused
+    try:
+        auth_date = int(parsed_data.get('auth_date', [0])[0])
+    except ValueError:
+        return None
+    if time.time() - auth_date > INIT_DATA_MAX_AGE_SECONDS:
+        return None
+    # Extract user data
+    user_data_str = parsed_data.get('user', [None])[0]
+    if user_data_str:
+        user_data = json.loads(user_data_str)
+        return user_data
     return None
 
+def load_bootstrap(user_id: int):
+    # Own read session: the caller's may predate the login's write
+    db = ReadSessionLocal()
+    try:
+        return crud.get_bootstrap(db, user_id)
+    finally:
+        db.close()
+
+def token_response(user_id: int, refresh_token: str, bootstrap: bool = False) -> dict:
+    access_token = create_access_token(
+        data={"sub": str(user_id)},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "refresh_token": refresh_token,
+        "bootstrap": load_bootstrap(user_id) if bootstrap else None,
+    }
+
 
+# Per-user request rate limits, reads and mutations (see limits.py)
+app = FastAPI(dependencies=[Depends(limits.limit_by_method)])
 
-app = FastAPI()
+# Async handlers, when enabled, are registered first so they shadow the sync routes below
+if ASYNC_DB:
+    import async_api
+    app.include_router(async_api.router)
 
 # --- Auth Router ---
 auth_router = APIRouter()
 
-@auth_router.post("/api/auth/telegram", response_model=schemas.Token)
-def auth_via_telegram(auth_data: schemas.TelegramAuthData, db: Session = Depends(get_db)):
+@auth_router.post("/api/auth/telegram", response_model=schemas.Token, dependencies=[Depends(limits.rate_limit("auth"))])
+def auth_via_telegram(auth_data: schemas.TelegramAuthData, bootstrap: bool = False, db: Session = Depends(get_db)):
     bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not bot_token:
         raise HTTPException(status_code=500, detail="Telegram Bot Token not configured.")
@@ -129,14 +147,9 @@ def auth_via_telegram(auth_data: schemas.TelegramAuthData, db: Session = Depends
                     "phone": f"+" + str(mock_user_id) + "0", # Ensure 10+ digits for mock phone
                     "avatar_url": None
                 }
-                mock_user = crud.create_user(db, schemas.UserCreate(**mock_user_data))
-            
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = create_access_token(
-                data={"sub": str(mock_user.id)},
-                expires_delta=access_token_expires
-            )
-            return {"access_token": access_token, "token_type": "bearer"}
+                mock_user = run_write(crud.create_user, schemas.UserCreate(**mock_user_data))
+
+            return token_response(mock_user.id, run_write(crud.issue_refresh_token, mock_user.id), bootstrap)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid mock user data: {e}")
 
@@ -152,14 +165,22 @@ def auth_via_telegram(auth_data: schemas.TelegramAuthData, db: Session = Depends
         phone=user_data.get("phone_number"), # Telegram initData might not always have phone_number
         avatar_url=user_data.get("photo_url")
     )
-    db_user = crud.get_or_create_user(db, user=user_create_data)
-
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(db_user.id)},
-        expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    def _login(db: Session):
+        db_user = crud.get_or_create_user(db, user=user_create_data)
+        return db_user.id, crud.issue_refresh_token(db, db_user.id)
+    return token_response(*run_write(_login), bootstrap)
+
+@auth_router.post("/api/auth/refresh", response_model=schemas.Token, dependencies=[Depends(limits.rate_limit("auth"))])
+def refresh_access_token(request: schemas.RefreshRequest, bootstrap: bool = False):
+    # One write, no initData validation or user upsert
+    rotated = run_write(crud.rotate_refresh_token, request.refresh_token)
+    if not rotated:
+        raise credentials_exception()
+    return token_response(*rotated, bootstrap)
+
+@auth_router.post("/api/auth/logout", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(limits.rate_limit("auth"))])
+def logout(request: schemas.RefreshRequest):
+    run_write(crud.revoke_refresh_token, request.refresh_token)
 
 import logging
 # ... other imports ...
@@ -179,14 +200,31 @@ def read_users_me(
 @auth_router.put("/api/users/me/phone", response_model=schemas.User)
 def update_my_phone(
     phone_data: schemas.UserUpdatePhone,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user_id: int = Depends(get_current_user_id)
 ):
-    updated_user = crud.update_user_phone(db, current_user.id, phone_data.phone)
+    updated_user = run_write(crud.update_user_phone, current_user_id, phone_data.phone)
     if not updated_user:
         raise HTTPException(status_code=404, detail="User not found")
     return updated_user
 
+@auth_router.get("/api/bootstrap", response_model=schemas.Bootstrap)
+def read_bootstrap(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), limit: int = 100, db: Session = Depends(get_db)):
+    """User, first item page, own events, friends and shared events for the Mini App launch."""
+    cached = conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    data = crud.get_bootstrap(db, current_user_id, item_limit=limit)
+    if data is None:
+        raise credentials_exception()
+    return data
+
+@auth_router.get("/api/users/me/summary", response_model=schemas.UserSummary)
+def read_my_summary(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    cached = conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    return crud.get_user_summary(db, current_user_id)
+
 app.include_router(auth_router)
 
 # --- Items Router ---
@@ -196,8 +234,12 @@ class ScrapeRequest(BaseModel):
     url: str
     category_name: str = "General"
 
-@items_router.post("/api/items/scrape", response_model=schemas.Item)
-def create_item_from_scrape(request: ScrapeRequest, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+@items_router.post("/api/items/scrape", response_model=schemas.Item, dependencies=[Depends(limits.rate_limit("scrape"))])
+def create_item_from_scrape(request: ScrapeRequest, current_user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    # A link the user already saved (tracking params aside) is not scraped again
+    existing = crud.get_item_by_link(db, current_user_id, request.url)
+    if existing:
+        return existing
     try:
         scraped_data = scrape_url(request.url)
         llm_extraction = scraped_data.get('data', {}).get('llm_extraction', {})
@@ -210,97 +252,179 @@ def create_item_from_scrape(request: ScrapeRequest, current_user: models.User =
             link=request.url,
             category_name=request.category_name
         )
-        return crud.create_item(db=db, item=item_data, user_id=current_user.id)
+        return run_write(crud.create_item_unless_linked, item=item_data, user_id=current_user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @items_router.post("/api/items/manual", response_model=schemas.Item)
-def create_item_manual(item: schemas.ItemCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return crud.create_item(db=db, item=item, user_id=current_user.id)
+def create_item_manual(item: schemas.ItemCreate, current_user_id: int = Depends(get_current_user_id)):
+    return run_write(crud.create_item, item=item, user_id=current_user_id)
 
 @items_router.get("/api/items", response_model=List[schemas.Item])
-def read_items(current_user: models.User = Depends(get_current_user), skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    items = crud.get_items_by_user(db, user_id=current_user.id, skip=skip, limit=limit)
-    return items
+def read_items(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), skip: int = 0, limit: int = 100, fields=Depends(item_fields), db: Session = Depends(get_db)):
+    cached = conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    return json_response(dumps(crud.rows(db, crud.item_rows_query(current_user_id, skip, limit, fields or crud.ITEM_FIELDS))), response)
+
+@items_router.get("/api/items/search", response_model=List[schemas.Item])
+def search_items(
+    q: str = Query(..., min_length=1, max_length=200),
+    scope: Literal["own", "friends"] = "own",
+    limit: int = Query(20, ge=1, le=100),
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db)
+):
+    """Ranked prefix search over the user's items, or over items on friends' and shared events."""
+    return crud.search_items(db, user_id=current_user_id, query=q, scope=scope, limit=limit)
+
+ExportFormat = Literal["ndjson", "csv"]
+
+def export_response(query, format: str, filename: str):
+    return StreamingResponse(
+        transfer.stream_export(query, format),
+        media_type=transfer.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
+
+@items_router.get("/api/items/export")
+def export_items(format: ExportFormat = "ndjson", current_user_id: int = Depends(get_current_user_id)):
+    return export_response(crud.export_items_query(current_user_id), format, "wishlist")
+
+@items_router.post("/api/items/import", response_model=schemas.ImportReport)
+async def import_items(request: Request, format: ExportFormat = "ndjson", current_user_id: int = Depends(get_current_user_id)):
+    """Create items from an NDJSON or CSV body in the export format; links already saved are skipped."""
+    return await transfer.import_items(request.stream(), format, current_user_id)
 
 @items_router.put("/api/items/{item_id}", response_model=schemas.Item)
-def update_item(item_id: int, item: schemas.ItemUpdate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_item = crud.get_item(db, item_id)
-    if not db_item or db_item.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Item not found or not owned by user")
-    return crud.update_item(db, item_id, item)
+def update_item(item_id: int, item: schemas.ItemUpdate, current_user_id: int = Depends(get_current_user_id)):
+    def _update(db: Session):
+        db_item = crud.get_item(db, item_id)
+        if not db_item or db_item.user_id != current_user_id:
+            raise HTTPException(status_code=404, detail="Item not found or not owned by user")
+        return crud.update_item(db, item_id, item)
+    return run_write(_update)
 
 @items_router.delete("/api/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_item(item_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_item = crud.get_item(db, item_id)
-    if not db_item or db_item.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Item not found or not owned by user")
-    crud.delete_item(db, item_id)
+def delete_item(item_id: int, current_user_id: int = Depends(get_current_user_id)):
+    def _delete(db: Session):
+        db_item = crud.get_item(db, item_id)
+        if not db_item or db_item.user_id != current_user_id:
+            raise HTTPException(status_code=404, detail="Item not found or not owned by user")
+        crud.delete_item(db, item_id)
+    run_write(_delete)
     return
 
+def bulk_response(results) -> dict:
+    return {"results": [{"id": id, "result": result} for id, result in results]}
+
+@items_router.post("/api/items/bulk/update", response_model=schemas.BulkResult)
+def bulk_update_items(request: schemas.BulkItemUpdate, current_user_id: int = Depends(get_current_user_id)):
+    return bulk_response(run_write(crud.bulk_update_items, current_user_id, request.ids, request.changes))
+
+@items_router.post("/api/items/bulk/category", response_model=schemas.BulkResult)
+def bulk_move_category(request: schemas.BulkCategoryMove, current_user_id: int = Depends(get_current_user_id)):
+    return bulk_response(run_write(crud.bulk_move_category, current_user_id, request.ids, request.category_name))
+
+@items_router.post("/api/items/bulk/status", response_model=schemas.BulkResult)
+def bulk_set_status(request: schemas.BulkStatusChange, current_user_id: int = Depends(get_current_user_id)):
+    return bulk_response(run_write(crud.bulk_set_status, current_user_id, request.ids, request.status))
+
+@items_router.post("/api/items/bulk/delete", response_model=schemas.BulkResult)
+def bulk_delete_items(request: schemas.BulkItemIds, current_user_id: int = Depends(get_current_user_id)):
+    return bulk_response(run_write(crud.bulk_delete_items, current_user_id, request.ids))
+
 app.include_router(items_router)
 
 # --- Events Router ---
 events_router = APIRouter()
 
 @events_router.post("/api/events", response_model=schemas.Event)
-def create_event_for_user(event: schemas.EventCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return crud.create_event(db=db, event=event, user_id=current_user.id)
+def create_event_for_user(event: schemas.EventCreate, current_user_id: int = Depends(get_current_user_id)):
+    return run_write(crud.create_event, event=event, user_id=current_user_id)
+
+@events_router.get("/api/events/{event_id}", response_model=schemas.EventView)
+def read_event(event_id: int, request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), fields=Depends(event_fields), db: Session = Depends(get_db)):
+    generation = crud.event_view_generation()
+    # The viewer's own counter covers friendship and collaboration changes
+    cached = conditional_get(request, response, db, current_user_id, ("event", event_id), ("user", current_user_id))
+    if cached:
+        return cached
+    body = event_views.render_event(db, event_id, current_user_id, generation, fields)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return json_response(body, response)
 
-@events_router.get("/api/events/{event_id}", response_model=schemas.Event)
-def read_event(event_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_event = crud.get_event_with_booking_status(db, event_id=event_id, current_user_id=current_user.id)
-    if not db_event is None:
+@events_router.get("/api/events/{event_id}/export")
+def export_event(event_id: int, format: ExportFormat = "ndjson", current_user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    db_event = crud.get_event(db, event_id)
+    if db_event is None or not crud.can_view_event(db, db_event, current_user_id):
         raise HTTPException(status_code=404, detail="Event not found")
-    return db_event
-
-@events_router.get("/api/users/{user_id}/events", response_model=List[schemas.Event])
-def read_user_events(user_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Allow user to view their own events or a friend's events
-    # For a friend's events, we might want to ensure they are actually friends
-    # For now, just check if the requested user_id is valid
-    target_user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not target_user:
+    return export_response(crud.export_event_items_query(event_id), format, f"event-{event_id}")
+
+@events_router.get("/api/users/{user_id}/events", response_model=List[schemas.EventView])
+def read_user_events(user_id: int, request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), fields=Depends(event_fields), db: Session = Depends(get_db)):
+    # Own events or a friend's; friends see which items are already booked
+    generation = crud.event_view_generation()
+    cached = conditional_get(request, response, db, current_user_id, ("user", user_id))
+    if cached:
+        return cached
+    body = event_views.render_user_events(db, user_id, current_user_id, generation, fields)
+    if body is None:
         raise HTTPException(status_code=404, detail="User not found")
-    
-    # In a real app, you'd check if current_user is friends with target_user
-    # For now, we'll just return the events if the user exists
-    events = crud.get_events_by_user(db=db, user_id=user_id)
-    return events
+    return json_response(body, response)
 
 @events_router.put("/api/events/{event_id}", response_model=schemas.Event)
-def update_event(event_id: int, event: schemas.EventCreate, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_event = crud.get_event(db, event_id)
-    if not db_event or db_event.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Event not found or not owned by user")
-    return crud.update_event(db, event_id, event)
+def update_event(event_id: int, event: schemas.EventCreate, current_user_id: int = Depends(get_current_user_id)):
+    def _update(db: Session):
+        db_event = crud.get_event(db, event_id)
+        if not db_event or db_event.user_id != current_user_id:
+            raise HTTPException(status_code=404, detail="Event not found or not owned by user")
+        return crud.update_event(db, event_id, event)
+    return run_write(_update)
 
 @events_router.delete("/api/events/{event_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_event(event_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    db_event = crud.get_event(db, event_id)
-    if not db_event or db_event.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Event not found or not owned by user")
-    crud.delete_event(db, event_id)
+def delete_event(event_id: int, current_user_id: int = Depends(get_current_user_id)):
+    def _delete(db: Session):
+        db_event = crud.get_event(db, event_id)
+        if not db_event or db_event.user_id != current_user_id:
+            raise HTTPException(status_code=404, detail="Event not found or not owned by user")
+        crud.delete_event(db, event_id)
+    run_write(_delete)
     return
 
-class EventItemRequest(BaseModel):
-    item_id: int
-
 @events_router.post("/api/events/{event_id}/items")
-def add_item_to_event_route(event_id: int, request: EventItemRequest, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    result = crud.add_item_to_event(db=db, event_id=event_id, item_id=request.item_id)
+def add_item_to_event_route(event_id: int, request: schemas.EventItemRequest, current_user_id: int = Depends(get_current_user_id)):
+    result = run_write(crud.add_own_item_to_event, current_user_id, event_id, request.item_id)
     if result is None:
-        raise HTTPException(status_code=404, detail="Event or Item not found")
+        raise HTTPException(status_code=404, detail="Event or Item not found or not owned by user")
     return {"message": "Item added to event successfully"}
 
+@events_router.post("/api/events/{event_id}/items/bulk", response_model=schemas.BulkResult)
+def bulk_add_items_to_event(event_id: int, request: schemas.BulkItemIds, current_user_id: int = Depends(get_current_user_id)):
+    results = run_write(crud.bulk_add_items_to_event, current_user_id, event_id, request.ids)
+    if results is None:
+        raise HTTPException(status_code=404, detail="Event not found or not owned by user")
+    return bulk_response(results)
+
+@events_router.get("/api/stream")
+async def stream_event_changes(request: Request, event_id: List[int] = Query([]), current_user_id: int = Depends(get_stream_user_id)):
+    # Server-Sent Events with changes to the given events, see push.py
+    if len(event_id) > push.STREAM_MAX_EVENTS:
+        raise HTTPException(status_code=400, detail=f"At most {push.STREAM_MAX_EVENTS} events per stream")
+    channels = await run_in_threadpool(push.visible_channels, event_id, current_user_id)
+    if channels is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return push.stream_response(request, channels)
+
 app.include_router(events_router)
 
 # --- Booking Router ---
 booking_router = APIRouter()
 
 @booking_router.post("/api/items/{item_id}/book", response_model=schemas.Booking)
-def book_item(item_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    booking = crud.create_booking(db=db, item_id=item_id, user_id=current_user.id)
+def book_item(item_id: int, current_user_id: int = Depends(get_current_user_id)):
+    booking = run_write(crud.create_booking, item_id=item_id, user_id=current_user_id)
     if booking is None:
         raise HTTPException(status_code=400, detail="Item is already booked or does not exist.")
     return booking
@@ -311,19 +435,27 @@ app.include_router(booking_router)
 friends_router = APIRouter()
 
 @friends_router.post("/api/friends", response_model=schemas.Friend)
-def add_friend(request: schemas.FriendAdd, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    friend = crud.add_friend(db=db, user_id=current_user.id, friend_phone=request.phone)
+def add_friend(request: schemas.FriendAdd, current_user_id: int = Depends(get_current_user_id)):
+    friend = run_write(crud.add_friend, user_id=current_user_id, friend_phone=request.phone)
     if friend is None:
         raise HTTPException(status_code=404, detail="User with this phone number not found, or you tried to add yourself.")
     return friend
 
 @friends_router.get("/api/friends", response_model=List[schemas.Friend])
-def get_friends(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return crud.get_friends(db=db, user_id=current_user.id)
+def get_friends(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    cached = conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    return json_response(dumps(crud.rows(db, crud.friend_rows_query(current_user_id))), response)
+
+@friends_router.get("/api/feed", response_model=schemas.Feed)
+def read_feed(response: Response, before: Optional[int] = None, limit: int = Query(crud.FEED_PAGE_SIZE, ge=1, le=100), current_user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    entries = crud.rows(db, crud.feed_rows_query(current_user_id, before, limit))
+    return json_response(dumps(crud.feed_page(entries, limit)), response)
 
 @friends_router.delete("/api/friends/{friend_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_friend(friend_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    crud.delete_friend(db, user_id=current_user.id, friend_id=friend_id)
+def delete_friend(friend_id: int, current_user_id: int = Depends(get_current_user_id)):
+    run_write(crud.delete_friend, user_id=current_user_id, friend_id=friend_id)
     return
 
 app.include_router(friends_router)
@@ -332,7 +464,7 @@ app.include_router(friends_router)
 debug_router = APIRouter()
 
 @debug_router.get("/api/debug/users")
-def debug_users(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def debug_users(current_user_id: int = Depends(get_current_user_id), db: Session = Depends(get_db)):
     """Debug endpoint to see all users and their phone numbers"""
     users = db.query(models.User).all()
     result = []
@@ -352,35 +484,101 @@ app.include_router(debug_router)
 shared_events_router = APIRouter()
 
 @shared_events_router.post("/api/events/{event_id}/collaborators", response_model=schemas.EventCollaborator)
-def add_collaborator_to_event(event_id: int, collaborator_data: schemas.EventCollaboratorAdd, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    collaborator = crud.add_collaborator_to_event(db, event_id=event_id, owner_id=current_user.id, collaborator_id=collaborator_data.collaborator_id)
+def add_collaborator_to_event(event_id: int, collaborator_data: schemas.EventCollaboratorAdd, current_user_id: int = Depends(get_current_user_id)):
+    collaborator = run_write(crud.add_collaborator_to_event, event_id=event_id, owner_id=current_user_id, collaborator_id=collaborator_data.collaborator_id)
     if not collaborator:
         raise HTTPException(status_code=404, detail="Event or Collaborator not found, or you are not the owner.")
     return collaborator
 
 @shared_events_router.delete("/api/events/{event_id}/collaborators/{collaborator_id}", status_code=status.HTTP_204_NO_CONTENT)
-def remove_collaborator_from_event(event_id: int, collaborator_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    result = crud.remove_collaborator_from_event(db, event_id=event_id, owner_id=current_user.id, collaborator_id=collaborator_id)
+def remove_collaborator_from_event(event_id: int, collaborator_id: int, current_user_id: int = Depends(get_current_user_id)):
+    result = run_write(crud.remove_collaborator_from_event, event_id=event_id, owner_id=current_user_id, collaborator_id=collaborator_id)
     if not result:
         raise HTTPException(status_code=404, detail="Collaborator not found or you are not the owner.")
     return
 
-@shared_events_router.get("/api/shared-events", response_model=List[schemas.Event])
-def get_shared_events(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    return crud.get_shared_events_for_user(db, user_id=current_user.id)
+@shared_events_router.get("/api/shared-events", response_model=List[schemas.EventView])
+def get_shared_events(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), fields=Depends(event_fields), db: Session = Depends(get_db)):
+    cached = conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    views = crud.get_event_views(db, crud.shared_event_ids(current_user_id), current_user_id, fields or crud.EVENT_VIEW_FIELDS)
+    return json_response(dumps(views), response)
 
 app.include_router(shared_events_router)
 
+# --- History Router ---
+history_router = APIRouter()
+
+@history_router.get("/api/history/items", response_model=List[schemas.ArchivedItem])
+def read_item_history(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    cached = conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    return crud.get_archived_items(db, user_id=current_user_id, skip=skip, limit=limit)
+
+@history_router.get("/api/history/events", response_model=List[schemas.ArchivedEvent])
+def read_event_history(request: Request, response: Response, current_user_id: int = Depends(get_current_user_id), skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    cached = conditional_get(request, response, db, current_user_id, ("user", current_user_id))
+    if cached:
+        return cached
+    return crud.get_archived_events(db, user_id=current_user_id, skip=skip, limit=limit)
+
+app.include_router(history_router)
+
+# --- Admin Router ---
+admin_router = APIRouter(dependencies=[Depends(require_admin)])
+
+@admin_router.post("/api/admin/maintenance")
+def run_maintenance(backup: bool = True, vacuum: bool = True, orphans: bool = True, full_vacuum: bool = False):
+    """Run database maintenance now and return its timed report."""
+    try:
+        return maintenance.run(do_backup=backup, do_vacuum=vacuum, do_orphans=orphans, full_vacuum=full_vacuum)
+    except maintenance.MaintenanceAlreadyRunning:
+        raise HTTPException(status_code=409, detail="Maintenance is already running")
+
+@admin_router.get("/api/admin/metrics")
+def read_metrics():
+    return {"caches": {
+        "event_views": crud.event_view_cache.stats(),
+        "principals": crud.principal_cache.stats(),
+        "categories": crud.category_cache.stats(),
+    }, "pubsub": crud.event_broker.stats(), "rate_limits": limits.stats()}
+
+@admin_router.get("/api/admin/maintenance")
+def read_maintenance_report():
+    return maintenance.last_report or {}
+
+app.include_router(admin_router)
+
+# --- Background jobs ---
+background_jobs = [
+    PeriodicTask("archiver", archive.ARCHIVE_INTERVAL_SECONDS, archive.run_once),
+    PeriodicTask("maintenance", maintenance.MAINTENANCE_INTERVAL_SECONDS, maintenance.run),
+    PeriodicTask("reminders", reminders.REMINDER_INTERVAL_SECONDS, reminders.run_once),
+]
+
+@app.on_event("startup")
+def start_background_jobs():
+    for job in background_jobs:
+        if job.interval > 0:
+            job.start()
+
+@app.on_event("shutdown")
+def stop_background_jobs():
+    for job in background_jobs:
+        job.stop()
+
 # --- Telegram Bot Webhook ---
 telegram_bot_router = APIRouter()
 
+# A plain def, run in the threadpool: scraping, the replies and run_write all block
 @telegram_bot_router.post("/telegram-webhook")
-async def telegram_webhook(request: Request, db: Session = Depends(get_db)):
+def telegram_webhook(update: dict = Body(...), db: Session = Depends(get_db)):
     bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
     if not bot_token:
         raise HTTPException(status_code=500, detail="Telegram Bot Token not configured.")
 
-    update = await request.json()
     print(f"Received Telegram update: {update}")
 
     message = update.get("message")
@@ -406,6 +604,22 @@ async def telegram_webhook(request: Request, db: Session = Depends(get_db)):
         comment = text.replace(url, "").strip()
         category_name = comment if comment else "General"
 
+        # Already saved: skip the scrape, only move it if a category was given
+        existing = crud.get_item_by_link(db, db_user.id, url)
+        if existing:
+            if comment:
+                run_write(crud.set_item_category, item_id=existing.id, category_name=category_name)
+                send_telegram_message(bot_token, chat_id, f"Wish \"{existing.title}\" is already saved, moved it to your {category_name} list.")
+            else:
+                send_telegram_message(bot_token, chat_id, f"Wish \"{existing.title}\" is already in your list.")
+            return {"status": "ok"}
+
+        # Telegram redelivers updates answered with an error, so the limit is a reply
+        wait = limits.retry_after("scrape", f"telegram:{from_user_id}")
+        if wait:
+            send_telegram_message(bot_token, chat_id, f"Too many links at once, send this one again in {wait} seconds.")
+            return {"status": "ok"}
+
         try:
             scraped_data = scrape_url(url)
             llm_extraction = scraped_data.get('data', {}).get('llm_extraction', {})
@@ -471,7 +685,7 @@ async def telegram_webhook(request: Request, db: Session = Depends(get_db)):
                 link=url,
                 category_name=category_name
             )
-            crud.create_item(db=db, item=item_data, user_id=db_user.id)
+            run_write(crud.create_item_unless_linked, item=item_data, user_id=db_user.id)
             send_telegram_message(bot_token, chat_id, f"Wish \"{item_data.title}\" added to your {category_name} list!")
         except Exception as e:
             print(f"Error processing Telegram message: {e}")
@@ -481,11 +695,6 @@ async def telegram_webhook(request: Request, db: Session = Depends(get_db)):
 
     return {"status": "ok"}
 
-def send_telegram_message(bot_token: str, chat_id: int, text: str):
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text}
-    requests.post(url, json=payload)
-
 app.include_router(telegram_bot_router)
 
 # --- Root ---
@@ -0,0 +1,216 @@
+"""Database maintenance: online backup, incremental vacuum and orphan cleanup.
+
+- backup: SQLite online backup API, BACKUP_PAGES_PER_STEP pages at a time
+  with a pause in between, into BACKUP_DIR; the newest BACKUP_KEEP files are
+  kept. Readers and writers carry on while it runs.
+- vacuum: returns free pages to the filesystem with incremental_vacuum, in
+  write transactions of VACUUM_PAGES_PER_STEP pages through run_write.
+- orphans: deletes event_items, bookings, collaborators and event_stats whose
+  item or event is gone, expired refresh tokens, and feed activities about
+  items older than FEED_RETENTION_DAYS, ORPHAN_BATCH_SIZE rows per
+  transaction.
+
+Each step is timed and the report of the last run is kept. main.py runs
+this every MAINTENANCE_INTERVAL_SECONDS and from POST /api/admin/maintenance;
+run it once with `python maintenance.py [--full-vacuum]`.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, exists, select, tuple_
+
+import models
+from database import SQLITE_PRAGMAS, engine as default_engine, run_write
+
+logger = logging.getLogger(__name__)
+
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "86400")) # 0 disables the schedule
+BACKUP_DIR = os.getenv("BACKUP_DIR", "./data/backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+BACKUP_PAGES_PER_STEP = int(os.getenv("BACKUP_PAGES_PER_STEP", "256"))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", "0.01"))
+# Writes by other connections restart a stepped backup; after this many
+# restarts the rest is copied in one step (a read transaction, which does
+# not block writers in WAL mode)
+BACKUP_MAX_RESTARTS = 3
+VACUUM_PAGES_PER_STEP = int(os.getenv("VACUUM_PAGES_PER_STEP", "500"))
+ORPHAN_BATCH_SIZE = int(os.getenv("ORPHAN_BATCH_SIZE", "1000"))
+FEED_RETENTION_DAYS = int(os.getenv("FEED_RETENTION_DAYS", "90"))
+
+# Report of the most recent run, served by GET /api/admin/maintenance
+last_report = None
+_running = threading.Lock()
+
+
+class MaintenanceAlreadyRunning(Exception):
+    pass
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _connect(engine):
+    """Plain sqlite3 connection to the engine's file, outside the pool and its BEGIN hook."""
+    return sqlite3.connect(
+        engine.url.database, isolation_level=None, timeout=SQLITE_PRAGMAS["busy_timeout"] / 1000
+    )
+
+
+def backup(engine=default_engine, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    os.makedirs(backup_dir, exist_ok=True)
+    target = os.path.join(backup_dir, f"wishspace-{datetime.now():%Y%m%d-%H%M%S}.db")
+    partial = target + ".partial"
+    source = _connect(engine)
+    destination = sqlite3.connect(partial)
+    progress = {"remaining": None, "restarts": 0, "pages": 0}
+
+    def _progress(status, remaining, total):
+        if progress["remaining"] is not None and remaining > progress["remaining"]:
+            progress["restarts"] += 1
+            if progress["restarts"] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        progress["remaining"], progress["pages"] = remaining, total
+        # Room for other connections between steps
+        time.sleep(BACKUP_STEP_SLEEP)
+
+    try:
+        try:
+            source.backup(destination, pages=BACKUP_PAGES_PER_STEP, progress=_progress)
+        except _BackupRestarted:
+            source.backup(destination)
+        destination.execute("PRAGMA journal_mode=DELETE") # a single self-contained file
+    finally:
+        destination.close()
+        source.close()
+    os.replace(partial, target)
+
+    backups = sorted(name for name in os.listdir(backup_dir) if name.startswith("wishspace-") and name.endswith(".db"))
+    for name in backups[:-keep] if keep else []:
+        os.remove(os.path.join(backup_dir, name))
+    return {"path": target, "pages": progress["pages"], "restarts": progress["restarts"],
+            "bytes": os.path.getsize(target)}
+
+
+def _vacuum_step(db, pages):
+    conn = db.connection()
+    # Python's sqlite3 steps a PRAGMA once, which frees a single page, so
+    # each page is its own statement
+    for _ in range(pages):
+        conn.exec_driver_sql("PRAGMA incremental_vacuum(1)")
+    return conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+
+def vacuum(engine=default_engine, write=run_write, full=False):
+    conn = _connect(engine)
+    try:
+        mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if mode != 2:
+            if not full:
+                logger.warning("auto_vacuum is not INCREMENTAL on this database; run a full vacuum once to enable it")
+                return {"mode": mode, "free_pages": free_pages, "freed": 0}
+            # One-off conversion of a file created before auto_vacuum was
+            # set. VACUUM rewrites the file and locks out writers meanwhile.
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            return {"mode": 2, "free_pages": free_pages, "freed": free_pages, "full": True}
+    finally:
+        conn.close()
+
+    remaining = free_pages
+    while remaining:
+        left = write(_vacuum_step, min(remaining, VACUUM_PAGES_PER_STEP))
+        if left >= remaining: # nothing freed (or deletes keep adding pages)
+            break
+        remaining = left
+    return {"mode": mode, "free_pages": free_pages, "freed": free_pages - remaining}
+
+
+# (name, model, columns identifying a row, condition for an orphan or a
+# callable building it at run time)
+ORPHANS = [
+    ("event_items", models.EventItem, (models.EventItem.event_id, models.EventItem.item_id),
+     ~exists().where(models.Item.id == models.EventItem.item_id)
+     | ~exists().where(models.Event.id == models.EventItem.event_id)),
+    ("bookings", models.Booking, (models.Booking.id,),
+     ~exists().where(models.Item.id == models.Booking.item_id)),
+    ("event_collaborators", models.EventCollaborator,
+     (models.EventCollaborator.event_id, models.EventCollaborator.user_id),
+     ~exists().where(models.Event.id == models.EventCollaborator.event_id)),
+    ("event_stats", models.EventStats, (models.EventStats.event_id,),
+     ~exists().where(models.Event.id == models.EventStats.event_id)),
+    ("refresh_tokens", models.RefreshToken, (models.RefreshToken.id,),
+     lambda: models.RefreshToken.expires_at < datetime.utcnow()),
+    # Events stay in the feed until archive.py moves them
+    ("activities", models.Activity, (models.Activity.id,),
+     lambda: (models.Activity.kind == "item")
+     & (models.Activity.created_at < datetime.utcnow() - timedelta(days=FEED_RETENTION_DAYS))),
+    ("feed_entries", models.FeedEntry, (models.FeedEntry.user_id, models.FeedEntry.activity_id),
+     ~exists().where(models.Activity.id == models.FeedEntry.activity_id)),
+]
+
+
+def _delete_orphans(db, model, key, condition, limit):
+    keys = db.execute(select(*key).where(condition).limit(limit)).all()
+    if keys:
+        db.execute(delete(model.__table__).where(tuple_(*key).in_(keys)))
+    return len(keys)
+
+
+def clean_orphans(write=run_write, batch_size=ORPHAN_BATCH_SIZE):
+    deleted = {}
+    for name, model, key, condition in ORPHANS:
+        if callable(condition):
+            condition = condition()
+        deleted[name] = 0
+        while True:
+            count = write(_delete_orphans, model, key, condition, batch_size)
+            deleted[name] += count
+            if count < batch_size:
+                break
+    return deleted
+
+
+def run(engine=default_engine, write=run_write, backup_dir=BACKUP_DIR, do_backup=True,
+        do_vacuum=True, do_orphans=True, full_vacuum=False):
+    """Run the selected steps and return their timed report. One run at a time."""
+    global last_report
+    if not _running.acquire(blocking=False):
+        raise MaintenanceAlreadyRunning()
+    try:
+        report = {"started_at": datetime.now().isoformat()}
+        # Orphans first, so the vacuum returns their pages and the backup is clean
+        if do_orphans:
+            report["orphans"] = _timed(lambda: {"deleted": clean_orphans(write)})
+        if engine.dialect.name == "sqlite":
+            if do_vacuum:
+                report["vacuum"] = _timed(vacuum, engine, write, full_vacuum)
+            if do_backup:
+                report["backup"] = _timed(backup, engine, backup_dir)
+        logger.info(f"Maintenance finished: {report}")
+        last_report = report
+        return report
+    finally:
+        _running.release()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--full-vacuum", action="store_true",
+                        help="convert an older database to incremental auto_vacuum (blocks writers)")
+    args = parser.parse_args()
+    run(full_vacuum=args.full_vacuum)
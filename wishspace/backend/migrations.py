@@ -0,0 +1,213 @@
+"""Versioned schema migrations.
+
+`create_all` only creates missing tables, so indexes and constraints for
+existing deployments are added here as numbered migrations, applied once and
+recorded in `schema_migrations`. Run with `python migrations.py`.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+
+import crud, models, stats
+from database import engine as default_engine
+
+logger = logging.getLogger(__name__)
+
+
+def _0001_hot_lookup_indexes(conn):
+    # Collapse duplicate categories before the (user_id, name) unique index is
+    # built: items are moved to the oldest category of each group.
+    conn.execute(text("""
+        UPDATE items SET category_id = (
+            SELECT MIN(dup.id) FROM categories cur
+            JOIN categories dup ON dup.user_id = cur.user_id AND dup.name = cur.name
+            WHERE cur.id = items.category_id
+        )
+        WHERE category_id IN (
+            SELECT c.id FROM categories c WHERE EXISTS (
+                SELECT 1 FROM categories d
+                WHERE d.user_id = c.user_id AND d.name = c.name AND d.id < c.id
+            )
+        )
+    """))
+    conn.execute(text("""
+        DELETE FROM categories WHERE EXISTS (
+            SELECT 1 FROM categories d
+            WHERE d.user_id = categories.user_id AND d.name = categories.name AND d.id < categories.id
+        )
+    """))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_categories_user_id_name ON categories (user_id, name)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_items_user_id_created_at ON items (user_id, created_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_events_user_id ON events (user_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_bookings_item_id ON bookings (item_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_event_items_item_id ON event_items (item_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_friends_friend_id ON friends (friend_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_event_collaborators_user_id ON event_collaborators (user_id)"))
+
+
+def _0002_unique_booking_per_item(conn):
+    # Keep the earliest booking of each item, then make the index unique so
+    # create_booking can rely on ON CONFLICT (item_id).
+    conn.execute(text("""
+        DELETE FROM bookings WHERE EXISTS (
+            SELECT 1 FROM bookings earlier
+            WHERE earlier.item_id = bookings.item_id AND earlier.id < bookings.id
+        )
+    """))
+    conn.execute(text("DROP INDEX IF EXISTS ix_bookings_item_id"))
+    conn.execute(text("CREATE UNIQUE INDEX ix_bookings_item_id ON bookings (item_id)"))
+
+
+def _fold(column):
+    # unicode61 folds case but keeps "ё" distinct from "е"; Russian text mixes
+    # both spellings, so the index stores "е" (crud folds queries the same way).
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _fts_values(row):
+    return (
+        f"{row}.id, 'u' || {row}.user_id, {_fold(f'{row}.title')}, {_fold(f'{row}.description')}, "
+        f"{_fold(f'{row}.note')}, (SELECT {_fold('name')} FROM categories WHERE id = {row}.category_id)"
+    )
+
+
+def _0003_item_search_index(conn):
+    # FTS5 index over items, SQLite only (crud.search_items falls back to
+    # LIKE elsewhere). rowid is the item id; `owner` holds a "u<user_id>"
+    # token so per-user searches intersect posting lists instead of
+    # filtering every match. Triggers keep it in sync with items and with
+    # category renames.
+    if conn.dialect.name != "sqlite":
+        return
+    conn.execute(text("""
+        CREATE VIRTUAL TABLE items_fts USING fts5(
+            owner, title, description, note, category_name,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """))
+    # ORDER BY rank uses these column weights: title first, owner ignored
+    conn.execute(text("INSERT INTO items_fts (items_fts, rank) VALUES ('rank', 'bm25(0.0, 10.0, 2.0, 4.0, 5.0)')"))
+    columns = "rowid, owner, title, description, note, category_name"
+    conn.execute(text(f"""
+        CREATE TRIGGER items_fts_insert AFTER INSERT ON items BEGIN
+            INSERT INTO items_fts ({columns}) VALUES ({_fts_values("new")});
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER items_fts_update AFTER UPDATE OF title, description, note, category_id, user_id ON items BEGIN
+            DELETE FROM items_fts WHERE rowid = old.id;
+            INSERT INTO items_fts ({columns}) VALUES ({_fts_values("new")});
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER items_fts_delete AFTER DELETE ON items BEGIN
+            DELETE FROM items_fts WHERE rowid = old.id;
+        END
+    """))
+    # The category upsert rewrites the name on every conflict, so only real renames reindex
+    conn.execute(text(f"""
+        CREATE TRIGGER items_fts_category_rename AFTER UPDATE OF name ON categories
+        WHEN old.name IS NOT new.name BEGIN
+            UPDATE items_fts SET category_name = {_fold("new.name")}
+            WHERE rowid IN (SELECT id FROM items WHERE category_id = new.id);
+        END
+    """))
+    conn.execute(text(f"INSERT INTO items_fts ({columns}) SELECT {_fts_values('items')} FROM items"))
+
+
+def _0004_item_canonical_link(conn):
+    # Fresh databases get the column from create_all; older ones need it
+    # added and backfilled. Canonicalization is Python, so rows are read and
+    # updated in id-ordered batches.
+    if "canonical_link" not in {c["name"] for c in inspect(conn).get_columns("items")}:
+        conn.execute(text("ALTER TABLE items ADD COLUMN canonical_link VARCHAR"))
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, link FROM items WHERE id > :last_id AND link IS NOT NULL ORDER BY id LIMIT 1000"
+        ), {"last_id": last_id}).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            text("UPDATE items SET canonical_link = :canonical_link WHERE id = :id"),
+            [{"id": row.id, "canonical_link": crud.canonicalize_link(row.link)} for row in rows],
+        )
+        last_id = rows[-1].id
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_items_user_id_canonical_link ON items (user_id, canonical_link)"))
+
+
+def _0005_wishlist_aggregates(conn):
+    # create_all has made the tables; fill them from the existing items
+    stats.rebuild(conn)
+
+
+def _0006_archive_lookup_indexes(conn):
+    # The archive tables come from create_all; the archiver selects hot rows
+    # by status and by date
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_items_status ON items (status)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_events_date ON events (date)"))
+
+
+def _0007_friends_feed(conn):
+    # create_all has made the tables; record the events and event items that
+    # exist, oldest first so activity ids keep their order, then give every
+    # user their friends' activities
+    conn.execute(text(
+        "INSERT INTO activities (user_id, kind, event_id, title, date) "
+        "SELECT user_id, 'event', id, title, date FROM events ORDER BY id"
+    ))
+    conn.execute(text(
+        "INSERT INTO activities (user_id, kind, event_id, item_id, title, price, date) "
+        "SELECT e.user_id, 'item', e.id, i.id, i.title, i.price, e.date FROM event_items ei "
+        "JOIN events e ON e.id = ei.event_id JOIN items i ON i.id = ei.item_id ORDER BY i.created_at, i.id"
+    ))
+    conn.execute(text(
+        "INSERT INTO feed_entries (user_id, activity_id) "
+        "SELECT f.friend_id, a.id FROM friends f JOIN activities a ON a.user_id = f.user_id"
+    ))
+
+
+# (version, name, function). Never edit or reorder an applied migration,
+# append a new one instead.
+MIGRATIONS = [
+    (1, "hot lookup indexes", _0001_hot_lookup_indexes),
+    (2, "unique booking per item", _0002_unique_booking_per_item),
+    (3, "item search index", _0003_item_search_index),
+    (4, "item canonical link", _0004_item_canonical_link),
+    (5, "wishlist aggregates", _0005_wishlist_aggregates),
+    (6, "archive lookup indexes", _0006_archive_lookup_indexes),
+    (7, "friends feed", _0007_friends_feed),
+]
+
+
+def get_applied_versions(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, "
+            "name VARCHAR NOT NULL, "
+            "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def upgrade(engine=default_engine):
+    """Create missing tables, then apply every pending migration in its own transaction."""
+    models.Base.metadata.create_all(bind=engine)
+    applied = get_applied_versions(engine)
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info(f"Applying migration {version:04d}: {name}")
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+                {"version": version, "name": name},
+            )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade()
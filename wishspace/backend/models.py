@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime, Float, Enum, Boolean
+from sqlalchemy import create_engine, table, column, Column, Integer, BigInteger, String, ForeignKey, DateTime, Float, Enum, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -14,7 +14,7 @@ class StatusEnum(str, enum.Enum):
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
-    telegram_id = Column(Integer, unique=True, index=True)
+    telegram_id = Column(BigInteger, unique=True, index=True) # Telegram ids exceed 32 bits
     phone = Column(String, unique=True, index=True, nullable=True)
     name = Column(String)
     avatar_url = Column(String, nullable=True)
@@ -23,6 +23,9 @@ class User(Base):
     categories = relationship("Category", back_populates="owner")
     items = relationship("Item", back_populates="owner")
 
+    # Fetch server defaults (created_at) with RETURNING on flush instead of a refresh
+    __mapper_args__ = {"eager_defaults": True}
+
 class Category(Base):
     __tablename__ = "categories"
     id = Column(Integer, primary_key=True, index=True)
@@ -30,6 +33,10 @@ class Category(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="categories")
+
+    __table_args__ = (
+        Index("ix_categories_user_id_name", "user_id", "name", unique=True),
+    )
     items = relationship("Item", back_populates="category")
 
 class Item(Base):
@@ -39,6 +46,7 @@ class Item(Base):
     description = Column(String, nullable=True)
     image_url = Column(String, nullable=True)
     link = Column(String, nullable=True)
+    canonical_link = Column(String, nullable=True) # crud.canonicalize_link(link), for duplicate detection
     price = Column(Float, nullable=True)
     note = Column(String, nullable=True)
     status = Column(Enum(StatusEnum), default=StatusEnum.favorite)
@@ -50,6 +58,17 @@ class Item(Base):
     owner = relationship("User", back_populates="items")
     category = relationship("Category", back_populates="items")
 
+    __table_args__ = (
+        Index("ix_items_user_id_created_at", "user_id", "created_at"),
+        Index("ix_items_user_id_canonical_link", "user_id", "canonical_link"),
+        Index("ix_items_status", "status"),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+
+# FTS5 index over items (SQLite only), created and kept in sync by migration
+# 0003. Not part of the metadata, so create_all leaves it alone.
+items_fts = table("items_fts", column("rowid"), column("owner"))
+
 class Event(Base):
     __tablename__ = "events"
     id = Column(Integer, primary_key=True, index=True)
@@ -63,11 +82,20 @@ class Event(Base):
     items = relationship("Item", secondary="event_items")
     collaborators = relationship("EventCollaborator", back_populates="event")
 
+    __table_args__ = (
+        Index("ix_events_user_id", "user_id"),
+        Index("ix_events_date", "date"),
+    )
+
 class EventItem(Base):
     __tablename__ = "event_items"
     event_id = Column(Integer, ForeignKey("events.id"), primary_key=True)
     item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
 
+    __table_args__ = (
+        Index("ix_event_items_item_id", "item_id"),
+    )
+
 class EventCollaborator(Base):
     __tablename__ = "event_collaborators"
     event_id = Column(Integer, ForeignKey("events.id"), primary_key=True)
@@ -76,11 +104,19 @@ class EventCollaborator(Base):
     event = relationship("Event", back_populates="collaborators")
     user = relationship("User")
 
+    __table_args__ = (
+        Index("ix_event_collaborators_user_id", "user_id"),
+    )
+
 class Friend(Base):
     __tablename__ = "friends"
     user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
     friend_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
 
+    __table_args__ = (
+        Index("ix_friends_friend_id", "friend_id"),
+    )
+
 class Booking(Base):
     __tablename__ = "bookings"
     id = Column(Integer, primary_key=True, index=True)
@@ -90,3 +126,188 @@ class Booking(Base):
 
     item = relationship("Item")
     booked_by = relationship("User")
+
+    __table_args__ = (
+        Index("ix_bookings_item_id", "item_id", unique=True),
+    )
+    __mapper_args__ = {"eager_defaults": True}
+
+class RefreshToken(Base):
+    """One link of a refresh-token chain. Only the SHA-256 of the token is stored.
+
+    Every refresh marks the presented token used and issues the next one in
+    the same family; presenting a used token again revokes the whole family.
+    """
+    __tablename__ = "refresh_tokens"
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), unique=True, nullable=False)
+    family_id = Column(String(32), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime, nullable=False) # naive UTC, like the JWT exp
+    used_at = Column(DateTime, nullable=True)
+    revoked_at = Column(DateTime, nullable=True)
+
+class Version(Base):
+    """Change counter behind the ETags of GET responses (see services/etags.py).
+
+    ("user", id) covers everything listed for that user, ("event", id) one
+    event page. crud bumps them in the same transaction as the change.
+    """
+    __tablename__ = "versions"
+    scope = Column(String(16), primary_key=True)
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# Aggregates maintained by crud alongside every item, booking and event
+# change, so summaries never scan items. stats.py checks and rebuilds them.
+NO_CATEGORY = 0 # category_id of uncategorized items in ItemStats (part of the primary key)
+
+class ItemStats(Base):
+    __tablename__ = "item_stats"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    status = Column(Enum(StatusEnum), primary_key=True)
+    item_count = Column(Integer, nullable=False, default=0)
+    price_total = Column(Float, nullable=False, default=0)
+
+class EventStats(Base):
+    __tablename__ = "event_stats"
+    event_id = Column(Integer, ForeignKey("events.id"), primary_key=True)
+    item_count = Column(Integer, nullable=False, default=0)
+    price_total = Column(Float, nullable=False, default=0)
+    booked_count = Column(Integer, nullable=False, default=0)
+
+# Friends feed: an Activity per thing a user did that their friends see
+# (an event created, an item put on an event), copied to every friend's feed
+# as a FeedEntry when it happens, so reading a feed is one key range.
+# crud writes both alongside the change and keeps title, price and date in
+# step with the item or event.
+class Activity(Base):
+    __tablename__ = "activities"
+    id = Column(Integer, primary_key=True) # increasing, the feed's keyset cursor
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String(8), nullable=False) # "event" or "item"
+    event_id = Column(Integer, nullable=False)
+    item_id = Column(Integer, nullable=True)
+    title = Column(String)
+    price = Column(Float, nullable=True)
+    date = Column(DateTime, nullable=True) # the event's date
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_activities_user_id_id", "user_id", "id"),
+        Index("ix_activities_event_id", "event_id"),
+        Index("ix_activities_item_id", "item_id"),
+    )
+
+class FeedEntry(Base):
+    __tablename__ = "feed_entries"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True) # whose feed
+    activity_id = Column(Integer, ForeignKey("activities.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_feed_entries_activity_id", "activity_id"),
+        {"sqlite_with_rowid": False}, # the primary key is the table: no rowid lookups
+    )
+
+class JobCheckpoint(Base):
+    """How far an incremental background job has got, so the next run
+    starts there (see reminders.py). `position` is the job's own format."""
+    __tablename__ = "job_checkpoints"
+    name = Column(String(32), primary_key=True)
+    position = Column(String, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class OutboxMessage(Base):
+    """A bot message waiting to be sent by outbox.py. Messages of one kind to
+    one chat are coalesced: enqueueing appends a line to the pending text."""
+    __tablename__ = "telegram_outbox"
+    chat_id = Column(BigInteger, primary_key=True)
+    kind = Column(String(16), primary_key=True)
+    text = Column(String, nullable=False)
+    version = Column(Integer, nullable=False, default=1) # bumped by every append
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False) # naive UTC; a claim moves it forward
+
+    __table_args__ = (
+        Index("ix_telegram_outbox_next_attempt_at", "next_attempt_at"),
+    )
+
+# Cold storage for received items and past events, moved here by archive.py.
+# Rows keep their original ids, but archive_id is the key: SQLite hands out
+# the id of a deleted newest row again, so an id can be archived twice.
+class ArchivedItem(Base):
+    __tablename__ = "archived_items"
+    archive_id = Column(Integer, primary_key=True)
+    id = Column(Integer, nullable=False)
+    title = Column(String)
+    description = Column(String, nullable=True)
+    image_url = Column(String, nullable=True)
+    link = Column(String, nullable=True)
+    canonical_link = Column(String, nullable=True)
+    price = Column(Float, nullable=True)
+    note = Column(String, nullable=True)
+    status = Column(Enum(StatusEnum))
+    created_at = Column(DateTime(timezone=True))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_archived_items_user_id_archived_at", "user_id", "archived_at"),
+        Index("ix_archived_items_id", "id"),
+    )
+
+class ArchivedBooking(Base):
+    __tablename__ = "archived_bookings"
+    archive_id = Column(Integer, primary_key=True)
+    id = Column(Integer, nullable=False)
+    item_id = Column(Integer)
+    booked_by_user_id = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_archived_bookings_item_id", "item_id"),
+    )
+
+class ArchivedEvent(Base):
+    __tablename__ = "archived_events"
+    archive_id = Column(Integer, primary_key=True)
+    id = Column(Integer, nullable=False)
+    title = Column(String)
+    date = Column(DateTime, nullable=True)
+    description = Column(String, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    is_shared = Column(Boolean, default=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_archived_events_user_id_archived_at", "user_id", "archived_at"),
+        Index("ix_archived_events_id", "id"),
+    )
+
+# Event membership of archived items and of archived events; item_id may
+# point at items or archived_items.
+class ArchivedEventItem(Base):
+    __tablename__ = "archived_event_items"
+    archive_id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, nullable=False)
+    item_id = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ix_archived_event_items_event_id", "event_id"),
+        Index("ix_archived_event_items_item_id", "item_id"),
+    )
+
+class ArchivedEventCollaborator(Base):
+    __tablename__ = "archived_event_collaborators"
+    archive_id = Column(Integer, primary_key=True)
+    event_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (
+        Index("ix_archived_event_collaborators_event_id", "event_id"),
+        Index("ix_archived_event_collaborators_user_id", "user_id"),
+    )
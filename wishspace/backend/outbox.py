@@ -0,0 +1,106 @@
+"""Sends the bot messages queued in telegram_outbox (see crud.enqueue_telegram_messages).
+
+Due messages are claimed OUTBOX_BATCH_SIZE at a time in a write transaction,
+which leases them for OUTBOX_LEASE_SECONDS so no other worker sends them
+too, then sent outside any transaction at most TELEGRAM_MESSAGES_PER_SECOND,
+and the outcome is written back:
+
+- sent: removed, unless lines were appended meanwhile, which stay queued
+- 429: this and the rest of the batch wait the retry_after Telegram asks for
+- 400/403 (chat gone, bot blocked): dropped
+- anything else: retried after OUTBOX_RETRY_SECONDS, dropped after
+  OUTBOX_MAX_ATTEMPTS attempts
+
+Nothing is sent without TELEGRAM_BOT_TOKEN.
+"""
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import crud
+from database import run_write
+from services.telegram import retry_after, send_telegram_message, truncate_lines
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_RETRY_SECONDS = int(os.getenv("OUTBOX_RETRY_SECONDS", "600"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+TELEGRAM_MESSAGES_PER_SECOND = float(os.getenv("TELEGRAM_MESSAGES_PER_SECOND", "20")) # the Bot API allows about 30
+
+# First line of each kind of message
+HEADERS = {
+    "reminders": "Coming up for your friends:",
+}
+
+
+def render(message) -> str:
+    header = HEADERS.get(message["kind"])
+    lines = ([header] if header else []) + message["text"].split("\n")
+    return truncate_lines(lines)
+
+
+class Pacer:
+    """Spaces calls at least 1/rate seconds apart."""
+
+    def __init__(self, rate: float, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1 / rate
+        self.clock, self.sleep = clock, sleep
+        self.next_at = None
+
+    def wait(self):
+        now = self.clock()
+        if self.next_at is not None and self.next_at > now:
+            self.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+
+def _send_batch(messages, send, pacer):
+    sent, dropped, retry = [], [], []
+    for n, message in enumerate(messages):
+        pacer.wait()
+        try:
+            response = send(message["chat_id"], render(message))
+        except Exception as e:
+            logger.warning(f"Sending to {message['chat_id']} failed: {e}")
+            response = None
+        status = response.status_code if response is not None else None
+        if status == 200:
+            sent.append(message)
+        elif status == 429:
+            until = datetime.utcnow() + timedelta(seconds=retry_after(response))
+            retry += [(m, until, False) for m in messages[n:]]
+            return sent, dropped, retry, True
+        elif status in (400, 403) or message["attempts"] + 1 >= OUTBOX_MAX_ATTEMPTS:
+            dropped.append(message)
+        else:
+            retry.append((message, datetime.utcnow() + timedelta(seconds=OUTBOX_RETRY_SECONDS), True))
+    return sent, dropped, retry, False
+
+
+def deliver(send=None, write=run_write, batch_size=OUTBOX_BATCH_SIZE, pacer=None):
+    """Send every due message. Returns counts of sent, dropped and retried messages."""
+    if send is None:
+        bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
+        if not bot_token:
+            return {"sent": 0, "dropped": 0, "retried": 0}
+        send = lambda chat_id, text: send_telegram_message(bot_token, chat_id, text)
+    pacer = pacer or Pacer(TELEGRAM_MESSAGES_PER_SECOND)
+    counts = {"sent": 0, "dropped": 0, "retried": 0}
+    while True:
+        messages = write(crud.claim_telegram_messages, batch_size, OUTBOX_LEASE_SECONDS)
+        if not messages:
+            break
+        sent, dropped, retry, rate_limited = _send_batch(messages, send, pacer)
+        write(crud.settle_telegram_messages, sent, dropped, retry)
+        counts["sent"] += len(sent)
+        counts["dropped"] += len(dropped)
+        counts["retried"] += len(retry)
+        if rate_limited or len(messages) < batch_size:
+            break
+    if any(counts.values()):
+        logger.info(f"Outbox: {counts}")
+    return counts
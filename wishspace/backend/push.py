@@ -0,0 +1,68 @@
+"""Server push of event changes over Server-Sent Events.
+
+A client viewing events opens GET /api/stream?event_id=1&event_id=2 and
+receives one `data: {json}` message per change instead of refetching: an
+item added, updated, removed or booked, an event updated or deleted, a
+collaborator added or removed. crud publishes them through
+crud.event_broker once the change commits (see crud.publish_events).
+
+Bookings only reach guests, as in the rendered views. {"type": "resync"}
+means messages were dropped and the client should refetch.
+"""
+import json
+import os
+
+from starlette.responses import StreamingResponse
+
+import crud
+from database import ReadSessionLocal
+
+STREAM_MAX_EVENTS = int(os.getenv("STREAM_MAX_EVENTS", "50"))
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))
+
+
+def channels_for(owners: dict, viewer_id: int):
+    """Channels for the visible events ({event id: owner id}) and the viewer's own."""
+    channels = [crud.user_channel(viewer_id)]
+    for event_id, owner_id in owners.items():
+        channels.append(crud.event_channel(event_id))
+        if crud.viewer_class(owner_id, viewer_id) == "guest":
+            channels.append(crud.event_channel(event_id, "guest"))
+    return channels
+
+
+def visible_channels(event_ids, viewer_id: int):
+    """Channels to subscribe to, or None if any of the events is not visible.
+
+    Uses its own read session, so none is held open for the stream.
+    """
+    event_ids = set(event_ids)
+    if not event_ids:
+        return channels_for({}, viewer_id)
+    db = ReadSessionLocal()
+    try:
+        owners = crud.visible_event_owners(db, event_ids, viewer_id)
+    finally:
+        db.close()
+    return channels_for(owners, viewer_id) if len(owners) == len(event_ids) else None
+
+
+async def _messages(request, subscription):
+    try:
+        yield ": connected\n\n"
+        while not await request.is_disconnected():
+            message = await subscription.get(STREAM_KEEPALIVE_SECONDS)
+            # A comment line keeps proxies from closing an idle stream
+            yield ": keepalive\n\n" if message is None else f"data: {json.dumps(message)}\n\n"
+    finally:
+        subscription.close()
+
+
+def stream_response(request, channels) -> StreamingResponse:
+    """Subscribe to `channels` and stream their messages until the client goes away."""
+    subscription = crud.event_broker.subscribe(channels)
+    return StreamingResponse(
+        _messages(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
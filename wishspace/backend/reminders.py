@@ -0,0 +1,102 @@
+"""Reminds users about their friends' upcoming events through the bot.
+
+Events are taken in (date, id) order from where the last run stopped, kept
+in job_checkpoints, up to REMINDER_DAYS_AHEAD days from now: each event is
+seen once, when it comes into range, and a run only reads what came into
+range since the previous one. Every batch of REMINDER_BATCH_SIZE events is
+one write transaction that joins the events to the owners' friends, adds
+one line per reminder to the friend's pending digest in the Telegram
+outbox and moves the checkpoint, so a user with many friends gets a single
+message. outbox.py sends the digests.
+
+An event created or moved into the part of the range that has already been
+passed is not reminded about. main.py runs this every
+REMINDER_INTERVAL_SECONDS; run it once with `python reminders.py`.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import aliased
+
+import crud, models, outbox
+from database import run_write
+
+logger = logging.getLogger(__name__)
+
+REMINDER_DAYS_AHEAD = int(os.getenv("REMINDER_DAYS_AHEAD", "3"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "500"))
+REMINDER_INTERVAL_SECONDS = int(os.getenv("REMINDER_INTERVAL_SECONDS", "900")) # 0 disables the background job
+
+CHECKPOINT = "event_reminders"
+KIND = "reminders" # outbox kind, see outbox.HEADERS
+
+
+def _load_position(db, now):
+    """(date, id) of the last event handled; never before now, past events are not reminded about"""
+    position = crud.get_checkpoint(db, CHECKPOINT)
+    if position:
+        date, event_id = position.rsplit("|", 1)
+        date, event_id = datetime.fromisoformat(date), int(event_id)
+        if date >= now:
+            return date, event_id
+    return now, 0
+
+
+def reminder_line(owner_name, title, date) -> str:
+    return f"{owner_name}: {title}, {date:%d.%m %H:%M}" if date.hour or date.minute else f"{owner_name}: {title}, {date:%d.%m}"
+
+
+def remind_batch(db, now, limit):
+    """Queue reminders for the next `limit` events in range. Returns how many events were read."""
+    after_date, after_id = _load_position(db, now)
+    events = db.execute(
+        select(models.Event.id, models.Event.date).where(
+            models.Event.date >= after_date,
+            models.Event.date <= now + timedelta(days=REMINDER_DAYS_AHEAD),
+            or_(models.Event.date > after_date, models.Event.id > after_id),
+        ).order_by(models.Event.date, models.Event.id).limit(limit)
+    ).all()
+    if not events:
+        return 0
+
+    owner, friend = aliased(models.User), aliased(models.User)
+    reminders = db.execute(
+        select(friend.telegram_id, owner.name, models.Event.title, models.Event.date)
+        .select_from(models.Event)
+        .join(owner, owner.id == models.Event.user_id)
+        .join(models.Friend, models.Friend.user_id == models.Event.user_id)
+        .join(friend, and_(friend.id == models.Friend.friend_id, friend.telegram_id.is_not(None)))
+        .where(models.Event.id.in_([event.id for event in events]))
+        .order_by(models.Event.date, models.Event.id)
+    ).all()
+    digests = {}
+    for telegram_id, owner_name, title, date in reminders:
+        digests.setdefault(telegram_id, []).append(reminder_line(owner_name, title, date))
+    crud.enqueue_telegram_messages(db, KIND, {chat_id: "\n".join(lines) for chat_id, lines in digests.items()})
+
+    last = events[-1]
+    crud.set_checkpoint(db, CHECKPOINT, f"{last.date.isoformat()}|{last.id}")
+    return len(events)
+
+
+def run_once(batch_size=REMINDER_BATCH_SIZE, write=run_write, now=None, deliver=True):
+    """Queue everything that came into range, then send what the outbox has. Returns the events read."""
+    now = now or datetime.utcnow()
+    read = 0
+    while True:
+        count = write(remind_batch, now, batch_size)
+        read += count
+        if count < batch_size:
+            break
+    if read:
+        logger.info(f"Queued reminders for {read} events")
+    if deliver:
+        outbox.deliver(write=write)
+    return read
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_once()
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field, HttpUrl, constr
-from typing import Optional, List
+from pydantic import BaseModel, Field, HttpUrl, conlist, constr
+from typing import Optional, List, Dict, Literal
 from datetime import datetime
 
 # Auth Schemas
@@ -9,6 +9,12 @@ class TelegramAuthData(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    expires_in: Optional[int] = None # seconds
+    refresh_token: Optional[str] = None
+    bootstrap: Optional["Bootstrap"] = None # with ?bootstrap=true
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 # Booking Schemas
 class Booking(BaseModel):
@@ -42,6 +48,37 @@ class Item(ItemBase):
     class Config:
         from_attributes = True
 
+# Bulk item mutations: one transaction for all ids, a result per id
+BULK_MAX_ITEMS = 500
+
+class BulkItemIds(BaseModel):
+    ids: conlist(int, min_length=1, max_length=BULK_MAX_ITEMS)
+
+class ItemChanges(BaseModel):
+    # Only the fields that are set are applied
+    title: Optional[constr(min_length=1, max_length=255)] = None
+    description: Optional[constr(max_length=1000)] = None
+    image_url: Optional[str] = None
+    link: Optional[str] = None
+    price: Optional[float] = Field(None, ge=0)
+    note: Optional[constr(max_length=500)] = None
+
+class BulkItemUpdate(BulkItemIds):
+    changes: ItemChanges
+
+class BulkCategoryMove(BulkItemIds):
+    category_name: constr(min_length=1, max_length=50)
+
+class BulkStatusChange(BulkItemIds):
+    status: Literal["favorite", "in_event", "received"] # bookings set "booked"
+
+class BulkResultEntry(BaseModel):
+    id: int
+    result: Literal["ok", "unchanged", "not_found"]
+
+class BulkResult(BaseModel):
+    results: List[BulkResultEntry]
+
 # Event Schemas
 class EventBase(BaseModel):
     title: constr(min_length=1, max_length=255)
@@ -52,15 +89,34 @@ class EventBase(BaseModel):
 class EventCreate(EventBase):
     pass
 
+class EventItemRequest(BaseModel):
+    item_id: int
+
 class Event(EventBase):
     id: int
     user_id: int
     items: List[Item] = []
-    collaborators: List["User"] = [] # Forward reference
+    collaborators: List["EventCollaborator"] = [] # Forward reference
 
     class Config:
         from_attributes = True
 
+# Event as a viewer sees it: friends get booking flags, owners never do
+class EventItemView(Item):
+    is_booked: bool = False
+
+class EventView(Event):
+    items: List[EventItemView] = []
+
+# ?view=summary of the event endpoints: counts instead of nested rows
+class EventSummaryView(EventBase):
+    id: int
+    user_id: int
+    item_count: int = 0
+    booked_count: int = 0 # always 0 for the owner
+    price_total: float = 0
+    collaborator_count: int = 0
+
 # Friend Schemas
 class FriendAdd(BaseModel):
     phone: constr(pattern=r"^\+\d{10,15}$") # E.g., +1234567890
@@ -73,6 +129,22 @@ class Friend(BaseModel):
     class Config:
         from_attributes = True
 
+# Feed Schemas (/api/feed: what friends did, newest first)
+class FeedEntry(BaseModel):
+    id: int # pass the last one as ?before= for the next page
+    user_id: int # the friend
+    kind: Literal["event", "item"]
+    event_id: int
+    item_id: Optional[int] = None # "item": put on event_id
+    title: Optional[str] = None
+    price: Optional[float] = None
+    date: Optional[datetime] = None # the event's date
+    created_at: datetime
+
+class Feed(BaseModel):
+    entries: List[FeedEntry]
+    next_before: Optional[int] = None # None on the last page
+
 # User Schemas
 class UserCreate(BaseModel):
     telegram_id: int
@@ -94,6 +166,51 @@ class User(BaseModel):
 class UserUpdatePhone(BaseModel):
     phone: constr(pattern=r"^\+\d{10,15}$")
 
+# Import Schemas
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportReport(BaseModel):
+    imported: int
+    skipped: int # links that were already saved
+    errors: List[ImportRowError]
+
+# History Schemas
+class ArchivedItem(Item):
+    status: Optional[str] = None
+    archived_at: datetime
+
+class ArchivedEvent(EventBase):
+    id: int
+    user_id: int
+    archived_at: datetime
+    items: List[Item] = []
+
+    class Config:
+        from_attributes = True
+
+# Summary Schemas
+class CategorySummary(BaseModel):
+    category_id: Optional[int] = None # None for uncategorized items
+    name: Optional[str] = None
+    item_count: int
+    price_total: float
+
+class EventSummary(BaseModel):
+    event_id: int
+    title: str
+    item_count: int
+    price_total: float
+    booked_count: int
+
+class UserSummary(BaseModel):
+    item_count: int
+    price_total: float
+    status_counts: Dict[str, int]
+    categories: List[CategorySummary]
+    events: List[EventSummary]
+
 # Shared Event Schemas
 class EventCollaboratorAdd(BaseModel):
     collaborator_id: int
@@ -105,5 +222,15 @@ class EventCollaborator(BaseModel):
     class Config:
         from_attributes = True
 
+# Mini App launch data (/api/bootstrap)
+class Bootstrap(BaseModel):
+    user: User
+    items: List[Item]
+    events: List[Event]
+    friends: List[Friend]
+    shared_events: List[Event]
+
 # Update forward references
 Event.update_forward_refs()
+EventView.update_forward_refs()
+Token.update_forward_refs()
@@ -0,0 +1,37 @@
+import hashlib
+
+from sqlalchemy import and_, or_, select
+from starlette.responses import Response
+
+import models
+
+# Strong ETags from the version counters in models.Version. A tag covers the
+# counters of the response's data and a variant (viewer, path and query), so
+# GET handlers can answer If-None-Match before running their main query.
+
+
+def versions_query(keys):
+    """Current counters for [(scope, id), ...]; keys without a row are at 0."""
+    # OR of primary-key lookups: SQLite scans for a row-value IN (VALUES ...)
+    return select(models.Version.scope, models.Version.id, models.Version.version).where(or_(*(
+        and_(models.Version.scope == scope, models.Version.id == id) for scope, id in keys
+    )))
+
+
+def make_etag(rows, keys, variant: str) -> str:
+    versions = {(scope, id): version for scope, id, version in rows}
+    state = ";".join(f"{scope}:{id}:{versions.get((scope, id), 0)}" for scope, id in keys)
+    return '"%s"' % hashlib.sha1(f"{variant}|{state}".encode()).hexdigest()
+
+
+def request_variant(request, viewer_id: int) -> str:
+    return f"{viewer_id} {request.url.path}?{request.url.query}"
+
+
+def not_modified(request, response, etag: str):
+    """Set the ETag on the response; a bare 304 if the client already has it."""
+    response.headers["ETag"] = etag
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
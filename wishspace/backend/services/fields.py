@@ -0,0 +1,39 @@
+from typing import Dict, Optional, Sequence
+
+from fastapi import HTTPException, Query
+
+FIELDS_DESCRIPTION = "Comma separated names of the fields to return; id is always included"
+
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]):
+    """Requested field names in `allowed` order, None when all are wanted; 400 on unknown names."""
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in allowed if name in names or name == "id")
+
+
+def sparse_fields(allowed: Sequence[str]):
+    """Dependency for ?fields=a,b (see parse_fields)."""
+    def fields_param(fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION)):
+        return parse_fields(fields, allowed)
+    return fields_param
+
+
+def projection(allowed: Sequence[str], views: Dict[str, Sequence[str]]):
+    """Dependency for ?fields=a,b or ?view=<name>, a named set of fields."""
+    def projection_param(
+        fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+        view: Optional[str] = Query(None, description=f"One of: {', '.join(views)}"),
+    ):
+        if view is None:
+            return parse_fields(fields, allowed)
+        if fields is not None:
+            raise HTTPException(status_code=400, detail="Use either fields or view")
+        if view not in views:
+            raise HTTPException(status_code=400, detail=f"Unknown view: {view}")
+        return tuple(views[view])
+    return projection_param
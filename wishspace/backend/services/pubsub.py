@@ -0,0 +1,149 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Messages for a set of channels, read by one asyncio consumer.
+
+    Created on the consumer's event loop; publishers on any thread hand
+    messages over with call_soon_threadsafe. A consumer that falls more than
+    `maxsize` messages behind loses them and gets a single
+    {"type": "resync"} instead, telling it to refetch.
+    """
+
+    def __init__(self, broker, channels: Iterable[str], maxsize: int):
+        self.broker = broker
+        self.channels = frozenset(channels)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message: dict):
+        try:
+            self._loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError: # the consumer's loop is gone
+            self.broker.unsubscribe(self)
+
+    def _put(self, message: dict):
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait({"type": "resync"})
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """The next message, or None if there was none for `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub: messages reach subscribers in this process only."""
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, channels: Iterable[str], maxsize: int = 100) -> Subscription:
+        subscription = Subscription(self, channels, maxsize)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def publish(self, channel: str, message: dict):
+        self.published += 1
+        self._dispatch(channel, message)
+
+    def _dispatch(self, channel: str, message: dict):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "channels": len(self._subscriptions),
+                "subscriptions": len({s for subs in self._subscriptions.values() for s in subs}),
+                "published": self.published,
+            }
+
+
+class RedisBroker(LocalBroker):
+    """Pub/sub across worker processes through Redis PUBLISH/PSUBSCRIBE.
+
+    Every message goes through Redis, including those for this process, so
+    all workers see them in the same order. publish() only queues: messages
+    are published from the database writer's commit hooks, which must not
+    wait on the network, so a daemon thread sends them. Another relays Redis
+    messages to the local subscribers; it starts with the first subscription.
+    """
+
+    def __init__(self, url: str, prefix: str = "wishspace:"):
+        super().__init__()
+        import redis # only imported when PUBSUB_URL is set
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._listener = None
+        self._outbox = queue.Queue()
+        threading.Thread(target=self._send, name="pubsub-send", daemon=True).start()
+
+    def subscribe(self, channels: Iterable[str], maxsize: int = 100) -> Subscription:
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="pubsub", daemon=True)
+                self._listener.start()
+        return super().subscribe(channels, maxsize)
+
+    def publish(self, channel: str, message: dict):
+        self.published += 1
+        self._outbox.put((self._prefix + channel, json.dumps(message)))
+
+    def _send(self):
+        while True:
+            channel, data = self._outbox.get()
+            try:
+                self._redis.publish(channel, data)
+            except Exception:
+                logger.exception(f"Redis publish to {channel} failed")
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self._prefix + "*")
+                for message in pubsub.listen():
+                    channel = message["channel"].decode()[len(self._prefix):]
+                    self._dispatch(channel, json.loads(message["data"]))
+            except Exception:
+                logger.exception("Redis pub/sub listener failed, reconnecting")
+                time.sleep(1)
+
+
+def make_broker(url: Optional[str] = None) -> LocalBroker:
+    """RedisBroker for a redis:// URL, else the in-process broker."""
+    return RedisBroker(url) if url else LocalBroker()
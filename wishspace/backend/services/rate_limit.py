@@ -0,0 +1,127 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Limit(NamedTuple):
+    """A token bucket: up to `burst` requests at once, refilled at `rate` per second."""
+    rate: float
+    burst: int
+
+
+def parse_limit(spec: Optional[str]) -> Optional[Limit]:
+    """"30/minute" (or "30/60", in seconds) as a Limit; None for "" or "0", no limit."""
+    spec = (spec or "").strip()
+    if spec in ("", "0"):
+        return None
+    match = re.fullmatch(r"(\d+)\s*/\s*(\w+)", spec)
+    if not match:
+        raise ValueError(f"Invalid rate limit {spec!r}, expected e.g. 30/minute")
+    count, period = int(match.group(1)), match.group(2)
+    seconds = PERIODS.get(period.rstrip("s")) or float(period)
+    return Limit(count / seconds, count) if count else None
+
+
+class MemoryBackend:
+    """Token buckets in this process: each worker counts its own requests.
+
+    At most `maxsize` keys are kept; the least recently used go first, and a
+    key seen again after that starts with a full bucket.
+    """
+    blocking = False
+
+    def __init__(self, maxsize: int = 100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.allowed = 0
+        self.limited = 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit) -> float:
+        """Take a token from `key`'s bucket: 0 if there was one, else seconds until there is."""
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (1 - tokens) / limit.rate
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._buckets), "allowed": self.allowed, "limited": self.limited}
+
+
+# KEYS[1]: bucket hash, ARGV: rate, burst. Time is the Redis server's, so
+# workers with drifting clocks share one view of the bucket.
+TAKE_SCRIPT = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+    """Token buckets in Redis, shared by all worker processes.
+
+    Each take is one script call, atomic across workers; a bucket expires
+    once it would be full again. If Redis is unreachable requests are let
+    through rather than failing.
+    """
+    blocking = True # callers on an event loop run take() in a thread
+
+    def __init__(self, url: str, prefix: str = "wishspace:rate:"):
+        import redis # only imported when RATE_LIMIT_URL is set
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(TAKE_SCRIPT)
+        self._prefix = prefix
+        self.allowed = 0
+        self.limited = 0
+        self.errors = 0
+
+    def take(self, key: str, limit: Limit) -> float:
+        try:
+            wait = float(self._take(keys=[self._prefix + key], args=[limit.rate, limit.burst]))
+        except Exception:
+            self.errors += 1
+            logger.exception("Redis rate limit check failed, allowing the request")
+            return 0.0
+        if wait:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return wait
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "limited": self.limited, "errors": self.errors}
+
+
+def make_backend(url: Optional[str] = None):
+    """RedisBackend for a redis:// URL, else the in-process one."""
+    return RedisBackend(url) if url else MemoryBackend()
@@ -0,0 +1,32 @@
+import json
+from datetime import date, datetime
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError: # optional; the standard library is slower but gives the same JSON
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """Compact JSON for plain dicts, lists and scalars, as Pydantic would write them.
+
+    For data read straight from the database (see the crud *_rows
+    functions): it is not validated again on the way out.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def json_response(body: bytes, response: Response) -> Response:
+    """`body` as the response, with the ETag the handler set on `response`."""
+    etag = response.headers.get("etag")
+    return Response(content=body, media_type="application/json", headers={"ETag": etag} if etag else None)
@@ -0,0 +1,33 @@
+import requests
+
+API_URL = "https://api.telegram.org/bot{token}/{method}"
+MAX_MESSAGE_LENGTH = 4096 # characters, sendMessage rejects longer texts
+
+
+def send_telegram_message(bot_token: str, chat_id: int, text: str, timeout: float = 10):
+    """sendMessage; returns the response, callers that care check it."""
+    url = API_URL.format(token=bot_token, method="sendMessage")
+    return requests.post(url, json={"chat_id": chat_id, "text": text}, timeout=timeout)
+
+
+def retry_after(response) -> int:
+    """Seconds a 429 response asks to wait before the next message (1 if it does not say)."""
+    try:
+        return int(response.json()["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return 1
+
+
+def truncate_lines(lines, limit: int = MAX_MESSAGE_LENGTH) -> str:
+    """Join `lines` into one message; lines that do not fit become "… N more"."""
+    text = "\n".join(lines)
+    if len(text) <= limit:
+        return text
+    kept, length = [], 0
+    for line in lines:
+        more = f"… {len(lines) - len(kept) - 1} more"
+        if length + len(line) + 1 + len(more) > limit:
+            break
+        kept.append(line)
+        length += len(line) + 1
+    return "\n".join(kept + [f"… {len(lines) - len(kept)} more"])
@@ -0,0 +1,127 @@
+"""Consistency check for the aggregate tables.
+
+crud keeps item_stats and event_stats up to date with deltas. This job
+recomputes them from items and event_items, reports every counter that
+drifted and, with --repair, rebuilds the tables. Run with
+`python stats.py [--repair]`.
+"""
+import argparse
+import logging
+
+from sqlalchemy import bindparam, text
+
+from database import engine as default_engine
+
+logger = logging.getLogger(__name__)
+
+# Float sums may differ in the last digits after many deltas
+PRICE_TOLERANCE = 0.005
+
+EXPECTED_ITEM_STATS = """
+    SELECT user_id, COALESCE(category_id, 0) AS category_id, COALESCE(status, 'favorite') AS status,
+           COUNT(*) AS item_count, COALESCE(SUM(price), 0) AS price_total
+    FROM items {where}
+    GROUP BY user_id, COALESCE(category_id, 0), COALESCE(status, 'favorite')
+"""
+
+EXPECTED_EVENT_STATS = """
+    SELECT event_items.event_id, COUNT(*) AS item_count, COALESCE(SUM(items.price), 0) AS price_total,
+           SUM(CASE WHEN items.status = 'booked' THEN 1 ELSE 0 END) AS booked_count
+    FROM event_items JOIN items ON items.id = event_items.item_id {where}
+    GROUP BY event_items.event_id
+"""
+
+
+def _by_key(rows, key_size):
+    return {tuple(row[:key_size]): tuple(row[key_size:]) for row in rows}
+
+
+def _diff(table, expected, stored):
+    mismatches = []
+    for key in expected.keys() | stored.keys():
+        want = expected.get(key)
+        have = stored.get(key)
+        # Zeroed counters are kept as rows; they match a missing row
+        if want is None and not any(have):
+            continue
+        if want is None or have is None or any(abs(w - h) > PRICE_TOLERANCE for w, h in zip(want, have)):
+            mismatches.append((table, key, want, have))
+    return mismatches
+
+
+def check(conn):
+    """Return (table, key, expected, stored) for every aggregate that does not match the data."""
+    return _diff(
+        "item_stats",
+        _by_key(conn.execute(text(EXPECTED_ITEM_STATS.format(where=""))), 3),
+        _by_key(conn.execute(text(
+            "SELECT user_id, category_id, status, item_count, price_total FROM item_stats"
+        )), 3),
+    ) + _diff(
+        "event_stats",
+        _by_key(conn.execute(text(EXPECTED_EVENT_STATS.format(where=""))), 1),
+        _by_key(conn.execute(text(
+            "SELECT event_id, item_count, price_total, booked_count FROM event_stats"
+        )), 1),
+    )
+
+
+def _ids_filter(column, ids):
+    """WHERE clause and parameters limiting a recount to some ids (all when ids is None)."""
+    if ids is None:
+        return "", {}
+    return f"WHERE {column} IN :ids", {"ids": list(ids)}
+
+
+def _execute(conn, sql, params):
+    statement = text(sql)
+    if params:
+        statement = statement.bindparams(bindparam("ids", expanding=True))
+    conn.execute(statement, params)
+
+
+def recount_item_stats(conn, user_ids=None):
+    if user_ids is not None and not user_ids:
+        return
+    where, params = _ids_filter("user_id", user_ids)
+    _execute(conn, f"DELETE FROM item_stats {where}", params)
+    _execute(conn, "INSERT INTO item_stats (user_id, category_id, status, item_count, price_total) "
+                   + EXPECTED_ITEM_STATS.format(where=where), params)
+
+
+def recount_event_stats(conn, event_ids=None):
+    if event_ids is not None and not event_ids:
+        return
+    where, params = _ids_filter("event_id", event_ids)
+    _execute(conn, f"DELETE FROM event_stats {where}", params)
+    where, params = _ids_filter("event_items.event_id", event_ids)
+    _execute(conn, "INSERT INTO event_stats (event_id, item_count, price_total, booked_count) "
+                   + EXPECTED_EVENT_STATS.format(where=where), params)
+
+
+def rebuild(conn):
+    """Recompute both aggregate tables from scratch, in the caller's transaction."""
+    recount_item_stats(conn)
+    recount_event_stats(conn)
+
+
+def run(engine=default_engine, repair=False):
+    # One transaction, so the check and the rebuild see the same data.
+    # Writers wait meanwhile; the whole job is two GROUP BY scans.
+    with engine.begin() as conn:
+        mismatches = check(conn)
+        for table, key, expected, stored in mismatches:
+            logger.warning(f"{table} {key}: expected {expected}, stored {stored}")
+        if mismatches and repair:
+            rebuild(conn)
+            logger.info(f"Rebuilt aggregates after {len(mismatches)} mismatches")
+    return mismatches
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repair", action="store_true", help="rebuild the aggregates if they drifted")
+    args = parser.parse_args()
+    mismatches = run(repair=args.repair)
+    logger.info(f"{len(mismatches)} mismatched aggregates")
@@ -0,0 +1,141 @@
+"""Streaming export and import of wishlists as NDJSON or CSV.
+
+Exports iterate a server-side cursor (`yield_per`) on their own read
+session and emit one chunk of text per fetched partition, so memory stays
+flat for any number of rows. Imports parse the request body as it arrives
+and write every IMPORT_CHUNK_ROWS valid rows in a separate transaction.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+import crud, schemas
+from database import ReadSessionLocal, run_write
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "500"))
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "500"))
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_FIELDS = [column.key for column in crud.EXPORT_COLUMNS]
+# Item fields read back on import; everything else in a row is ignored
+IMPORT_FIELDS = ("title", "description", "image_url", "link", "price", "note")
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "value"): # StatusEnum
+        return value.value
+    return value
+
+
+def _ndjson_chunk(rows):
+    return "".join(
+        json.dumps({field: _plain(value) for field, value in zip(EXPORT_FIELDS, row)}, ensure_ascii=False) + "\n"
+        for row in rows
+    )
+
+
+def _csv_chunk(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_plain(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def stream_export(query, fmt, session_factory=ReadSessionLocal):
+    """Generator for a StreamingResponse: the query's rows serialized chunk by chunk."""
+    db = session_factory()
+    try:
+        if fmt == "csv":
+            yield _csv_chunk([EXPORT_FIELDS])
+        serialize = _csv_chunk if fmt == "csv" else _ndjson_chunk
+        result = db.execute(query.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+        for partition in result.partitions():
+            yield serialize(partition)
+    finally:
+        db.close()
+
+
+async def _lines(body):
+    """Decoded lines of a streamed request body, split across chunk boundaries."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in body:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _records(body, fmt):
+    """(line number, dict) for every row of the body; CSV quoted fields may span lines."""
+    line_number, header, record, record_start = 0, None, "", 1
+    async for line in _lines(body):
+        line_number += 1
+        if fmt == "ndjson":
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = e
+                yield line_number, row
+            continue
+        if not record:
+            record_start = line_number
+        record += line
+        if record.count('"') % 2: # inside a quoted field
+            continue
+        values, record = next(csv.reader([record])), ""
+        if not any(values):
+            continue
+        if header is None:
+            header = values
+        else:
+            yield record_start, dict(zip(header, values))
+
+
+def _item(row):
+    if isinstance(row, ValueError): # unparsable NDJSON line
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError(f"not a JSON object: {row!r}")
+    # CSV has no nulls: empty cells are missing values
+    data = {field: None if row.get(field) == "" else row.get(field) for field in IMPORT_FIELDS}
+    if row.get("category"):
+        data["category_name"] = row["category"]
+    return schemas.ItemCreate(**data)
+
+
+async def import_items(body, fmt, user_id, write=run_write):
+    """Create items from a streamed NDJSON/CSV body; returns counts and the first errors."""
+    report = {"imported": 0, "skipped": 0, "errors": []}
+
+    async def flush(chunk):
+        created, skipped = await run_in_threadpool(write, crud.import_items, chunk, user_id)
+        report["imported"] += created
+        report["skipped"] += skipped
+
+    chunk = []
+    async for line_number, row in _records(body, fmt):
+        try:
+            chunk.append(_item(row))
+        except (ValueError, TypeError, ValidationError) as e:
+            if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                report["errors"].append({"line": line_number, "error": str(e)})
+            continue
+        if len(chunk) >= IMPORT_CHUNK_ROWS:
+            await flush(chunk)
+            chunk = []
+    if chunk:
+        await flush(chunk)
+    return report
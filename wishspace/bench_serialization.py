@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Times the list responses both ways: ORM objects validated through the
+response model (what FastAPI does with a response_model), and the column
+rows written by services.serialize.
+
+Builds a throwaway SQLite database per size and prints, for each list, the
+best of a few runs in milliseconds.
+
+Usage: python bench_serialization.py [sizes...]  (default 100 1000 10000)
+"""
+
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+sys.path.append(BACKEND_DIR)
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+import crud, migrations, models, schemas
+from database import make_engine
+from services import serialize
+
+ITEMS_PER_EVENT = 10
+RUNS = 5
+
+
+def through_model(schema):
+    # FastAPI validates the endpoint's return value against response_model,
+    # then dumps the validated model
+    adapter = TypeAdapter(schema)
+    return lambda value: adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+
+def seed(db, size):
+    db.execute(insert(models.User), [
+        {"id": n, "telegram_id": n, "name": f"User {n}", "phone": f"+1{n:010d}"} for n in range(1, size + 2)
+    ])
+    db.execute(insert(models.Friend), [{"user_id": 1, "friend_id": n} for n in range(2, size + 2)])
+    db.execute(insert(models.Category), [{"id": 1, "name": "General", "user_id": 1}])
+    db.execute(insert(models.Item), [
+        {"id": n, "title": f"Gift {n}", "description": "A gift " * 20, "price": n, "link": f"https://example.com/{n}",
+         "user_id": 1, "category_id": 1} for n in range(1, size + 1)
+    ])
+    db.execute(insert(models.Event), [
+        {"id": n, "title": f"Party {n}", "user_id": 1, "is_shared": True} for n in range(1, size // ITEMS_PER_EVENT + 1)
+    ])
+    db.execute(insert(models.EventItem), [
+        {"event_id": (n - 1) // ITEMS_PER_EVENT + 1, "item_id": n} for n in range(1, size + 1)
+    ])
+    db.execute(insert(models.Booking), [{"item_id": n, "booked_by_user_id": 2} for n in range(1, size + 1, 3)])
+    db.commit()
+
+
+def best(fn):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def run(size):
+    engine = make_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    migrations.upgrade(engine)
+    sessions = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+    with sessions() as db:
+        seed(db, size)
+
+    items_model, friends_model = through_model(List[schemas.Item]), through_model(List[schemas.Friend])
+    events_model = through_model(List[schemas.EventView])
+    cases = {
+        "items": (
+            lambda db: items_model(crud.get_items_by_user(db, 1, limit=size)),
+            lambda db: serialize.dumps(crud.rows(db, crud.item_rows_query(1, limit=size))),
+        ),
+        "friends": (
+            lambda db: friends_model(crud.get_friends(db, 1)),
+            lambda db: serialize.dumps(crud.rows(db, crud.friend_rows_query(1))),
+        ),
+        "events (guest)": (
+            lambda db: events_model(crud._flag_bookings(db, crud.get_events_by_user(db, 1), 2)),
+            lambda db: serialize.dumps(crud.get_event_views(db, crud.user_event_ids(1), 2)),
+        ),
+    }
+    for name, (slow, fast) in cases.items():
+        timings = []
+        for fn in (slow, fast):
+            def once():
+                with sessions() as db:
+                    return fn(db)
+            timings.append(best(once))
+        assert len(once()) > 2
+        print(f"{size:>6} {name:<15} model={timings[0]:8.2f}ms  rows={timings[1]:8.2f}ms  x{timings[0] / timings[1]:.1f}")
+
+
+if __name__ == "__main__":
+    print(f"encoder: {'orjson' if serialize.orjson else 'json'}")
+    for size in [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]:
+        run(size)
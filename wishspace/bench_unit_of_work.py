@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Counts commits and SQL statements issued per API endpoint.
+
+Drives the FastAPI app in-process against a throwaway SQLite database and
+prints, for each endpoint, how many statements and commits one request costs.
+
+Usage: python bench_unit_of_work.py
+"""
+
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+sys.path.append(BACKEND_DIR)
+
+# main.py opens ./data/wishspace.db relative to the working directory
+os.chdir(tempfile.mkdtemp())
+os.makedirs("data")
+os.environ.setdefault("APP_ENV", "development")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from database import engine, read_engine
+
+counters = {"statements": 0, "commits": 0}
+TRANSACTION_CONTROL = ("BEGIN", "SAVEPOINT", "RELEASE", "ROLLBACK")
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if not statement.lstrip().upper().startswith(TRANSACTION_CONTROL):
+        counters["statements"] += 1
+
+
+event.listen(engine, "before_cursor_execute", _count_statement)
+if read_engine is not engine:
+    event.listen(read_engine, "before_cursor_execute", _count_statement)
+
+
+@event.listens_for(engine, "commit")
+def _count_commit(conn):
+    counters["commits"] += 1
+
+
+def measure(client, label, method, url, **kwargs):
+    counters["statements"] = counters["commits"] = 0
+    response = client.request(method, url, **kwargs)
+    assert response.status_code < 400, f"{label}: {response.status_code} {response.text}"
+    print(f"{label:<32} statements={counters['statements']:<4} commits={counters['commits']}")
+    return response
+
+
+def login(client, telegram_id):
+    response = client.post("/api/auth/telegram", json={"init_data": f"dev_user_id={telegram_id}"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def run():
+    client = TestClient(main.app)
+    owner = login(client, 1000000001)
+    friend = login(client, 1000000002)
+    owner_id = client.get("/api/users/me", headers=owner).json()["id"]
+
+    item = measure(client, "POST /api/items/manual (new cat)", "POST", "/api/items/manual", headers=owner,
+                   json={"title": "Book", "price": 10, "category_name": "Books"}).json()
+    measure(client, "POST /api/items/manual", "POST", "/api/items/manual", headers=owner,
+            json={"title": "Lamp", "price": 5, "category_name": "Books"})
+    measure(client, "GET /api/items", "GET", "/api/items", headers=owner)
+    measure(client, "PUT /api/items/{id}", "PUT", f"/api/items/{item['id']}", headers=owner,
+            json={"title": "Book 2"})
+    event_obj = measure(client, "POST /api/events", "POST", "/api/events", headers=owner,
+                        json={"title": "Birthday"}).json()
+    measure(client, "POST /api/events/{id}/items", "POST", f"/api/events/{event_obj['id']}/items", headers=owner,
+            json={"item_id": item["id"]})
+    measure(client, "GET /api/users/{id}/events", "GET", f"/api/users/{owner_id}/events", headers=friend)
+    measure(client, "POST /api/items/{id}/book", "POST", f"/api/items/{item['id']}/book", headers=friend)
+    measure(client, "POST /api/friends", "POST", "/api/friends", headers=friend,
+            json={"phone": "+10000000010"})
+    measure(client, "GET /api/friends", "GET", "/api/friends", headers=owner)
+    measure(client, "PUT /api/users/me/phone", "PUT", "/api/users/me/phone", headers=owner,
+            json={"phone": "+10000000099"})
+    measure(client, "DELETE /api/friends/{id}", "DELETE", f"/api/friends/{owner_id}", headers=friend)
+    measure(client, "DELETE /api/items/{id}", "DELETE", f"/api/items/{item['id']}", headers=owner)
+
+
+if __name__ == "__main__":
+    run()
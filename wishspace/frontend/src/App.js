@@ -25,6 +25,7 @@ import TextField from '@mui/material/TextField';
 import Items from './components/Items';
 import Events from './components/Events';
 import Friends from './components/Friends';
+import Feed from './components/Feed';
 import './App.css'; // Keep for custom overrides if any
 
 const tg = window.Telegram.WebApp;
@@ -257,11 +258,56 @@ function FriendWishlistView({ user, friend, onBack, onShowSnackbar }) {
             });
     }, [friend.id, t]);
 
+    // Live updates for the events on screen, so bookings by other friends show up without refetching
+    const eventIds = events.map(event => event.id).join(',');
+    useEffect(() => {
+        const token = localStorage.getItem('access_token');
+        if (!eventIds || !token || !window.EventSource) return;
+        const params = new URLSearchParams(eventIds.split(',').map(id => ['event_id', id]));
+        params.append('access_token', token);
+        const source = new EventSource(`/api/stream?${params}`);
+        const updateItems = (eventId, update) => setEvents(current => current.map(event =>
+            event.id === eventId ? { ...event, items: update(event.items) } : event
+        ));
+        source.onmessage = (message) => {
+            const delta = JSON.parse(message.data);
+            switch (delta.type) {
+                case 'item_booked':
+                    updateItems(delta.event_id, items => items.map(item => item.id === delta.item_id ? { ...item, is_booked: true } : item));
+                    break;
+                case 'item_updated':
+                    updateItems(delta.event_id, items => items.map(item => item.id === delta.item.id ? { ...item, ...delta.item } : item));
+                    break;
+                case 'item_added':
+                    updateItems(delta.event_id, items => [...items, { ...delta.item, is_booked: false }]);
+                    break;
+                case 'item_removed':
+                    updateItems(delta.event_id, items => items.filter(item => item.id !== delta.item_id));
+                    break;
+                case 'event_updated':
+                    setEvents(current => current.map(event => event.id === delta.event_id ? { ...event, ...delta.event } : event));
+                    break;
+                case 'event_deleted':
+                    setEvents(current => current.filter(event => event.id !== delta.event_id));
+                    break;
+                case 'resync':
+                    axios.get(`/api/users/${friend.id}/events`).then(response => setEvents(response.data));
+                    break;
+                default:
+                    break;
+            }
+        };
+        return () => source.close();
+    }, [eventIds, friend.id]);
+
     const handleBookItem = (itemId) => {
         axios.post(`/api/items/${itemId}/book`)
             .then(() => {
                 onShowSnackbar(t('gift_booked_success'), 'success');
-                // Ideally, refetch events or update state to show item as booked
+                setEvents(current => current.map(event => ({
+                    ...event,
+                    items: event.items.map(item => item.id === itemId ? { ...item, is_booked: true } : item),
+                })));
             })
             .catch(err => {
                 console.error('Failed to book item', err);
@@ -557,6 +603,8 @@ function App() {
         return <Items user={user} onShowSnackbar={handleShowSnackbar} />;
       case 'events':
         return <Events user={user} onShowSnackbar={handleShowSnackbar} />;
+      case 'feed':
+        return <Feed user={user} onViewFriendWishes={handleViewFriendWishes} />;
       case 'friends':
         return <Friends user={user} onViewFriendWishes={handleViewFriendWishes} onShowSnackbar={handleShowSnackbar} />;
       case 'friend_wishes':
@@ -838,6 +886,16 @@ function App() {
                     >
                       👥 {t('friends', 'Friends')}
                     </Button>
+                    <Button 
+                      variant={view === 'feed' ? "contained" : "text"}
+                      onClick={() => setView('feed')}
+                      sx={{ 
+                        minWidth: { xs: 'auto', sm: 120 },
+                        flex: { xs: 1, sm: 'none' }
+                      }}
+                    >
+                      📰 {t('feed', 'Feed')}
+                    </Button>
                   </Stack>
                 </Paper>
               )}
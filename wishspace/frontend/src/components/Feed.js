@@ -0,0 +1,78 @@
+import React, { useState, useEffect, useCallback } from 'react';
+import axios from 'axios';
+import { useTranslation } from 'react-i18next';
+
+// MUI Imports
+import { Button, Typography, Box, Paper, Stack, Avatar } from '@mui/material';
+
+// What friends added and which of their events are coming up, from
+// /api/feed one page at a time (?before= the last entry id)
+export default function Feed({ user, onViewFriendWishes }) {
+    const { t } = useTranslation();
+    const [friends, setFriends] = useState({});
+    const [entries, setEntries] = useState([]);
+    const [nextBefore, setNextBefore] = useState(null);
+    const [loading, setLoading] = useState(false);
+    const [error, setError] = useState('');
+
+    const fetchPage = useCallback((before) => {
+        setLoading(true);
+        axios.get('/api/feed', { params: before ? { before } : {} })
+            .then(response => {
+                setEntries(current => before ? [...current, ...response.data.entries] : response.data.entries);
+                setNextBefore(response.data.next_before);
+            })
+            .catch(err => {
+                console.error('Failed to fetch feed:', err);
+                setError(t('fetch_feed_failed', 'Failed to load the feed.'));
+            })
+            .finally(() => setLoading(false));
+    }, [t]);
+
+    useEffect(() => {
+        if (!user) return;
+        axios.get('/api/friends')
+            .then(response => setFriends(Object.fromEntries(response.data.map(friend => [friend.id, friend]))))
+            .catch(err => console.error('Failed to fetch friends:', err));
+        fetchPage(null);
+    }, [user, fetchPage]);
+
+    const describe = (entry) => {
+        const when = entry.date ? new Date(entry.date).toLocaleDateString() : '';
+        if (entry.kind === 'event') {
+            return when ? t('feed_event_on', '{{title}} on {{date}}', { title: entry.title, date: when }) : entry.title;
+        }
+        return entry.price != null ? `${entry.title} · ${entry.price}` : entry.title;
+    };
+
+    return (
+        <Box>
+            {error && <Typography color="error">{error}</Typography>}
+            <Stack spacing={2}>
+                {entries.map(entry => {
+                    const friend = friends[entry.user_id];
+                    return (
+                        <Paper key={entry.id} elevation={1} sx={{ p: 2, bgcolor: 'background.paper', cursor: friend ? 'pointer' : 'default' }}
+                            onClick={() => friend && onViewFriendWishes(friend)}>
+                            <Stack direction="row" alignItems="center" spacing={2}>
+                                <Avatar alt={friend?.name} src={friend?.avatar_url} />
+                                <Box>
+                                    <Typography variant="body2" color="text.secondary">
+                                        {friend?.name} · {entry.kind === 'event' ? t('feed_new_event', 'new event') : t('feed_new_wish', 'new wish')}
+                                    </Typography>
+                                    <Typography variant="h6">{describe(entry)}</Typography>
+                                </Box>
+                            </Stack>
+                        </Paper>
+                    );
+                })}
+                {!loading && entries.length === 0 && <Typography>{t('feed_empty', 'Nothing new from your friends yet.')}</Typography>}
+                {nextBefore && (
+                    <Button onClick={() => fetchPage(nextBefore)} disabled={loading}>
+                        {t('feed_more', 'Show more')}
+                    </Button>
+                )}
+            </Stack>
+        </Box>
+    );
+}
@@ -75,7 +75,14 @@ const resources = {
       "phone_number_not_received": "Phone number not received from Telegram. Please try again.",
       "phone_number_share_declined": "Phone number sharing declined.",
       "telegram_webapp_not_available": "Telegram WebApp is not available.",
-      "phone_number_request_sent": "Phone number request sent. Please check Telegram prompt."
+      "phone_number_request_sent": "Phone number request sent. Please check Telegram prompt.",
+      "feed": "Feed",
+      "feed_new_event": "new event",
+      "feed_new_wish": "new wish",
+      "feed_event_on": "{{title}} on {{date}}",
+      "feed_empty": "Nothing new from your friends yet.",
+      "feed_more": "Show more",
+      "fetch_feed_failed": "Failed to load the feed."
     }
   },
   ru: {
@@ -149,7 +156,14 @@ const resources = {
       "phone_number_not_received": "Номер телефона не получен от Telegram. Пожалуйста, попробуйте еще раз.",
       "phone_number_share_declined": "Отправка номера телефона отклонена.",
       "telegram_webapp_not_available": "Telegram WebApp недоступен.",
-      "phone_number_request_sent": "Запрос номера телефона отправлен. Пожалуйста, проверьте запрос Telegram."
+      "phone_number_request_sent": "Запрос номера телефона отправлен. Пожалуйста, проверьте запрос Telegram.",
+      "feed": "Лента",
+      "feed_new_event": "новое событие",
+      "feed_new_wish": "новое желание",
+      "feed_event_on": "{{title}}, {{date}}",
+      "feed_empty": "От друзей пока ничего нового.",
+      "feed_more": "Показать ещё",
+      "fetch_feed_failed": "Не удалось загрузить ленту."
     }
   }
 };
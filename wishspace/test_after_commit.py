@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""after_commit: side effects of a writer job run once its batch commits,
+not when the job's SAVEPOINT is released, and never for a batch whose
+commit fails.
+
+Usage: python -m pytest test_after_commit.py  (or python test_after_commit.py)
+"""
+
+from conftest import batched
+import pytest
+
+import crud, schemas
+
+
+def test_side_effects_wait_for_the_batch(writer):
+    user_id = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Owner")).id
+
+    # The second job runs after the first one's SAVEPOINT is released
+    resolved, seen = batched(writer, (crud.get_category_id, "Books", user_id),
+                             (lambda db: crud.category_cache.get(user_id),))
+    assert seen.result() is None
+    assert crud.category_cache.get(user_id) == {"Books": resolved.result()}
+
+
+def test_failed_batch_commit_runs_nothing(writer, failing_writer):
+    user_id = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Owner")).id
+
+    futures = batched(failing_writer, (crud.get_category_id, "Books", user_id), (crud.get_category_id, "Games", user_id))
+    for future in futures:
+        with pytest.raises(RuntimeError, match="batch commit failed"):
+            future.result()
+    assert crud.category_cache.get(user_id) is None
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
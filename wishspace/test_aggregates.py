@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Wishlist aggregates: after a random mix of item, booking and event
+operations the counters maintained by crud must match a full recount, and
+the consistency job must detect and repair drift.
+
+Usage: python -m pytest test_aggregates.py  (or python test_aggregates.py)
+"""
+
+import random
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import update
+
+import crud, models, schemas, stats
+
+OPERATIONS = 400
+
+
+def test_counters_match_recount_after_random_changes(engine, db):
+    rng = random.Random(35)
+    users = [crud.create_user(db, schemas.UserCreate(telegram_id=n, name=f"User {n}")).id for n in range(1, 5)]
+    items, events = [], []
+
+    for _ in range(OPERATIONS):
+        user_id = rng.choice(users)
+        action = rng.random()
+        if action < 0.35 or not items:
+            price = rng.choice([None, 10, 99.99, 1500])
+            category = rng.choice(["Books", "Tech", "Дом"])
+            items.append(crud.create_item(db, schemas.ItemCreate(title="Gift", price=price, category_name=category), user_id).id)
+        elif action < 0.45:
+            events.append(crud.create_event(db, schemas.EventCreate(title="Party"), user_id).id)
+        elif action < 0.6 and events:
+            event_id, item_id = rng.choice(events), rng.choice(items)
+            if not db.get(models.EventItem, (event_id, item_id)):
+                crud.add_item_to_event(db, event_id, item_id)
+        elif action < 0.7:
+            crud.create_booking(db, rng.choice(items), user_id)
+        elif action < 0.8:
+            crud.update_item(db, rng.choice(items), schemas.ItemUpdate(title="Gift", price=rng.choice([None, 5, 250])))
+        elif action < 0.85:
+            crud.set_item_category(db, rng.choice(items), rng.choice(["Books", "Toys"]))
+        elif action < 0.95:
+            crud.delete_item(db, items.pop(rng.randrange(len(items))))
+        elif events:
+            crud.delete_event(db, events.pop(rng.randrange(len(events))))
+    db.commit()
+
+    with engine.connect() as conn:
+        assert stats.check(conn) == []
+
+    summary = crud.get_user_summary(db, users[0])
+    owned = db.query(models.Item).filter(models.Item.user_id == users[0]).all()
+    assert summary["item_count"] == len(owned)
+    assert abs(summary["price_total"] - sum(item.price or 0 for item in owned)) < 0.01
+    assert summary["status_counts"]["booked"] == sum(item.status == models.StatusEnum.booked for item in owned)
+    assert {event["event_id"] for event in summary["events"]} == {
+        event.id for event in crud.get_events_by_user(db, users[0])
+    }
+
+
+def test_job_detects_and_repairs_drift(engine, db):
+    user = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner"))
+    item = crud.create_item(db, schemas.ItemCreate(title="Lamp", price=30, category_name="Home"), user.id)
+    event = crud.create_event(db, schemas.EventCreate(title="Party"), user.id)
+    crud.add_item_to_event(db, event.id, item.id)
+    db.execute(update(models.ItemStats).values(item_count=7))
+    db.execute(update(models.EventStats).values(price_total=1))
+    db.commit()
+    db.close()
+
+    mismatches = stats.run(engine, repair=True)
+    assert {table for table, *_ in mismatches} == {"item_stats", "event_stats"}
+    assert stats.run(engine) == []
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Archival: received items and past events move to the archive tables in
+batches, the aggregates and search index follow, and history stays readable.
+
+Usage: python -m pytest test_archive.py  (or python test_archive.py)
+"""
+
+from datetime import datetime, timedelta
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import update
+
+import archive, crud, models, schemas, stats
+
+
+def seed(db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner"))
+    friend = crud.create_user(db, schemas.UserCreate(telegram_id=2, name="Friend"))
+    items = [
+        crud.create_item(db, schemas.ItemCreate(title=f"Gift {n}", price=10, category_name="Toys"), owner.id)
+        for n in range(7)
+    ]
+    past = crud.create_event(db, schemas.EventCreate(title="Last year", date=datetime.now() - timedelta(days=30)), owner.id)
+    soon = crud.create_event(db, schemas.EventCreate(title="Next week", date=datetime.now() + timedelta(days=7)), owner.id)
+    for item in items[:3]:
+        crud.add_item_to_event(db, past.id, item.id)
+    crud.add_item_to_event(db, soon.id, items[0].id)
+    crud.add_item_to_event(db, soon.id, items[3].id)
+    crud.add_collaborator_to_event(db, past.id, owner.id, friend.id)
+    crud.create_booking(db, items[0].id, friend.id)
+    # Gifts 0, 4 and 5 were handed over
+    received = [items[0].id, items[4].id, items[5].id]
+    db.execute(update(models.Item).where(models.Item.id.in_(received)).values(status=models.StatusEnum.received))
+    stats.recount_item_stats(db.connection(), [owner.id])
+    return owner.id, past.id, soon.id, received
+
+
+def test_archive_moves_received_items_and_past_events(writer, sessions):
+    owner_id, past_id, soon_id, received = writer.run(seed)
+
+    moved = archive.run_once(batch_size=2, write=writer.run)
+    assert moved == {"items": 3, "events": 1}
+    assert archive.run_once(batch_size=2, write=writer.run) == {"items": 0, "events": 0}
+
+    db = sessions()
+    try:
+        hot_ids = {item.id for item in crud.get_items_by_user(db, owner_id)}
+        assert hot_ids.isdisjoint(received) and len(hot_ids) == 4
+        assert [event.id for event in crud.get_events_by_user(db, owner_id)] == [soon_id]
+        assert db.query(models.Booking).count() == 0
+        assert db.query(models.EventCollaborator).count() == 0
+        assert crud.search_items(db, owner_id, "gift") and all(
+            item.id not in received for item in crud.search_items(db, owner_id, "gift")
+        )
+        assert stats.check(db.connection()) == []
+        summary = crud.get_user_summary(db, owner_id)
+        assert summary["item_count"] == 4
+        assert [event["item_count"] for event in summary["events"]] == [1]
+
+        history = crud.get_archived_items(db, owner_id)
+        assert sorted(item.id for item in history) == sorted(received)
+        assert {item.status for item in history} == {models.StatusEnum.received}
+        events = crud.get_archived_events(db, owner_id)
+        assert [event.id for event in events] == [past_id]
+        # The past event keeps all three items, archived or still hot
+        assert sorted(item.title for item in events[0].items) == ["Gift 0", "Gift 1", "Gift 2"]
+        assert db.query(models.ArchivedBooking).count() == 1
+        assert db.query(models.ArchivedEventCollaborator).count() == 1
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
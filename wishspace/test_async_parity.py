@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""DB_ASYNC parity: the same API scenario, run once on the sync routes and
+once with DB_ASYNC=true, gives the same responses, so async_api and
+async_crud cannot drift from the crud they mirror: visibility, ETags and
+304s, projections, bookings and their conflicts.
+
+main.py picks its routes and engines at import, so each mode runs in its
+own interpreter (`python test_async_parity.py --scenario`).
+
+Usage: python -m pytest test_async_parity.py  (or python test_async_parity.py)
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import fresh_database_url
+
+OWNER, FRIEND, GUEST, STRANGER = 1000000001, 1000000002, 1000000003, 1000000004
+
+
+def stable(value):
+    """The response without timestamps, which differ between the runs."""
+    if isinstance(value, dict):
+        return {key: stable(item) for key, item in value.items() if not key.endswith("_at")}
+    if isinstance(value, list):
+        return [stable(item) for item in value]
+    return value
+
+
+def scenario():
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    tokens, responses, async_reads = {}, [], []
+    if main.ASYNC_DB: # proof the async handlers served the reads
+        import async_crud
+        rows = async_crud.rows
+        async_crud.rows = lambda *args: async_reads.append(args) or rows(*args)
+
+    def login(telegram_id):
+        response = client.post("/api/auth/telegram", json={"init_data": f"dev_user_id={telegram_id}"})
+        tokens[telegram_id] = response.json()["access_token"]
+
+    def call(method, path, user, etag=None, **kwargs):
+        headers = {"Authorization": f"Bearer {tokens[user]}"}
+        if etag:
+            headers["If-None-Match"] = etag
+        response = client.request(method, path, headers=headers, **kwargs)
+        body = stable(response.json()) if response.content else None
+        responses.append([method, path, user, response.status_code, body, response.headers.get("etag")])
+        return response
+
+    for user in (OWNER, FRIEND, GUEST, STRANGER):
+        login(user)
+    call("GET", "/api/users/me", OWNER)
+    for user in (FRIEND, GUEST):
+        call("POST", "/api/friends", user, json={"phone": f"+{OWNER}0"})
+        call("POST", "/api/friends", OWNER, json={"phone": f"+{user}0"})
+
+    book = call("POST", "/api/items/manual", OWNER, json={"title": "Book", "price": 10, "category_name": "Books"}).json()
+    lamp = call("POST", "/api/items/manual", OWNER, json={"title": "Lamp", "note": "warm"}).json()
+    items = call("GET", "/api/items", OWNER)
+    call("GET", "/api/items", OWNER, etag=items.headers["etag"])
+    call("PUT", f"/api/items/{lamp['id']}", OWNER, json={"title": "Floor lamp", "price": 30})
+    call("PUT", f"/api/items/{lamp['id']}", STRANGER, json={"title": "Mine"})
+    call("GET", "/api/items", OWNER, etag=items.headers["etag"])
+    call("GET", "/api/items?fields=id,title", OWNER)
+
+    event = call("POST", "/api/events", OWNER, json={"title": "Birthday", "date": "2030-01-01T00:00:00"}).json()
+    path = f"/api/events/{event['id']}"
+    for item in (book, lamp):
+        call("POST", f"{path}/items", OWNER, json={"item_id": item["id"]})
+    call("POST", f"{path}/items", STRANGER, json={"item_id": book["id"]}) # not their event
+    for user in (OWNER, FRIEND, STRANGER):
+        call("GET", path, user)
+        call("GET", f"/api/users/{event['user_id']}/events", user)
+    view = call("GET", path, FRIEND)
+    call("GET", path, FRIEND, etag=view.headers["etag"])
+    call("GET", f"{path}?view=summary", FRIEND)
+
+    call("POST", f"/api/items/{book['id']}/book", FRIEND)
+    call("POST", f"/api/items/{book['id']}/book", GUEST) # already booked
+    call("POST", f"/api/items/{lamp['id']}/book", STRANGER)
+    call("GET", path, FRIEND, etag=view.headers["etag"])
+    for user in (OWNER, GUEST):
+        call("GET", path, user)
+
+    friend_id = call("GET", "/api/users/me", FRIEND).json()["id"]
+    collaborators = f"{path}/collaborators"
+    client.post(collaborators, json={"collaborator_id": friend_id}, headers={"Authorization": f"Bearer {tokens[OWNER]}"})
+    call("PUT", path, OWNER, json={"title": "Birthday party", "date": "2030-01-02T00:00:00"})
+    call("GET", "/api/shared-events", FRIEND)
+    call("GET", "/api/friends", OWNER)
+    call("GET", "/api/feed", FRIEND)
+    call("DELETE", f"/api/items/{lamp['id']}", STRANGER)
+    call("DELETE", f"/api/items/{lamp['id']}", OWNER)
+    call("DELETE", path, FRIEND)
+    client.delete(f"{collaborators}/{friend_id}", headers={"Authorization": f"Bearer {tokens[OWNER]}"})
+    call("DELETE", path, OWNER)
+    call("GET", path, FRIEND)
+    call("DELETE", f"/api/friends/{call('GET', '/api/users/me', GUEST).json()['id']}", OWNER)
+    call("GET", "/api/friends", OWNER)
+
+    print(json.dumps({"async_reads": len(async_reads), "responses": responses}))
+
+
+def run(async_db: bool):
+    env = dict(
+        os.environ,
+        DATABASE_URL=fresh_database_url("async" if async_db else "sync"),
+        DB_ASYNC=str(async_db).lower(),
+        APP_ENV="development",
+        TELEGRAM_BOT_TOKEN="test",
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, os.path.join(here, "test_async_parity.py"), "--scenario"],
+                            env=env, cwd=here, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-3000:]
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_async_routes_match_the_sync_ones():
+    sync, async_ = run(False), run(True)
+    assert sync["async_reads"] == 0 and async_["async_reads"] > 0
+    statuses = [status for _, _, _, status, _, _ in sync["responses"]]
+    assert {304, 400, 404} <= set(statuses) # not modified, booking conflict, not found
+    for expected, actual in zip(sync["responses"], async_["responses"]):
+        assert actual == expected
+    assert len(async_["responses"]) == len(sync["responses"])
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--scenario"]:
+        scenario()
+    else:
+        test_async_routes_match_the_sync_ones()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Load test for booking: hundreds of friends book the same gift at once.
+
+Exactly one booking per item must win, every item must end up `booked`, and
+the booking throughput is printed.
+
+Usage: python -m pytest -s test_booking_contention.py  (or python test_booking_contention.py)
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import func
+
+import crud, models, schemas
+
+ITEMS = 10
+BOOKERS_PER_ITEM = 200
+THREADS = 200
+
+
+def seed(db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner"))
+    bookers = [
+        crud.create_user(db, schemas.UserCreate(telegram_id=100 + n, name=f"Friend {n}"))
+        for n in range(BOOKERS_PER_ITEM)
+    ]
+    items = [
+        crud.create_item(db, schemas.ItemCreate(title=f"Gift {n}"), owner.id)
+        for n in range(ITEMS)
+    ]
+    return [item.id for item in items], [user.id for user in bookers]
+
+
+def test_one_winner_per_item(writer, sessions):
+    item_ids, booker_ids = writer.run(seed)
+    attempts = [(item_id, user_id) for user_id in booker_ids for item_id in item_ids]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        # Each thread plays a request handler calling run_write
+        results = list(pool.map(
+            lambda attempt: writer.run(crud.create_booking, item_id=attempt[0], user_id=attempt[1]),
+            attempts,
+        ))
+    elapsed = time.perf_counter() - started
+
+    winners = [booking for booking in results if booking is not None]
+    print(f"\n{len(attempts)} booking attempts ({BOOKERS_PER_ITEM} per item) in {elapsed:.2f}s "
+          f"({len(attempts) / elapsed:.0f} attempts/s), {len(winners)} winners")
+
+    assert len(winners) == ITEMS
+    assert sorted(booking.item_id for booking in winners) == sorted(item_ids)
+    db = sessions()
+    try:
+        per_item = db.query(models.Booking.item_id, func.count()).group_by(models.Booking.item_id).all()
+        assert all(count == 1 for _, count in per_item)
+        assert len(per_item) == ITEMS
+        statuses = {item.status for item in db.query(models.Item).filter(models.Item.id.in_(item_ids))}
+        assert statuses == {models.StatusEnum.booked}
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
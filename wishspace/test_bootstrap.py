@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Bootstrap: the Mini App launch payload costs the same number of queries
+however many events and collaborators there are, and serializes.
+
+Usage: python -m pytest test_bootstrap.py  (or python test_bootstrap.py)
+"""
+
+from datetime import datetime
+
+from conftest import migrated_engine, writer_sessions
+from sqlalchemy import event
+
+import crud, schemas
+from database import SingleWriter
+
+
+def seed(db, events):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner", phone="+10000000001"))
+    friend = crud.create_user(db, schemas.UserCreate(telegram_id=2, name="Friend", phone="+10000000002"))
+    crud.add_friend(db, owner.id, friend.phone)
+    for n in range(events):
+        item = crud.create_item(db, schemas.ItemCreate(title=f"Gift {n}", price=n), owner.id)
+        db_event = crud.create_event(db, schemas.EventCreate(title=f"Party {n}", date=datetime(2030, 1, 1), is_shared=True), owner.id)
+        crud.add_item_to_event(db, db_event.id, item.id)
+        crud.add_collaborator_to_event(db, db_event.id, owner.id, friend.id)
+        theirs = crud.create_event(db, schemas.EventCreate(title=f"Their party {n}"), friend.id)
+        crud.add_collaborator_to_event(db, theirs.id, friend.id, owner.id)
+    return owner.id
+
+
+def bootstrap_queries(events):
+    engine = migrated_engine(f"bootstrap_{events}")
+    sessions = writer_sessions(engine)
+    owner_id = SingleWriter(sessions).run(seed, events)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    db = sessions()
+    try:
+        data = schemas.Bootstrap.model_validate(crud.get_bootstrap(db, owner_id))
+    finally:
+        db.close()
+    selects = [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+    return data, len(selects)
+
+
+def test_bootstrap_query_count_is_fixed():
+    small, small_queries = bootstrap_queries(1)
+    large, large_queries = bootstrap_queries(6)
+    assert small_queries == large_queries, (small_queries, large_queries)
+
+    assert large.user.name == "Owner"
+    assert len(large.items) == 6 and len(large.events) == 6
+    assert [friend.name for friend in large.friends] == ["Friend"]
+    # Own shared events and the friend's events the owner collaborates on
+    assert len(large.shared_events) == 12
+    assert all(len(e.items) == 1 and len(e.collaborators) == 1 for e in large.events)
+
+
+if __name__ == "__main__":
+    test_bootstrap_query_count_is_fixed()
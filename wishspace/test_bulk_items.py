@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Bulk item mutations: per-id results, other users' items left alone,
+counters matching a full recount, and a statement count that does not grow
+with the number of items.
+
+Usage: python -m pytest test_bulk_items.py  (or python test_bulk_items.py)
+"""
+
+import random
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import event
+
+import crud, models, schemas, stats
+
+OPERATIONS = 200
+
+
+def test_results_and_ownership(engine, db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner")).id
+    other = crud.create_user(db, schemas.UserCreate(telegram_id=2, name="Other")).id
+    mine = [crud.create_item(db, schemas.ItemCreate(title=f"Gift {n}", price=10), owner).id for n in range(3)]
+    theirs = crud.create_item(db, schemas.ItemCreate(title="Theirs"), other).id
+    party = crud.create_event(db, schemas.EventCreate(title="Party"), owner).id
+    crud.add_item_to_event(db, party, mine[0])
+
+    assert crud.bulk_add_items_to_event(db, owner, party, [mine[0], mine[1], theirs, mine[1]]) == [
+        (mine[0], "unchanged"), (mine[1], "ok"), (theirs, "not_found"),
+    ]
+    assert crud.bulk_add_items_to_event(db, other, party, [theirs]) is None
+
+    changes = schemas.ItemChanges(note="Wrap it", price=25)
+    assert crud.bulk_update_items(db, owner, [mine[0], theirs], changes) == [(mine[0], "ok"), (theirs, "not_found")]
+    assert crud.bulk_update_items(db, owner, [mine[0]], schemas.ItemChanges()) == [(mine[0], "unchanged")]
+    assert crud.bulk_move_category(db, owner, mine, "Books") == [(id, "ok") for id in mine]
+    assert crud.bulk_set_status(db, owner, [theirs], "received") == [(theirs, "not_found")]
+    assert crud.bulk_delete_items(db, owner, [mine[1], theirs]) == [(mine[1], "ok"), (theirs, "not_found")]
+    db.commit()
+    with engine.connect() as conn:
+        assert stats.check(conn) == []
+
+    lamp = db.get(models.Item, mine[0])
+    assert (lamp.note, lamp.price, lamp.category_id) == ("Wrap it", 25, crud.get_category_id(db, "Books", owner))
+    assert db.get(models.Item, theirs).note is None
+    assert db.get(models.Item, mine[1]) is None and not db.get(models.EventItem, (party, mine[1]))
+
+
+def test_counters_match_recount_after_random_bulk_changes(engine, db):
+    rng = random.Random(47)
+    users = [crud.create_user(db, schemas.UserCreate(telegram_id=n, name=f"User {n}")).id for n in range(1, 4)]
+    items = []
+    for _ in range(60):
+        user_id = rng.choice(users)
+        items.append(crud.create_item(db, schemas.ItemCreate(title="Gift", price=rng.choice([None, 10, 99.5])), user_id).id)
+    events = [crud.create_event(db, schemas.EventCreate(title="Party"), rng.choice(users)).id for _ in range(6)]
+
+    for _ in range(OPERATIONS):
+        user_id = rng.choice(users)
+        ids = rng.sample(items, min(len(items), rng.randint(1, 8)))
+        action = rng.random()
+        if action < 0.25:
+            crud.bulk_add_items_to_event(db, user_id, rng.choice(events), ids)
+        elif action < 0.4:
+            crud.create_booking(db, rng.choice(items), user_id)
+        elif action < 0.55:
+            crud.bulk_update_items(db, user_id, ids, schemas.ItemChanges(price=rng.choice([None, 5, 250])))
+        elif action < 0.7:
+            crud.bulk_move_category(db, user_id, ids, rng.choice(["Books", "Toys"]))
+        elif action < 0.85:
+            crud.bulk_set_status(db, user_id, ids, rng.choice(["favorite", "in_event", "received"]))
+        elif action < 0.95:
+            deleted = {id for id, result in crud.bulk_delete_items(db, user_id, ids) if result == "ok"}
+            items = [id for id in items if id not in deleted]
+            if not items:
+                items.append(crud.create_item(db, schemas.ItemCreate(title="Gift"), user_id).id)
+        else:
+            items.append(crud.create_item(db, schemas.ItemCreate(title="Gift", price=10), user_id).id)
+    db.commit()
+
+    with engine.connect() as conn:
+        assert stats.check(conn) == []
+
+
+def test_statement_count_does_not_grow(engine, db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner")).id
+    party = crud.create_event(db, schemas.EventCreate(title="Party"), owner).id
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def cost(n):
+        ids = [crud.create_item(db, schemas.ItemCreate(title="Gift", price=n), owner).id for n in range(n)]
+        counts = []
+        for bulk in (
+            lambda: crud.bulk_add_items_to_event(db, owner, party, ids),
+            lambda: crud.bulk_update_items(db, owner, ids, schemas.ItemChanges(price=3)),
+            lambda: crud.bulk_move_category(db, owner, ids, "Books"),
+            lambda: crud.bulk_set_status(db, owner, ids, "received"),
+            lambda: crud.bulk_delete_items(db, owner, ids),
+        ):
+            statements.clear()
+            bulk()
+            counts.append(len(statements))
+        return counts
+
+    small, large = cost(3), cost(30)
+    assert small == large
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Duplicate-link detection: canonical forms of product links, and
+re-adding a saved link returning the existing item.
+
+Usage: python -m pytest test_canonical_link.py  (or python test_canonical_link.py)
+"""
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+
+import crud, schemas
+
+SAME_PRODUCT = [
+    "https://market.yandex.ru/product--naushniki/123?sku=9&utm_source=tg&utm_medium=share",
+    "http://www.Market.Yandex.ru/product--naushniki/123/?ysclid=abc&sku=9#reviews",
+    "  https://market.yandex.ru:443/product--naushniki/123?fbclid=x&sku=9  ",
+]
+
+
+def test_canonicalize_link():
+    canonical = {crud.canonicalize_link(link) for link in SAME_PRODUCT}
+    assert canonical == {"https://market.yandex.ru/product--naushniki/123?sku=9"}
+    # Meaningful parameters are kept and sorted
+    assert crud.canonicalize_link("https://shop.example/p?b=2&a=1") == "https://shop.example/p?a=1&b=2"
+    assert crud.canonicalize_link("https://shop.example/p?id=1") != crud.canonicalize_link("https://shop.example/p?id=2")
+    assert crud.canonicalize_link(None) is None
+    assert crud.canonicalize_link("not a url") == "not a url"
+
+
+def test_readding_a_link_returns_the_existing_item(db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner"))
+    other = crud.create_user(db, schemas.UserCreate(telegram_id=2, name="Other"))
+
+    first = crud.create_item_unless_linked(db, schemas.ItemCreate(title="Headphones", link=SAME_PRODUCT[0]), owner.id)
+    for link in SAME_PRODUCT[1:]:
+        assert crud.get_item_by_link(db, owner.id, link).id == first.id
+        assert crud.create_item_unless_linked(db, schemas.ItemCreate(title="Again", link=link), owner.id).id == first.id
+    # Other users and items without a link are unaffected
+    assert crud.get_item_by_link(db, other.id, SAME_PRODUCT[0]) is None
+    assert crud.create_item_unless_linked(db, schemas.ItemCreate(title="Same", link=SAME_PRODUCT[1]), other.id).id != first.id
+    assert crud.get_item_by_link(db, owner.id, None) is None
+
+    moved = crud.set_item_category(db, first.id, "Music")
+    assert moved.category.name == "Music"
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
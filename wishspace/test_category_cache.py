@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Category cache: a known category costs no statement, users beyond
+CATEGORY_CACHE_USERS are evicted least recently used first, and an id
+resolved in a rolled-back job is never cached.
+
+Usage: python -m pytest test_category_cache.py  (or python test_category_cache.py)
+"""
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import event
+
+import crud, schemas
+
+
+def test_category_cache(engine, writer):
+    users = writer.run(lambda db: [crud.create_user(db, schemas.UserCreate(telegram_id=n, name=f"User {n}")).id for n in range(3)])
+
+    inserts = []
+    event.listen(engine, "before_cursor_execute", lambda *args: inserts.append(args[2]) if "INSERT INTO categories" in args[2] else None)
+    category = lambda user_id, name="Books": writer.run(crud.get_category_id, name, user_id)
+
+    # Resolved once by the upsert, then answered from the cache
+    books = category(users[0])
+    assert len(inserts) == 1 and "RETURNING" in inserts[0]
+    assert [category(users[0]) for _ in range(3)] == [books] * 3
+    assert len(inserts) == 1
+    assert category(users[0], "Games") != books and len(inserts) == 2
+
+    # A failing job's SAVEPOINT is rolled back: its category id is not cached
+    def doomed(db):
+        crud.get_category_id(db, "Doomed", users[1])
+        raise RuntimeError("rolled back")
+    with pytest.raises(RuntimeError):
+        writer.run(doomed)
+    assert crud.category_cache.get(users[1]) is None
+    category(users[1], "Doomed")
+    assert len(inserts) == 4
+
+    # Least recently used users go first
+    maxsize, crud.category_cache.maxsize = crud.category_cache.maxsize, 2
+    try:
+        category(users[2])
+        assert crud.category_cache.get(users[0]) is None
+        assert category(users[0]) == books and len(inserts) == 6
+        assert category(users[2]) and len(inserts) == 6
+    finally:
+        crud.category_cache.maxsize = maxsize
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""ETag versions: every change a GET response can show moves its tag, and
+unrelated changes leave it alone.
+
+Usage: python -m pytest test_etags.py  (or python test_etags.py)
+"""
+
+from datetime import datetime, timedelta
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import update
+
+import archive, crud, models, schemas
+
+
+def test_versions_follow_changes(writer, sessions):
+    owner, friend, stranger = writer.run(lambda db: [
+        crud.create_user(db, schemas.UserCreate(telegram_id=n, name=f"User {n}", phone=f"+1000000000{n}")).id
+        for n in (1, 2, 3)
+    ])
+
+    def tags():
+        db = sessions()
+        try:
+            return {
+                name: crud.get_etag(db, keys, "variant")
+                for name, keys in {
+                    "owner": [("user", owner)], "friend": [("user", friend)],
+                    "stranger": [("user", stranger)], "event": [("event", event_id)],
+                }.items()
+            }
+        finally:
+            db.close()
+
+    def changed(fn, *args, **kwargs):
+        before = tags()
+        writer.run(fn, *args, **kwargs)
+        after = tags()
+        return {name for name in before if before[name] != after[name]}
+
+    event_id = 0
+    assert changed(crud.create_item, schemas.ItemCreate(title="Lamp"), owner) == {"owner"}
+    item_id = writer.run(crud.create_item, schemas.ItemCreate(title="Book"), owner).id
+    event_id = writer.run(crud.create_event, schemas.EventCreate(title="Birthday"), owner).id
+    assert changed(crud.add_item_to_event, event_id, item_id) == {"owner", "event"}
+    assert changed(crud.add_collaborator_to_event, event_id, owner, friend) == {"owner", "friend", "event"}
+    # Lists that show a user follow their profile: collaborators' events, friends
+    assert changed(crud.update_user_phone, friend, "+10000000008") == {"owner", "friend", "event"}
+
+    # An item on a shared event reaches everyone who lists the event
+    assert changed(crud.update_item, item_id, schemas.ItemUpdate(title="Book 2")) == {"owner", "friend", "event"}
+    assert changed(crud.create_booking, item_id, stranger) == {"owner", "friend", "event"}
+    assert changed(crud.add_friend, owner, "+10000000003") == {"owner", "stranger"}
+    assert changed(crud.update_user_phone, stranger, "+10000000009") == {"owner", "stranger"}
+    assert changed(crud.remove_collaborator_from_event, event_id, owner, friend) == {"owner", "friend", "event"}
+    assert changed(crud.delete_item, item_id) == {"owner", "event"}
+    assert changed(crud.get_friends, owner) == set()
+
+    # Archiving moves rows outside crud and still bumps
+    writer.run(lambda db: db.execute(
+        update(models.Event).where(models.Event.id == event_id).values(date=datetime.now() - timedelta(days=30))
+    ))
+    assert changed(lambda db: archive.archive_events_batch(db, datetime.now(), 10)) == {"owner", "event"}
+
+    db = sessions()
+    try:
+        # Tags depend on the variant (viewer, path and query) as well
+        assert crud.get_etag(db, [("user", owner)], "a") != crud.get_etag(db, [("user", owner)], "b")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
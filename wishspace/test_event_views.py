@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Event view cache: guests share one rendered body per event, the owner
+never sees bookings, and every change to an event drops its bodies.
+
+Usage: python -m pytest test_event_views.py  (or python test_event_views.py)
+"""
+
+import json
+
+from conftest import batched
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import crud, event_views, schemas
+from database import make_engine
+
+
+def test_rendered_views_follow_changes(writer, sessions):
+    owner, friend, guest = writer.run(lambda db: [
+        crud.create_user(db, schemas.UserCreate(telegram_id=n, name=f"User {n}", phone=f"+1000000000{n}")).id
+        for n in (1, 2, 3)
+    ])
+    item_id = writer.run(crud.create_item, schemas.ItemCreate(title="Book"), owner).id
+    event_id = writer.run(crud.create_event, schemas.EventCreate(title="Birthday"), owner).id
+
+    def render(viewer_id):
+        db = sessions()
+        try:
+            generation = crud.event_view_generation()
+            return (
+                json.loads(event_views.render_event(db, event_id, viewer_id, generation)),
+                json.loads(event_views.render_user_events(db, owner, viewer_id, generation)),
+            )
+        finally:
+            db.close()
+
+    assert render(guest)[0]["items"] == []
+    writer.run(crud.add_item_to_event, event_id, item_id)
+    assert render(guest)[1][0]["items"][0]["title"] == "Book"
+
+    writer.run(crud.create_booking, item_id, guest)
+    hits = crud.event_view_cache.stats()["hits"]
+    view, events = render(friend)
+    assert view["items"][0]["is_booked"] and events[0]["items"][0]["is_booked"]
+    # Guests share the body, the owner gets their own without bookings
+    render(guest)
+    assert crud.event_view_cache.stats()["hits"] >= hits + 3
+    view, events = render(owner)
+    assert not view["items"][0]["is_booked"] and not events[0]["items"][0]["is_booked"]
+
+    writer.run(crud.update_item, item_id, schemas.ItemUpdate(title="Book 2"))
+    assert render(guest)[0]["items"][0]["title"] == "Book 2"
+    writer.run(crud.update_event, event_id, schemas.EventCreate(title="Party"))
+    assert render(guest)[1][0]["title"] == "Party"
+    writer.run(crud.add_collaborator_to_event, event_id, owner, friend)
+    assert len(render(owner)[0]["collaborators"]) == 1
+    writer.run(crud.remove_collaborator_from_event, event_id, owner, friend)
+    assert render(owner)[0]["collaborators"] == []
+    writer.run(crud.create_event, schemas.EventCreate(title="Wedding"), owner)
+    assert len(render(guest)[1]) == 2
+
+
+def test_stale_render_is_not_stored(engine, writer, sessions):
+    owner = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Owner")).id
+    event_id = writer.run(crud.create_event, schemas.EventCreate(title="Birthday"), owner).id
+    url = engine.url.render_as_string(hide_password=False)
+    readers = sessionmaker(autocommit=False, autoflush=False, bind=make_engine(url, read_only=True))
+
+    def render():
+        db = readers()
+        try:
+            return json.loads(event_views.render_event(db, event_id, owner, crud.event_view_generation()))
+        finally:
+            db.close()
+
+    assert render()["title"] == "Birthday" # also opens the read connection
+    # A render that starts after the change's SAVEPOINT is released, but
+    # before its batch commits, reads the old event and must not fill the cache
+    _, meanwhile = batched(writer, (crud.update_event, event_id, schemas.EventCreate(title="Party")),
+                           (lambda db: render(),))
+    assert meanwhile.result()["title"] == "Birthday"
+    assert crud.event_view_cache.get(("event", event_id, "owner", "full")) is None
+    assert render()["title"] == "Party"
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Fast read path: the column rows written by services.serialize give the
+same JSON as loading ORM objects and validating them through the response
+models.
+
+Usage: python -m pytest test_fast_reads.py  (or python test_fast_reads.py)
+"""
+
+import json
+from datetime import datetime
+from typing import List
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from pydantic import TypeAdapter
+
+import crud, schemas
+from services import serialize
+
+
+def seed(db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner", phone="+10000000001"))
+    friend = crud.create_user(db, schemas.UserCreate(telegram_id=2, name="Фрэнд", phone="+10000000002"))
+    crud.add_friend(db, owner.id, friend.phone)
+    book = crud.create_item(db, schemas.ItemCreate(title="Book", price=10, description="Новая"), owner.id)
+    lamp = crud.create_item(db, schemas.ItemCreate(title="Lamp", link="https://example.com/lamp"), owner.id)
+    for title, date in (("Birthday", datetime(2030, 1, 2, 3, 4, 5, 6789)), ("Someday", None)):
+        db_event = crud.create_event(db, schemas.EventCreate(title=title, date=date, is_shared=True), owner.id)
+        crud.add_item_to_event(db, db_event.id, book.id)
+        crud.add_item_to_event(db, db_event.id, lamp.id)
+    crud.add_collaborator_to_event(db, db_event.id, owner.id, friend.id)
+    crud.create_booking(db, book.id, friend.id)
+    return owner.id, friend.id
+
+
+def as_json(schema, value):
+    return json.loads(TypeAdapter(schema).dump_json(value))
+
+
+def test_rows_match_response_models(writer, sessions):
+    owner, friend = writer.run(seed)
+
+    db = sessions()
+    try:
+        fast = lambda query: json.loads(serialize.dumps(crud.rows(db, query)))
+        assert fast(crud.item_rows_query(owner)) == as_json(List[schemas.Item], crud.get_items_by_user(db, owner))
+        assert fast(crud.item_rows_query(owner, 1, 1)) == as_json(List[schemas.Item], crud.get_items_by_user(db, owner, 1, 1))
+        assert fast(crud.friend_rows_query(owner)) == as_json(List[schemas.Friend], crud.get_friends(db, owner))
+
+        for viewer in (owner, friend):
+            views = json.loads(serialize.dumps(crud.get_event_views(db, crud.user_event_ids(owner), viewer)))
+            events = [crud.get_event_with_booking_status(db, event.id, viewer) for event in crud.get_events_by_user(db, owner)]
+            assert views == as_json(List[schemas.EventView], events)
+            # Bookings are only shown to guests
+            assert any(item["is_booked"] for view in views for item in view["items"]) == (viewer == friend)
+
+        shared = crud.get_event_views(db, crud.shared_event_ids(friend), friend)
+        assert [view["title"] for view in shared] == ["Someday"]
+    finally:
+        db.close()
+
+
+def test_fallback_encoder_matches_orjson():
+    value = [{"title": "Ёлка", "price": 10.0, "date": datetime(2030, 1, 2, 3, 4, 5, 6789), "note": None, "ok": True}]
+    orjson, serialize.orjson = serialize.orjson, None
+    try:
+        fallback = serialize.dumps(value)
+    finally:
+        serialize.orjson = orjson
+    assert fallback == TypeAdapter(list).dump_json(value)
+    if orjson is not None:
+        assert serialize.dumps(value) == fallback
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Friends feed: entries reach friends only, only owners add to them, they
+follow item and event changes, page without gaps or repeats, and follow
+friendships being made and ended.
+
+Usage: python -m pytest test_feed.py  (or python test_feed.py)
+"""
+
+from datetime import datetime, timedelta
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+
+import crud, schemas
+
+
+def feed(db, user_id, limit=100):
+    return crud.rows(db, crud.feed_rows_query(user_id, limit=limit))
+
+
+def test_feed_follows_changes(db):
+    owner, friend, stranger = [
+        crud.create_user(db, schemas.UserCreate(telegram_id=n, name=f"User {n}", phone=f"+1000000000{n}")).id
+        for n in (1, 2, 3)
+    ]
+    crud.add_friend(db, owner, "+10000000002")
+
+    party = crud.create_event(db, schemas.EventCreate(title="Party", date=datetime.utcnow() + timedelta(days=3)), owner).id
+    book, lamp, mug = [crud.create_item(db, schemas.ItemCreate(title=title, price=5), owner).id for title in ("Book", "Lamp", "Mug")]
+    crud.add_item_to_event(db, party, book)
+    # Nobody adds to someone else's event, or someone else's item to their own
+    theirs = crud.create_item(db, schemas.ItemCreate(title="Theirs"), stranger).id
+    theirs_party = crud.create_event(db, schemas.EventCreate(title="Theirs"), stranger).id
+    assert crud.add_own_item_to_event(db, stranger, party, theirs) is None
+    assert crud.add_own_item_to_event(db, owner, party, theirs) is None
+    assert crud.add_own_item_to_event(db, owner, theirs_party, book) is None
+    crud.bulk_add_items_to_event(db, owner, party, [lamp, mug, book])
+    assert [(e["kind"], e["item_id"], e["title"]) for e in feed(db, friend)] == [
+        ("item", mug, "Mug"), ("item", lamp, "Lamp"), ("item", book, "Book"), ("event", None, "Party"),
+    ]
+    assert feed(db, stranger) == [] and feed(db, owner) == []
+
+    # Keyset pages: every entry once, in order
+    seen, before = [], None
+    while True:
+        entries = crud.rows(db, crud.feed_rows_query(friend, before, limit=3))
+        page = crud.feed_page(entries, 3)
+        seen += [entry["id"] for entry in page["entries"]]
+        before = page["next_before"]
+        if before is None:
+            break
+    assert seen == [entry["id"] for entry in feed(db, friend)]
+
+    crud.update_item(db, book, schemas.ItemUpdate(title="Book 2", price=7))
+    crud.bulk_update_items(db, owner, [lamp], schemas.ItemChanges(title="Lamp 2"))
+    crud.bulk_delete_items(db, owner, [mug])
+    assert [(e["title"], e["price"]) for e in feed(db, friend) if e["kind"] == "item"] == [("Lamp 2", 5), ("Book 2", 7)]
+
+    # An event that is over leaves the feed, its items stay
+    crud.update_event(db, party, schemas.EventCreate(title="Party", date=datetime.utcnow() - timedelta(days=3)))
+    assert [e["kind"] for e in feed(db, friend)] == ["item", "item"]
+    assert {e["date"] for e in feed(db, friend)} == {crud.get_event(db, party).date}
+
+    # A new friend gets the latest activities, an ended friendship takes them away
+    crud.add_friend(db, stranger, "+10000000001")
+    assert len(feed(db, stranger)) == 2
+    crud.delete_friend(db, owner, friend)
+    assert feed(db, friend) == []
+    crud.delete_event(db, party)
+    assert feed(db, stranger) == []
+    db.commit()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
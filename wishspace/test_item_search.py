@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Item search: matching, ranking and scopes on a small fixture, then the
+latency of `crud.search_items` over 100k items.
+
+Usage: python -m pytest -s test_item_search.py  (or python test_item_search.py)
+"""
+
+import time
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import insert
+
+import crud, models, schemas
+
+BULK_ITEMS = 100_000
+BULK_USERS = 1_000
+WORDS = ["книга", "лампа", "наушники", "кружка", "рюкзак", "book", "lamp", "headphones", "mug", "bag"]
+
+
+def titles(items):
+    return [item.title for item in items]
+
+
+def test_search_matching_and_scopes(db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner"))
+    friend = crud.create_user(db, schemas.UserCreate(telegram_id=2, name="Friend"))
+    stranger = crud.create_user(db, schemas.UserCreate(telegram_id=3, name="Stranger"))
+
+    crud.create_item(db, schemas.ItemCreate(title="Ёлочная игрушка", category_name="Праздник"), owner.id)
+    crud.create_item(db, schemas.ItemCreate(title="Кружка", description="Для игрушек не подходит"), owner.id)
+    lamp = crud.create_item(db, schemas.ItemCreate(title="Lamp", note="warm light"), owner.id)
+    crud.create_item(db, schemas.ItemCreate(title="Игрушка чужая"), stranger.id)
+    gift = crud.create_item(db, schemas.ItemCreate(title="Игрушка для друга"), friend.id)
+    hidden = crud.create_item(db, schemas.ItemCreate(title="Игрушка без события"), friend.id)
+    event = crud.create_event(db, schemas.EventCreate(title="Birthday"), friend.id)
+    crud.add_item_to_event(db, event.id, gift.id)
+    db.execute(insert(models.Friend).values(user_id=owner.id, friend_id=friend.id))
+
+    # Prefix, case and ё folding; the title match ranks above the description match
+    assert titles(crud.search_items(db, owner.id, "ИГРУ")) == ["Ёлочная игрушка", "Кружка"]
+    assert titles(crud.search_items(db, owner.id, "елочн")) == ["Ёлочная игрушка"]
+    assert titles(crud.search_items(db, owner.id, "праздн")) == ["Ёлочная игрушка"]
+    assert titles(crud.search_items(db, owner.id, "warm")) == ["Lamp"]
+    # All words must match; FTS syntax in the input is treated as words
+    assert titles(crud.search_items(db, owner.id, "игруш кружка")) == ["Кружка"]
+    assert titles(crud.search_items(db, owner.id, 'lamp" OR owner:*')) == []
+    assert crud.search_items(db, owner.id, "  ***  ") == []
+    # Words only match the text, never the owner token every item has
+    assert crud.search_items(db, owner.id, "u") == []
+    assert crud.search_items(db, owner.id, f"u{owner.id}") == []
+
+    # Friends scope only covers items on the friends' events
+    assert titles(crud.search_items(db, owner.id, "игрушка", scope="friends")) == ["Игрушка для друга"]
+    assert hidden.id not in [item.id for item in crud.search_items(db, owner.id, "игрушка", scope="friends")]
+
+    # Triggers keep the index in sync
+    crud.update_item(db, lamp.id, schemas.ItemUpdate(title="Торшер"))
+    assert titles(crud.search_items(db, owner.id, "торш")) == ["Торшер"]
+    assert crud.search_items(db, owner.id, "lamp") == []
+    crud.delete_item(db, lamp.id)
+    assert crud.search_items(db, owner.id, "торш") == []
+
+
+def test_search_latency_over_100k_items(db):
+    db.execute(insert(models.User), [
+        {"telegram_id": 10_000 + n, "name": f"User {n}"} for n in range(BULK_USERS)
+    ])
+    db.execute(insert(models.Item), [
+        {
+            "title": f"{WORDS[n % len(WORDS)]} {n}",
+            "description": f"{WORDS[(n * 7) % len(WORDS)]} в подарок",
+            "user_id": 1 + (n // 100) % BULK_USERS,
+        }
+        for n in range(BULK_ITEMS)
+    ])
+    db.execute(insert(models.Friend), [{"user_id": 1, "friend_id": f} for f in range(2, 52)])
+    db.execute(insert(models.Event), [{"title": f"Event {f}", "user_id": f} for f in range(2, 52)])
+    db.execute(insert(models.EventItem), [
+        {"event_id": e, "item_id": item_id}
+        for e in range(1, 51) for item_id in range(e + 1, BULK_ITEMS, BULK_USERS * 10)
+    ])
+    db.commit()
+
+    timings = {}
+    for label, query, scope in [
+        ("own, exact word", "наушники", "own"),
+        ("own, prefix", "нау", "own"),
+        ("own, two words", "book подарок", "own"),
+        ("friends' events", "кру", "friends"),
+    ]:
+        started = time.perf_counter()
+        results = crud.search_items(db, 1, query, scope=scope)
+        timings[label] = time.perf_counter() - started
+        assert results, label
+
+    print()
+    for label, elapsed in timings.items():
+        print(f"{label:>16}: {elapsed * 1000:.2f} ms over {BULK_ITEMS} items")
+    assert max(timings.values()) < 0.05
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
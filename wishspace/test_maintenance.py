@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Maintenance: orphan rows are removed, freed pages go back to the
+filesystem in small write transactions, and the online backup is a
+complete, readable copy with old backups pruned.
+
+Usage: python -m pytest test_maintenance.py  (or python test_maintenance.py)
+"""
+
+import os
+import sqlite3
+import tempfile
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import delete, insert
+
+import crud, maintenance, models, schemas
+
+ITEMS = 3000
+
+
+def seed(db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner"))
+    friend = crud.create_user(db, schemas.UserCreate(telegram_id=2, name="Friend"))
+    db.execute(insert(models.Item), [
+        {"title": f"Item {n}", "description": "x" * 500, "user_id": owner.id} for n in range(ITEMS)
+    ])
+    event = crud.create_event(db, schemas.EventCreate(title="Birthday"), owner.id)
+    crud.add_item_to_event(db, event.id, 1)
+    crud.add_item_to_event(db, event.id, 2)
+    crud.add_collaborator_to_event(db, event.id, owner.id, friend.id)
+    crud.create_booking(db, 1, friend.id)
+    # Rows removed behind the ORM's back leave orphans and free pages
+    db.execute(delete(models.Item).where(models.Item.id > 2))
+    db.execute(delete(models.Item).where(models.Item.id == 1))
+    return owner.id, event.id
+
+
+def test_maintenance_run(engine, writer, sessions):
+    if engine.dialect.name != "sqlite": # only orphan cleanup applies elsewhere
+        return
+    _, event_id = writer.run(seed)
+    backup_dir = tempfile.mkdtemp()
+    for n in range(3):
+        open(os.path.join(backup_dir, f"wishspace-2000010{n}-000000.db"), "w").close()
+
+    free_before = writer.run(lambda db: db.connection().exec_driver_sql("PRAGMA freelist_count").scalar())
+    assert free_before > 100
+    report = maintenance.run(engine, writer.run, backup_dir, full_vacuum=False)
+
+    assert report["orphans"]["deleted"] == {"event_items": 1, "bookings": 1, "event_collaborators": 0, "event_stats": 0, "refresh_tokens": 0, "activities": 0, "feed_entries": 0}
+    assert report["vacuum"]["free_pages"] >= free_before
+    assert report["vacuum"]["freed"] == report["vacuum"]["free_pages"]
+    assert maintenance.last_report is report
+
+    db = sessions()
+    try:
+        assert db.query(models.EventItem).count() == 1
+        assert db.query(models.Booking).count() == 0
+        assert db.get(models.Event, event_id) is not None
+        assert db.connection().exec_driver_sql("PRAGMA freelist_count").scalar() == 0
+    finally:
+        db.close()
+
+    backup = report["backup"]["path"]
+    names = sorted(os.listdir(backup_dir))
+    assert len(names) == 4 # three stale ones are within BACKUP_KEEP
+    assert os.path.basename(backup) == names[-1]
+    copy = sqlite3.connect(backup)
+    try:
+        assert copy.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert copy.execute("SELECT count(*) FROM items").fetchone()[0] == 1
+        assert copy.execute("SELECT count(*) FROM event_items").fetchone()[0] == 1
+    finally:
+        copy.close()
+
+    maintenance.backup(engine, backup_dir, keep=2)
+    assert len(os.listdir(backup_dir)) == 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
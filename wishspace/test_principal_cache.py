@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Principal cache: authenticated users are loaded once per TTL, and a
+committed phone change is visible on the next request, also when a
+request reloads the user while the change's writer batch is still running.
+
+Usage: python -m pytest test_principal_cache.py  (or python test_principal_cache.py)
+"""
+
+from conftest import batched
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import crud, schemas
+from auth import create_access_token, get_current_user_id
+from database import make_engine
+
+
+def test_principal_is_cached_until_the_user_changes(engine, writer, sessions):
+    user_id = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Owner")).id
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def principal():
+        db = sessions()
+        try:
+            return crud.get_principal(db, user_id)
+        finally:
+            db.close()
+
+    assert principal().phone is None
+    loads = len(statements)
+    for _ in range(5):
+        assert principal().name == "Owner"
+    assert len(statements) == loads
+
+    # A failed write does not drop the entry, a committed one does
+    def fail(db):
+        crud.update_user_phone(db, user_id, "+7 900 000-00-00")
+        raise RuntimeError("rolled back")
+    try:
+        writer.run(fail)
+    except RuntimeError:
+        pass
+    loads = len(statements)
+    assert principal().phone is None and len(statements) == loads
+
+    writer.run(crud.update_user_phone, user_id, "+7 900 000-00-00")
+    assert principal().phone == "+79000000000"
+
+    # Claims-only principal: no database at all
+    token = create_access_token({"sub": str(user_id)})
+    before = len(statements)
+    assert get_current_user_id(token) == user_id
+    assert len(statements) == before
+
+
+
+def test_reload_during_the_batch_is_not_kept(engine, writer):
+    user_id = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Owner")).id
+    url = engine.url.render_as_string(hide_password=False)
+    readers = sessionmaker(autocommit=False, autoflush=False, bind=make_engine(url, read_only=True))
+
+    def principal():
+        db = readers()
+        try:
+            return crud.get_principal(db, user_id)
+        finally:
+            db.close()
+
+    assert principal().phone is None
+    # A request in between the phone change's SAVEPOINT and its batch commit
+    # reloads the old user; the commit must still drop that entry
+    _, meanwhile = batched(writer, (crud.update_user_phone, user_id, "+7 900 000-00-00"), (lambda db: principal(),))
+    assert meanwhile.result().phone is None
+    assert principal().phone == "+79000000000"
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Sparse fieldsets: ?fields= and ?view=summary change what is queried, not
+just what is written out, and summary counts follow changes.
+
+Usage: python -m pytest test_projections.py  (or python test_projections.py)
+"""
+
+import json
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+import crud, event_views, schemas
+from services.fields import parse_fields
+
+
+def seed(db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1, name="Owner"))
+    friend = crud.create_user(db, schemas.UserCreate(telegram_id=2, name="Friend"))
+    db_event = crud.create_event(db, schemas.EventCreate(title="Birthday"), owner.id)
+    for title, price in (("Book", 10), ("Lamp", 5)):
+        item = crud.create_item(db, schemas.ItemCreate(title=title, price=price, description="Long " * 50), owner.id)
+        crud.add_item_to_event(db, db_event.id, item.id)
+    crud.add_collaborator_to_event(db, db_event.id, owner.id, friend.id)
+    crud.create_event(db, schemas.EventCreate(title="Empty"), owner.id)
+    return owner.id, friend.id, item.id
+
+
+def test_projections_shape_the_queries(engine, writer, sessions):
+    owner, friend, lamp = writer.run(seed)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    selects = lambda: sum(statement.lstrip().upper().startswith("SELECT") for statement in statements)
+
+    def views(viewer, fields):
+        statements.clear()
+        db = sessions()
+        try:
+            return crud.get_event_views(db, crud.user_event_ids(owner), viewer, fields), selects()
+        finally:
+            db.close()
+
+    summary, queries = views(friend, crud.EVENT_SUMMARY_FIELDS)
+    assert queries == 1
+    assert [(e["title"], e["item_count"], e["price_total"], e["collaborator_count"]) for e in summary] == [
+        ("Birthday", 2, 15, 1), ("Empty", 0, 0, 0),
+    ]
+    assert set(summary[0]) == set(crud.EVENT_SUMMARY_FIELDS)
+
+    titles, queries = views(friend, parse_fields("title", crud.EVENT_FIELDS))
+    assert queries == 1 and titles[0] == {"id": titles[0]["id"], "title": "Birthday"}
+    with_items, queries = views(friend, parse_fields("title,items", crud.EVENT_FIELDS))
+    assert queries == 2 and [item["title"] for item in with_items[0]["items"]] == ["Book", "Lamp"]
+    assert "collaborators" not in with_items[0]
+
+    db = sessions()
+    try:
+        items = crud.rows(db, crud.item_rows_query(owner, fields=parse_fields("price,title", crud.ITEM_FIELDS)))
+    finally:
+        db.close()
+    assert [list(item) for item in items] == [["title", "price", "id"]] * 2
+
+    # Bookings count for guests only, and cached summaries are dropped on change
+    def rendered(viewer):
+        db = sessions()
+        try:
+            body = event_views.render_user_events(db, owner, viewer, crud.event_view_generation(), crud.EVENT_SUMMARY_FIELDS)
+            return json.loads(body)[0]["booked_count"]
+        finally:
+            db.close()
+    assert rendered(friend) == 0
+    writer.run(crud.create_booking, lamp, friend)
+    assert rendered(friend) == 1 and rendered(owner) == 0
+    assert crud.event_view_cache.get(("user_events", owner, "guest", "summary")) is not None
+
+
+def test_unknown_fields_are_rejected():
+    try:
+        parse_fields("title,password", crud.ITEM_FIELDS)
+    except HTTPException as error:
+        assert error.status_code == 400 and "password" in error.detail
+    else:
+        raise AssertionError("unknown field accepted")
+    assert parse_fields(None, crud.ITEM_FIELDS) is None
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
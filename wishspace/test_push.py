@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Server push: committed changes reach the subscribers of an event as
+deltas once their writer batch commits, bookings only reach guests, and
+rolled back writes publish nothing.
+
+Usage: python -m pytest test_push.py  (or python test_push.py)
+"""
+
+import asyncio
+
+from conftest import batched
+import pytest
+
+import crud, push, schemas
+from services.pubsub import LocalBroker
+
+
+async def drain(subscription):
+    """Messages delivered so far"""
+    messages = []
+    while True:
+        message = await subscription.get(0.05)
+        if message is None:
+            return messages
+        messages.append(message)
+
+
+async def deltas_follow_changes(writer, sessions):
+    owner, friend, stranger = writer.run(lambda db: [
+        crud.create_user(db, schemas.UserCreate(telegram_id=n, name=f"User {n}", phone=f"+1000000000{n}")).id
+        for n in (1, 2, 3)
+    ])
+    writer.run(crud.add_friend, owner, "+10000000002")
+    item_id = writer.run(crud.create_item, schemas.ItemCreate(title="Book"), owner).id
+    event_id = writer.run(crud.create_event, schemas.EventCreate(title="Birthday"), owner).id
+    writer.run(crud.add_item_to_event, event_id, item_id)
+
+    db = sessions()
+    try:
+        # Friends and collaborators may subscribe, strangers may not
+        assert crud.visible_event_owners(db, [event_id], friend) == {event_id: owner}
+        assert crud.visible_event_owners(db, [event_id], stranger) == {}
+    finally:
+        db.close()
+
+    owners = {event_id: owner}
+    as_owner = crud.event_broker.subscribe(push.channels_for(owners, owner))
+    as_friend = crud.event_broker.subscribe(push.channels_for(owners, friend))
+    as_stranger = crud.event_broker.subscribe(push.channels_for({}, stranger))
+
+    writer.run(crud.create_booking, item_id, friend)
+    assert await drain(as_friend) == [{"type": "item_booked", "event_id": event_id, "item_id": item_id}]
+    assert await drain(as_owner) == [] # bookings stay hidden from the owner
+
+    writer.run(crud.update_item, item_id, schemas.ItemUpdate(title="Book 2"))
+    for subscription in (as_owner, as_friend):
+        [message] = await drain(subscription)
+        assert message["type"] == "item_updated" and message["item"]["title"] == "Book 2"
+
+    writer.run(crud.add_collaborator_to_event, event_id, owner, stranger)
+    assert [m["type"] for m in await drain(as_stranger)] == ["collaborator_added"]
+    assert [m["user_id"] for m in await drain(as_owner)] == [stranger]
+    assert [m["type"] for m in await drain(as_friend)] == ["collaborator_added"]
+
+    def fail(db):
+        crud.update_event(db, event_id, schemas.EventCreate(title="Party"))
+        raise ValueError("rolled back")
+    try:
+        writer.run(fail)
+    except ValueError:
+        pass
+    assert await drain(as_friend) == []
+
+    writer.run(crud.delete_item, item_id)
+    assert await drain(as_friend) == [{"type": "item_removed", "event_id": event_id, "item_id": item_id}]
+
+    for subscription in (as_owner, as_friend, as_stranger):
+        subscription.close()
+    assert crud.event_broker.stats()["subscriptions"] == 0
+
+
+async def deltas_wait_for_the_batch(writer, failing_writer):
+    owner = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Owner")).id
+    item_id = writer.run(crud.create_item, schemas.ItemCreate(title="Book"), owner).id
+    event_id = writer.run(crud.create_event, schemas.EventCreate(title="Birthday"), owner).id
+    writer.run(crud.add_item_to_event, event_id, item_id)
+    subscription = crud.event_broker.subscribe(push.channels_for({event_id: owner}, owner))
+    published = crud.event_broker.published
+
+    # Nothing goes out when the update's SAVEPOINT is released, only at commit
+    _, seen = batched(writer, (crud.update_item, item_id, schemas.ItemUpdate(title="Book 2")),
+                      (lambda db: crud.event_broker.published,))
+    assert seen.result() == published
+    assert [m["item"]["title"] for m in await drain(subscription)] == ["Book 2"]
+
+    # A later job that fails publishes nothing, the earlier one still does
+    def fail(db):
+        crud.update_event(db, event_id, schemas.EventCreate(title="Party"))
+        raise ValueError("rolled back")
+    batched(writer, (crud.update_item, item_id, schemas.ItemUpdate(title="Book 3")), (fail,))[0].result()
+    assert [m["type"] for m in await drain(subscription)] == ["item_updated"]
+
+    # A batch whose commit fails publishes nothing at all
+    published = crud.event_broker.published
+    futures = batched(failing_writer, (crud.update_item, item_id, schemas.ItemUpdate(title="Book 4")),
+                      (crud.update_event, event_id, schemas.EventCreate(title="Party")))
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result()
+    assert await drain(subscription) == [] and crud.event_broker.published == published
+    subscription.close()
+
+
+async def slow_subscriber_resyncs():
+    broker = LocalBroker()
+    subscription = broker.subscribe(["event:1"], maxsize=2)
+    for n in range(5):
+        broker.publish("event:1", {"type": "item_added", "n": n})
+    broker.publish("event:2", {"type": "item_added"})
+    # The backlog is replaced by a resync, the other channel is not delivered
+    messages = await drain(subscription)
+    assert messages[0] == {"type": "resync"} and len(messages) <= 2
+
+
+def test_deltas_follow_changes(writer, sessions):
+    asyncio.run(deltas_follow_changes(writer, sessions))
+
+
+def test_deltas_wait_for_the_batch(writer, failing_writer):
+    asyncio.run(deltas_wait_for_the_batch(writer, failing_writer))
+
+
+def test_slow_subscriber_resyncs():
+    asyncio.run(slow_subscriber_resyncs())
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Runs every crud query against a migrated SQLite file and checks
+`EXPLAIN QUERY PLAN` so that no query falls back to a full table scan.
+
+Usage: python -m pytest test_query_plans.py  (or python test_query_plans.py)
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import TEST_DATABASE_URL
+from sqlalchemy import event
+
+import archive, crud, reminders, schemas
+
+
+def capture_statements(engine):
+    statements = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in ("SELECT", "UPDATE", "DELETE") and not executemany:
+            statements.append((statement, parameters))
+
+    return statements
+
+
+def run_crud_queries(db):
+    owner = crud.create_user(db, schemas.UserCreate(telegram_id=1001, name="Owner", phone="+10000000001"))
+    friend = crud.create_user(db, schemas.UserCreate(telegram_id=1002, name="Friend", phone="+10000000002"))
+    crud.get_user_by_telegram_id(db, 1001)
+    crud.get_user_by_phone(db, "+10000000002")
+    crud.get_or_create_user(db, schemas.UserCreate(telegram_id=1001, name="Owner"))
+    crud.update_user_phone(db, owner.id, "+10000000003")
+    _, refresh_token = crud.rotate_refresh_token(db, crud.issue_refresh_token(db, owner.id))
+    crud.revoke_refresh_token(db, refresh_token)
+
+    item = crud.create_item(db, schemas.ItemCreate(title="Book", price=10, category_name="Books"), owner.id)
+    lamp = crud.create_item(db, schemas.ItemCreate(title="Lamp", category_name="Books"), owner.id)
+    crud.get_items_by_user(db, owner.id)
+    crud.get_item(db, item.id)
+    crud.create_item_unless_linked(db, schemas.ItemCreate(title="Mug", link="https://shop.example/mug"), owner.id)
+    crud.update_item(db, item.id, schemas.ItemUpdate(title="Book 2"))
+    crud.search_items(db, owner.id, "boo")
+
+    event_obj = crud.create_event(db, schemas.EventCreate(title="Birthday"), owner.id)
+    crud.add_item_to_event(db, event_obj.id, item.id)
+    crud.get_events_by_user(db, owner.id)
+    crud.get_event(db, event_obj.id)
+    crud.update_event(db, event_obj.id, schemas.EventCreate(title="Birthday 2"))
+    crud.get_event_with_booking_status(db, event_obj.id, friend.id)
+    crud.get_event_views(db, [event_obj.id], friend.id)
+    crud.get_event_views(db, crud.user_event_ids(owner.id), friend.id)
+    crud.get_event_views(db, crud.user_event_ids(owner.id), friend.id, crud.EVENT_SUMMARY_FIELDS)
+    crud.get_event_views(db, crud.shared_event_ids(friend.id), friend.id)
+    crud.rows(db, crud.item_rows_query(owner.id))
+    crud.rows(db, crud.friend_rows_query(owner.id))
+    crud.create_booking(db, item.id, friend.id)
+    crud.get_user_summary(db, owner.id)
+    crud.can_view_event(db, event_obj, friend.id)
+    crud.visible_event_owners(db, [event_obj.id], friend.id)
+    db.execute(crud.export_items_query(owner.id)).all()
+    db.execute(crud.export_event_items_query(event_obj.id)).all()
+    crud.import_items(db, [schemas.ItemCreate(title="Pen", link="https://shop.example/pen")], owner.id)
+    crud.bulk_add_items_to_event(db, owner.id, event_obj.id, [item.id, lamp.id])
+    crud.bulk_update_items(db, owner.id, [item.id, lamp.id], schemas.ItemChanges(price=20, link="https://shop.example/book"))
+    crud.bulk_move_category(db, owner.id, [lamp.id], "Lamps")
+    crud.bulk_set_status(db, owner.id, [item.id, lamp.id], "received")
+    crud.bulk_delete_items(db, owner.id, [lamp.id])
+
+    crud.add_friend(db, owner.id, "+10000000002")
+    crud.get_friends(db, owner.id)
+    crud.rows(db, crud.feed_rows_query(friend.id))
+    crud.rows(db, crud.feed_rows_query(friend.id, before=10, limit=5))
+    crud.add_collaborator_to_event(db, event_obj.id, owner.id, friend.id)
+    crud.get_shared_events_for_user(db, friend.id)
+    crud.get_bootstrap(db, owner.id)
+    crud.get_etag(db, [("user", owner.id), ("event", event_obj.id)], "plans")
+    crud.search_items(db, friend.id, "boo", scope="friends")
+    crud.remove_collaborator_from_event(db, event_obj.id, owner.id, friend.id)
+    crud.delete_friend(db, owner.id, friend.id)
+    crud.delete_item(db, item.id)
+    crud.delete_event(db, event_obj.id)
+
+    crud.create_item(db, schemas.ItemCreate(title="Vase"), owner.id)
+    archive.archive_items_batch(db, 10)
+    archive.archive_events_batch(db, datetime.now(), 10)
+    crud.get_archived_items(db, owner.id)
+    crud.get_archived_events(db, owner.id)
+
+    crud.create_event(db, schemas.EventCreate(title="Picnic", date=datetime.now() + timedelta(days=1)), owner.id)
+    reminders.remind_batch(db, datetime.now(), 10)
+    crud.enqueue_telegram_messages(db, "reminders", {1001: "Picnic", 1002: "Picnic"})
+    claimed = crud.claim_telegram_messages(db, 10, 60)
+    crud.settle_telegram_messages(db, sent=claimed[:1], dropped=claimed[1:], retry=[(claimed[0], datetime.now(), True)])
+
+
+def full_scans(engine, statements):
+    found = []
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            for row in rows:
+                detail = row[-1]
+                # "SCAN CONSTANT ROW", subquery scans and FTS5 MATCH lookups
+                # ("SCAN items_fts VIRTUAL TABLE") are not table scans
+                if (detail.startswith("SCAN ") and not detail.startswith(("SCAN CONSTANT", "SCAN (subquery"))
+                        and "VIRTUAL TABLE" not in detail):
+                    found.append((detail, statement))
+    return found
+
+
+@pytest.mark.skipif(bool(TEST_DATABASE_URL), reason="EXPLAIN QUERY PLAN is SQLite-specific")
+def test_crud_queries_use_indexes(engine, db):
+    statements = capture_statements(engine)
+    run_crud_queries(db)
+    db.close() # the plans are read on other connections
+    assert statements
+    scans = full_scans(engine, statements)
+    assert not scans, "\n\n".join(f"{detail}\n{statement}" for detail, statement in scans)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
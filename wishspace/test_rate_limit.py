@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Rate limits: token buckets refill over time and are kept per key, and a
+limited route answers 429 with Retry-After, per user or per client, also
+when the clients come through the same proxy.
+
+Usage: python -m pytest test_rate_limit.py  (or python test_rate_limit.py)
+"""
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+import asyncio
+import threading
+
+import limits
+from auth import create_access_token
+from services.rate_limit import Limit, MemoryBackend, parse_limit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_buckets():
+    assert parse_limit("30/minute") == Limit(0.5, 30)
+    assert parse_limit("5/10") == Limit(0.5, 5)
+    assert parse_limit("1000/hours") == Limit(1000 / 3600, 1000)
+    assert parse_limit("") is None and parse_limit("0") is None
+
+    clock = FakeClock()
+    backend = MemoryBackend(maxsize=2, clock=clock)
+    limit = Limit(rate=1, burst=3)
+    assert [backend.take("a", limit) for _ in range(4)] == [0, 0, 0, 1]
+    assert backend.take("b", limit) == 0 # other keys have their own bucket
+    clock.now = 0.5
+    assert backend.take("a", limit) == 0.5
+    clock.now = 2.5 # refilled two, never above the burst
+    assert [backend.take("a", limit) for _ in range(3)] == [0, 0, 0.5]
+    clock.now = 100
+    assert [backend.take("a", limit) for _ in range(4)] == [0, 0, 0, 1]
+
+    backend.take("c", limit) # evicts "b", the least recently used
+    assert backend.stats() == {"keys": 2, "allowed": 10, "limited": 4}
+
+
+def test_limited_routes():
+    saved = limits.backend, dict(limits.RATE_LIMITS)
+    limits.backend = MemoryBackend(clock=FakeClock())
+    limits.RATE_LIMITS.update(auth=Limit(1, 2), scrape=Limit(1 / 60, 1), reads=Limit(1, 3), mutations=None)
+    try:
+        check_limited_routes()
+    finally:
+        limits.backend, limits.RATE_LIMITS = saved[0], saved[1]
+
+
+def check_limited_routes():
+    app = FastAPI(dependencies=[Depends(limits.limit_by_method)])
+    app.post("/login", dependencies=[Depends(limits.rate_limit("auth"))])(lambda: "ok")
+    app.post("/scrape", dependencies=[Depends(limits.rate_limit("scrape"))])(lambda: "ok")
+    app.get("/items")(lambda: "ok")
+    app.post("/items")(lambda: "ok")
+    client = TestClient(app)
+    user = lambda n: {"Authorization": f"Bearer {create_access_token({'sub': str(n)})}"}
+
+    assert [client.post("/login").status_code for _ in range(3)] == [200, 200, 429]
+    assert [client.post("/scrape", headers=user(1)).status_code for _ in range(2)] == [200, 429]
+    response = client.post("/scrape", headers=user(1))
+    assert response.status_code == 429 and response.headers["Retry-After"] == "60"
+    assert client.post("/scrape", headers=user(2)).status_code == 200
+
+    # Reads per user, mutations off; no token is the route's business
+    assert [client.get("/items", headers=user(1)).status_code for _ in range(4)] == [200, 200, 200, 429]
+    assert client.get("/items", headers=user(2)).status_code == 200
+    assert all(client.get("/items").status_code == 200 for _ in range(5))
+    assert all(client.post("/items", headers=user(1)).status_code == 200 for _ in range(5))
+    # Behind nginx every caller comes from the Docker gateway: X-Forwarded-For
+    # tells them apart, but only from a trusted proxy and only the hop it added
+    proxy = TestClient(app, client=("172.18.0.1", 50000))
+    login = lambda client, forwarded: client.post("/login", headers={"X-Forwarded-For": forwarded}).status_code
+    assert [login(proxy, "203.0.113.5") for _ in range(3)] == [200, 200, 429]
+    assert [login(proxy, "198.51.100.7") for _ in range(2)] == [200, 200]
+    assert login(proxy, "10.9.9.9, 203.0.113.5") == 429 # a spoofed first hop changes nothing
+    outsider = TestClient(app, client=("192.0.2.1", 50000))
+    assert [login(outsider, f"198.51.100.{n}") for n in range(3)] == [200, 200, 429]
+
+    assert limits.stats()["limits"] == {"auth": "2 per 2s", "scrape": "1 per 60s", "mutations": None, "reads": "3 per 3s"}
+
+    # A scrape counts against the scrape group only, not the mutations as well
+    limits.RATE_LIMITS["mutations"] = Limit(1 / 60, 1)
+    assert client.post("/scrape", headers=user(3)).status_code == 200
+    assert [client.post("/items", headers=user(3)).status_code for _ in range(2)] == [200, 429]
+
+
+def test_shared_backend_is_asked_off_the_event_loop():
+    class Blocking(MemoryBackend):
+        blocking = True
+
+        def take(self, key, limit):
+            threads.append(threading.current_thread())
+            return super().take(key, limit)
+
+    saved, threads = limits.backend, []
+    limits.backend = Blocking()
+    try:
+        assert asyncio.run(limits.retry_after_async("scrape", "telegram:1")) == 0
+    finally:
+        limits.backend = saved
+    assert threads and threads[0] is not threading.main_thread()
+
+
+if __name__ == "__main__":
+    test_token_buckets()
+    test_limited_routes()
+    test_shared_backend_is_asked_off_the_event_loop()
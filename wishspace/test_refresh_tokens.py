@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Refresh tokens: rotation, reuse detection revoking the family, logout
+and expiry.
+
+Usage: python -m pytest test_refresh_tokens.py  (or python test_refresh_tokens.py)
+"""
+
+from datetime import datetime, timedelta
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import update
+
+import crud, models, schemas
+
+
+def test_rotation_and_reuse_detection(writer, sessions):
+    user_id = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Owner")).id
+    first = writer.run(crud.issue_refresh_token, user_id)
+
+    rotated_user, second = writer.run(crud.rotate_refresh_token, first)
+    assert rotated_user == user_id and second != first
+    _, third = writer.run(crud.rotate_refresh_token, second)
+
+    # Replaying an old token revokes the family, including the newest token
+    assert writer.run(crud.rotate_refresh_token, first) is None
+    assert writer.run(crud.rotate_refresh_token, third) is None
+    assert writer.run(crud.rotate_refresh_token, "garbage") is None
+
+    db = sessions()
+    try:
+        tokens = db.query(models.RefreshToken).all()
+        assert len(tokens) == 3 and all(token.revoked_at for token in tokens)
+        assert first not in {token.token_hash for token in tokens} # only hashes are stored
+    finally:
+        db.close()
+
+    # Other sessions of the same user are separate families
+    laptop = writer.run(crud.issue_refresh_token, user_id)
+    phone = writer.run(crud.issue_refresh_token, user_id)
+    assert writer.run(crud.revoke_refresh_token, laptop)
+    assert writer.run(crud.rotate_refresh_token, laptop) is None
+    assert writer.run(crud.rotate_refresh_token, phone)[0] == user_id
+
+
+def test_expired_token_is_rejected(writer):
+    user_id = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Owner")).id
+    token = writer.run(crud.issue_refresh_token, user_id)
+    writer.run(lambda db: db.execute(
+        update(models.RefreshToken).values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+    ))
+    assert writer.run(crud.rotate_refresh_token, token) is None
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
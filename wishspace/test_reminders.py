@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Event reminders: one digest per user however many friends have events,
+each event reminded about once across runs, and an outbox that paces
+sends, keeps lines queued while a message is out and handles Telegram's
+error responses.
+
+Usage: python -m pytest test_reminders.py  (or python test_reminders.py)
+"""
+
+from datetime import datetime, timedelta
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import select
+
+import crud, models, outbox, reminders, schemas
+
+
+class Response:
+    def __init__(self, status_code, body=None):
+        self.status_code, self.body = status_code, body or {}
+
+    def json(self):
+        return self.body
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def queued(engine):
+    with engine.connect() as conn:
+        return {row.chat_id: row for row in conn.execute(select(models.OutboxMessage.__table__))}
+
+
+def test_digests_are_coalesced_and_incremental(engine, writer):
+    now = datetime(2030, 5, 1, 12)
+    users = writer.run(lambda db: [
+        crud.create_user(db, schemas.UserCreate(telegram_id=100 + n, name=f"User {n}", phone=f"+1000000000{n}")).id
+        for n in range(5)
+    ])
+    reader = users[0]
+    for n in range(1, 5):
+        writer.run(crud.add_friend, reader, f"+1000000000{n}")
+
+    def event(owner, title, days):
+        return writer.run(crud.create_event, schemas.EventCreate(title=title, date=now + timedelta(days=days)), owner).id
+    for n, owner in enumerate(users[1:]):
+        event(owner, f"Birthday {n}", 1 + n * 0.5)
+    event(users[1], "Past", -1)
+    event(users[2], "Later", 10)
+    event(reader, "Own party", 2) # reaches the four friends
+
+    run = lambda when: reminders.run_once(batch_size=2, write=writer.run, now=when, deliver=False)
+    assert run(now) == 5
+    digests = queued(engine)
+    assert sorted(digests) == [100, 101, 102, 103, 104]
+    assert digests[100].text.split("\n") == [
+        "User 1: Birthday 0, 02.05 12:00", "User 2: Birthday 1, 03.05", "User 3: Birthday 2, 03.05 12:00",
+        "User 4: Birthday 3, 04.05",
+    ]
+    assert digests[101].text == "User 0: Own party, 03.05 12:00"
+
+    # Nothing new: nothing read. A later run picks up what came into range.
+    assert run(now + timedelta(hours=1)) == 0
+    event(users[3], "Picnic", 2.5)
+    assert run(now + timedelta(hours=2)) == 1
+    assert run(now + timedelta(days=8)) == 1
+    digests = queued(engine)
+    assert digests[100].text.split("\n")[-2:] == ["User 3: Picnic, 04.05", "User 2: Later, 11.05 12:00"]
+
+
+def test_outbox_delivery(engine, writer):
+    writer.run(crud.enqueue_telegram_messages, "reminders", {1: "a", 2: "b", 3: "c", 4: "d", 5: "e"})
+    clock = FakeClock()
+    sent, responses = [], {2: Response(403), 3: Response(500)}
+
+    def send(chat_id, text):
+        sent.append((clock(), chat_id, text))
+        if chat_id == 1 and len(sent) == 1:
+            # Queued while the first digest is out: must not be lost
+            writer.run(crud.enqueue_telegram_messages, "reminders", {1: "late"})
+        return responses.get(chat_id, Response(200))
+
+    counts = outbox.deliver(send, writer.run, batch_size=2, pacer=outbox.Pacer(10, clock, clock.sleep))
+    assert counts == {"sent": 4, "dropped": 1, "retried": 1}
+    assert [(chat_id, text.split("\n")[1:]) for _, chat_id, text in sent] == [
+        (1, ["a"]), (2, ["b"]), (3, ["c"]), (4, ["d"]), (5, ["e"]), (1, ["late"]),
+    ]
+    assert sent[0][2] == "Coming up for your friends:\na"
+    assert [round(at, 1) for at, _, _ in sent] == [0, 0.1, 0.2, 0.3, 0.4, 0.5]
+
+    left = queued(engine)
+    assert list(left) == [3]
+    assert left[3].attempts == 1 and left[3].next_attempt_at > datetime.utcnow()
+    writer.run(crud.enqueue_telegram_messages, "reminders", {1: "again"})
+
+    # 429: the rest of the batch waits as long as Telegram asks, without an attempt
+    responses[1] = Response(429, {"parameters": {"retry_after": 30}})
+    assert outbox.deliver(send, writer.run, pacer=outbox.Pacer(10, clock, clock.sleep))["retried"] == 1
+    assert queued(engine)[1].attempts == 0 and queued(engine)[1].next_attempt_at > datetime.utcnow() + timedelta(seconds=20)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Wishlist export/import: NDJSON and CSV round trips through a body that
+arrives in awkward chunks, and flat memory while exporting many rows.
+
+Usage: python -m pytest -s test_transfer.py  (or python test_transfer.py)
+"""
+
+import asyncio
+import json
+import tracemalloc
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy import insert
+
+import crud, models, schemas, transfer
+
+EXPORT_ROWS = 20_000
+
+
+async def chunked(data: bytes, size: int):
+    # Small chunks split lines and multi-byte characters
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def export(sessions, query, fmt):
+    return "".join(transfer.stream_export(query, fmt, session_factory=sessions))
+
+
+def test_round_trip_in_both_formats(writer, sessions):
+    owner_id, ndjson_copy_id, csv_copy_id = writer.run(lambda db: [
+        crud.create_user(db, schemas.UserCreate(telegram_id=n, name=f"User {n}")).id for n in (1, 2, 3)
+    ])
+    copy_ids = {"ndjson": ndjson_copy_id, "csv": csv_copy_id}
+    writer.run(crud.create_item, schemas.ItemCreate(
+        title="Книга «Мастер и Маргарита»", price=990, category_name="Книги",
+        description='Твёрдый переплёт, "подарочное" издание,\nвторая строка', link="https://shop.ru/book?utm_source=x",
+    ), owner_id)
+    writer.run(crud.create_item, schemas.ItemCreate(title="Lamp", note="warm"), owner_id)
+
+    for fmt, user_id in copy_ids.items():
+        body = export(sessions, crud.export_items_query(owner_id), fmt).encode()
+        report = asyncio.run(transfer.import_items(chunked(body, 7), fmt, user_id, write=writer.run))
+        assert report == {"imported": 2, "skipped": 0, "errors": []}, report
+        # Importing the same file again only skips what has a link
+        again = asyncio.run(transfer.import_items(chunked(body, 64), fmt, user_id, write=writer.run))
+        assert (again["imported"], again["skipped"]) == (1, 1)
+
+        original = [json.loads(line) for line in export(sessions, crud.export_items_query(owner_id), "ndjson").splitlines()]
+        copied = [json.loads(line) for line in export(sessions, crud.export_items_query(user_id), "ndjson").splitlines()]
+        fields = ("title", "description", "link", "price", "note", "category")
+        assert [[row[f] for f in fields] for row in copied[:2]] == [[row[f] for f in fields] for row in original], fmt
+
+
+def test_import_reports_bad_rows(writer):
+    user_id = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Owner")).id
+    body = '{"title": "Ok"}\nnot json\n{"price": 5}\n[1]\n\n{"title": "Also ok", "price": -1}\n'.encode()
+    report = asyncio.run(transfer.import_items(chunked(body, 5), "ndjson", user_id, write=writer.run))
+    assert report["imported"] == 1
+    assert [error["line"] for error in report["errors"]] == [2, 3, 4, 6]
+
+    csv_body = "title,price\nA,10\n,5\nB,abc\n".encode()
+    report = asyncio.run(transfer.import_items(chunked(csv_body, 3), "csv", user_id, write=writer.run))
+    assert report["imported"] == 1 and [error["line"] for error in report["errors"]] == [3, 4]
+
+
+def test_export_memory_stays_flat(sessions):
+    db = sessions()
+    db.execute(insert(models.User).values(telegram_id=1, name="Owner"))
+    db.execute(insert(models.Item), [
+        {"title": f"Item {n}", "description": "x" * 200, "price": n, "user_id": 1} for n in range(EXPORT_ROWS)
+    ])
+    db.commit()
+    db.close()
+
+    for fmt in ("ndjson", "csv"):
+        tracemalloc.start()
+        size = 0
+        for chunk in transfer.stream_export(crud.export_items_query(1), fmt, session_factory=sessions):
+            size += len(chunk)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"\n{fmt}: {size / 1e6:.1f} MB exported, peak {peak / 1e6:.1f} MB allocated")
+        # Bounded by the partition size, not by the export
+        assert peak < size / 4
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
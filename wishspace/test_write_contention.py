@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Concurrency stress test for the SQLite write path.
+
+Many threads create items at once (as FastAPI's threadpool does) while
+readers list items on the read-only pool. Every write must succeed and the
+write throughput is printed.
+
+Usage: python -m pytest -s test_write_contention.py  (or python test_write_contention.py)
+"""
+
+import threading
+import time
+
+import conftest # puts backend/ on sys.path when run as a script
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+import crud, models, schemas
+from database import make_engine
+
+WRITER_THREADS = 40
+WRITES_PER_THREAD = 25
+READER_THREADS = 8
+
+
+def stress(writer, read_sessions, user_id):
+    errors = []
+    stop_reading = threading.Event()
+    reads = [0]
+
+    def write_items(thread_no):
+        for n in range(WRITES_PER_THREAD):
+            item = schemas.ItemCreate(title=f"Item {thread_no}-{n}", category_name=f"Cat {n % 5}")
+            try:
+                writer.run(crud.create_item, item=item, user_id=user_id)
+            except Exception as e:
+                errors.append(e)
+
+    def read_items():
+        while not stop_reading.is_set():
+            db = read_sessions()
+            try:
+                crud.get_items_by_user(db, user_id)
+                reads[0] += 1
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close()
+            time.sleep(0.02)
+
+    readers = [threading.Thread(target=read_items) for _ in range(READER_THREADS)]
+    writers = [threading.Thread(target=write_items, args=(n,)) for n in range(WRITER_THREADS)]
+    for thread in readers:
+        thread.start()
+    started = time.perf_counter()
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop_reading.set()
+    for thread in readers:
+        thread.join()
+    return errors, elapsed, reads[0]
+
+
+def test_concurrent_writes_do_not_lock(engine, writer):
+    url = engine.url.render_as_string(hide_password=False)
+    read_sessions = sessionmaker(autocommit=False, autoflush=False, bind=make_engine(url, read_only=True))
+    user = writer.run(crud.create_user, schemas.UserCreate(telegram_id=1, name="Stress"))
+
+    errors, elapsed, reads = stress(writer, read_sessions, user.id)
+
+    total = WRITER_THREADS * WRITES_PER_THREAD
+    print(f"\n{total} writes from {WRITER_THREADS} threads in {elapsed:.2f}s "
+          f"({total / elapsed:.0f} writes/s), {reads} concurrent reads")
+    assert not errors, errors[:5]
+    db = read_sessions()
+    try:
+        assert db.query(models.Item).count() == total
+        assert db.query(models.Category).count() == 5
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))